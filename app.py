@@ -1,83 +1,645 @@
 import base64
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from mangum import Mangum  # Use Mangum for AWS Lambda
-from PIL import Image
-from io import BytesIO
-from google import genai  # Updated import
 import asyncio
+import hashlib
+import importlib
+import json
+import logging
 from typing import Dict
 import uuid
-from contextlib import asynccontextmanager
+import time
+from contextlib import asynccontextmanager, contextmanager
 
 from fastapi.middleware.cors import CORSMiddleware
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+# Selenium, google-genai, PIL and OpenCV are imported where they are first used,
+# which keeps them out of the Lambda cold start for requests that don't need them
 import os
+from driver_pool import DriverPool, DriverPoolExhausted
+from driver_supervisor import DriverSupervisor
+from browser_host import BrowserHost
+from resource_policy import ResourcePolicy, parse_patterns
+from chrome_paths import resolve_chrome_paths, running_on_lambda
+from instrumentation import (
+    REQUEST_SECONDS,
+    begin_request,
+    configure_logging,
+    end_request,
+    record_stage,
+    registry,
+    server_timing_header,
+    stage,
+    stage_listener,
+)
+from fleet_batch import QUEUED, READY, BatchHeldElsewhere, FleetBatch, FleetBatches
+from session_events import SessionEvents, format_sse
+from session_executor import SessionExecutor
+from session_manager import SessionManager, SessionLimitExceeded
+from session_store import SessionStore
+from upstream_scheduler import UpstreamBusy, UpstreamScheduler
+from driver_worker import DriverWorkerGroup
+from result_cache import ResultCache
+from plate_ocr import PlateOcr
+from http_lookup import HttpChallanSession, HttpLookupError
+from challan_parser import (
+    CAPTCHA_ERROR_XPATH,
+    NO_CHALLANS_XPATH,
+    OUTCOME_CAPTCHA_ERROR,
+    OUTCOME_NO_CHALLANS,
+    OUTCOME_TABLE,
+    OUTCOME_UNKNOWN,
+    build_submission_result,
+)
 from dotenv import load_dotenv # Import dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# --- Logging ---
+# JSON lines by default so log fields (session_id, stage, ...) can be queried
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+configure_logging(LOG_LEVEL, LOG_FORMAT)
+logger = logging.getLogger("challan")
+
 # Configure Google's Generative AI API
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "YOUR_FALLBACK_API_KEY") # Load from environment variable
 if GOOGLE_API_KEY == "YOUR_FALLBACK_API_KEY":
-    print("Warning: GOOGLE_API_KEY environment variable not set. Using fallback or relying on implicit env var detection by the library.")
+    logger.warning("GOOGLE_API_KEY environment variable not set. Using fallback or relying on implicit env var detection by the library.")
+
+# Optional "module:callable" that builds a GenAI-compatible client instead, e.g.
+# benchmarks.fake_genai:from_env for offline load tests
+OCR_CLIENT_FACTORY = os.getenv("OCR_CLIENT_FACTORY")
+
 
-# Initialize Google Generative AI client
-client = genai.Client(api_key=GOOGLE_API_KEY)
+def _create_genai_client():
+    if OCR_CLIENT_FACTORY:
+        module_name, _, factory_name = OCR_CLIENT_FACTORY.partition(":")
+        logger.warning("Using OCR client from %s instead of Gemini.", OCR_CLIENT_FACTORY)
+        return getattr(importlib.import_module(module_name), factory_name)()
+    from google import genai
+    return genai.Client(api_key=GOOGLE_API_KEY)
 
 # Target website
-CHALLAN_URL = "https://echallan.tspolice.gov.in/publicview/"
+CHALLAN_URL = os.getenv("CHALLAN_URL", "https://echallan.tspolice.gov.in/publicview/")
+
+# --- Lookup Engine ---
+# "selenium": always drive Chrome
+# "auto": plain HTTP first, Selenium only when the HTTP path fails
+# "http": plain HTTP only
+# Selenium stays the default until the HTTP path has been checked against the real
+# site; when HTTP fails at submit time the user's solved captcha is lost.
+ENGINE_AUTO = "auto"
+ENGINE_HTTP = "http"
+ENGINE_SELENIUM = "selenium"
+LOOKUP_ENGINE = os.getenv("LOOKUP_ENGINE", ENGINE_SELENIUM).lower()
+if LOOKUP_ENGINE not in (ENGINE_AUTO, ENGINE_HTTP, ENGINE_SELENIUM):
+    logger.warning("Unknown LOOKUP_ENGINE '%s', using '%s'.", LOOKUP_ENGINE, ENGINE_SELENIUM)
+    LOOKUP_ENGINE = ENGINE_SELENIUM
+HTTP_LOOKUP_TIMEOUT = float(os.getenv("HTTP_LOOKUP_TIMEOUT", "15"))
 
 # --- Session Management ---
+# Sessions idle for longer than the TTL are closed by a background reaper, and new
+# sessions are refused (503 + Retry-After) past the session or memory caps.
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "600"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "20"))
+SESSION_MAX_RSS_MB = float(os.getenv("SESSION_MAX_RSS_MB", "0"))  # 0 disables the memory check
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "30"))
+
+# --- Session Store ---
+# Each step's serializable session state (engine, cookies, form fields, vehicle
+# number, driver worker) is written here. With a shared backend (sqlite on one host,
+# redis across hosts) any API worker can serve any step; "memory" keeps sessions in
+# the worker that created them, so only a single worker can be run.
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "challan_sessions.sqlite3")
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "redis://localhost:6379/0")
+
+session_store = SessionStore(
+    backend=SESSION_STORE,
+    ttl=SESSION_IDLE_TTL,
+    path=SESSION_STORE_PATH,
+    url=SESSION_STORE_URL,
+)
+
+session_manager = SessionManager(
+    on_expire=lambda session_id: expire_session(session_id),
+    idle_ttl=SESSION_IDLE_TTL,
+    max_sessions=MAX_SESSIONS,
+    max_rss_mb=SESSION_MAX_RSS_MB,
+    reap_interval=SESSION_REAP_INTERVAL,
+    store=session_store,
+)
 # Dictionary to store active sessions with their drivers and data
-active_sessions: Dict[str, Dict] = {}
+active_sessions: Dict[str, Dict] = session_manager.sessions
+# Blocking WebDriver calls for each session run on that session's own worker thread
+session_executor = SessionExecutor()
+
+# --- Driver Workers ---
+# Comma-separated driver_worker.py addresses (host:port or unix:/path). When set,
+# browsers live in those processes and sessions drive them over a local socket;
+# otherwise this process starts its own.
+DRIVER_WORKERS = [address.strip() for address in os.getenv("DRIVER_WORKERS", "").split(",") if address.strip()]
+DRIVER_WORKER_TIMEOUT = float(os.getenv("DRIVER_WORKER_TIMEOUT", "120"))
+driver_workers = DriverWorkerGroup(DRIVER_WORKERS, timeout=DRIVER_WORKER_TIMEOUT) if DRIVER_WORKERS else None
+if session_store.shared and not DRIVER_WORKERS and LOOKUP_ENGINE != ENGINE_HTTP:
+    logger.warning("SESSION_STORE is shared but browsers run in-process; sessions that use Chrome "
+                   "can only be served by the worker that opened them. Set DRIVER_WORKERS to share them.")
+
+# --- Result Cache ---
+# Successful lookups are reused for repeat vehicle numbers; a TTL of 0 disables caching.
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "1800"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory").lower()  # "memory" or "sqlite"
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "challan_cache.sqlite3")
+
+result_cache = ResultCache(
+    ttl=RESULT_CACHE_TTL,
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    backend=RESULT_CACHE_BACKEND,
+    path=RESULT_CACHE_PATH,
+)
+
+# --- Metrics ---
+# Exported at /metrics; stage latencies go to challan_stage_seconds via stage()
+registry.gauge("challan_active_sessions", "Open lookup sessions.", lambda: len(active_sessions))
+registry.gauge("challan_driver_pool_idle", "Warm drivers waiting in the pool.", lambda: driver_pool.stats()["idle"])
+registry.gauge("challan_browser_tabs_open", "Session tabs open in shared browsers.",
+               lambda: browser_host.stats()["open_tabs"])
+DRIVER_FAILURES = registry.counter(
+    "challan_driver_failures_total", "Browser failures by kind.", labels=("kind",)
+)
+SUBMISSIONS = registry.counter(
+    "challan_submissions_total", "Challan form submissions by outcome and engine.", labels=("outcome", "engine")
+)
+OCR_REQUESTS = registry.counter("challan_ocr_requests_total", "Plate OCR requests by result.", labels=("result",))
+CAPTCHA_REFRESHES = registry.counter(
+    "challan_captcha_refreshes_total", "Captcha refreshes by method.", labels=("method",)
+)
+DRIVER_RESTARTS = registry.counter(
+    "challan_driver_restarts_total", "Dead browsers replaced mid-session, by how they were found.", labels=("reason",)
+)
+DRIVER_RECYCLES = registry.counter(
+    "challan_driver_recycles_total", "Browsers quit and replaced instead of reused, by reason.", labels=("reason",)
+)
+
+# --- Resource Policy ---
+# Drivers only wait for DOMContentLoaded and skip fonts, media and trackers; the
+# captcha itself is waited for explicitly in _load_captcha_page.
+RESOURCE_POLICY = os.getenv("RESOURCE_POLICY", "1").lower() not in ("0", "false", "no", "off")
+PAGE_LOAD_STRATEGY = os.getenv("PAGE_LOAD_STRATEGY", "eager").lower()
+RESOURCE_BLOCKED_URLS = parse_patterns(os.getenv("RESOURCE_BLOCKED_URLS"))  # None keeps the defaults
+
+resource_policy = ResourcePolicy(
+    page_load_strategy=PAGE_LOAD_STRATEGY,
+    blocked_urls=RESOURCE_BLOCKED_URLS,
+    enabled=RESOURCE_POLICY,
+)
+
+# --- Upstream Scheduling ---
+# Caps concurrent page loads and submissions to the challan site. Further requests
+# queue per client and are served round-robin; past the queue bounds (or the queue
+# timeout) they get 429 with Retry-After. Limits apply per API process.
+UPSTREAM_MAX_CONCURRENT = int(os.getenv("UPSTREAM_MAX_CONCURRENT", "4"))  # 0 disables scheduling
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", "50"))
+UPSTREAM_MAX_QUEUE_PER_CLIENT = int(os.getenv("UPSTREAM_MAX_QUEUE_PER_CLIENT", "10"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "30"))
+# Requests with this header are queued per key, the rest per client IP
+CLIENT_ID_HEADER = os.getenv("CLIENT_ID_HEADER", "X-API-Key")
+
+upstream_scheduler = UpstreamScheduler(
+    max_concurrent=UPSTREAM_MAX_CONCURRENT,
+    max_queue=UPSTREAM_MAX_QUEUE,
+    max_queue_per_client=UPSTREAM_MAX_QUEUE_PER_CLIENT,
+    queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+)
+UPSTREAM_QUEUE_SECONDS = registry.histogram(
+    "challan_upstream_queue_seconds", "Time spent waiting for an upstream slot.", labels=("kind",)
+)
+UPSTREAM_REJECTIONS = registry.counter(
+    "challan_upstream_rejected_total", "Upstream requests refused with 429, by reason.", labels=("reason",)
+)
+registry.gauge("challan_upstream_in_flight", "Requests to the challan site in flight.",
+               lambda: upstream_scheduler.in_flight)
+registry.gauge("challan_upstream_queued", "Requests waiting for an upstream slot.", lambda: upstream_scheduler.queued)
+
+
+def client_id_for(request: Request) -> str:
+    """Who a session is queued for: its API key (hashed, since it ends up in the session store) or IP."""
+    api_key = request.headers.get(CLIENT_ID_HEADER)
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+@asynccontextmanager
+async def upstream_slot(session_id: str, kind: str):
+    """Waits for an upstream slot for the session's client; a full queue becomes a 429."""
+    client_id = active_sessions.get(session_id, {}).get('client_id', 'anonymous')
+    try:
+        async with upstream_scheduler.slot(client_id) as waited:
+            UPSTREAM_QUEUE_SECONDS.observe(waited, kind=kind)
+            if waited:
+                record_stage("upstream_queue", waited)
+            yield
+    except UpstreamBusy as e:
+        UPSTREAM_REJECTIONS.inc(reason=e.reason)
+        logger.warning("Upstream request refused: %s", e, extra={"session_id": session_id, "kind": kind})
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+# --- Session Events ---
+# GET /session-events/{session_id} streams what happens to a session as server-sent
+# events. With a `Prefer: respond-async` header the lookup POSTs answer 202 at once and
+# their response body arrives on the stream as a `result` (or `failed`) event. Off by
+# default on Lambda, where API Gateway buffers responses.
+SESSION_EVENTS = os.getenv("SESSION_EVENTS", "0" if running_on_lambda() else "1").lower() not in (
+    "0", "false", "no", "off"
+)
+SESSION_EVENTS_HISTORY = int(os.getenv("SESSION_EVENTS_HISTORY", "50"))  # Events kept for late subscribers
+SESSION_EVENTS_KEEPALIVE = float(os.getenv("SESSION_EVENTS_KEEPALIVE", "15"))
+
+session_events = SessionEvents(history=SESSION_EVENTS_HISTORY, keepalive=SESSION_EVENTS_KEEPALIVE)
+# Stages that get an event of their own; the rest are sent as `stage`
+_STAGE_EVENTS = {"navigation": "page_loaded", "http_captcha": "page_loaded"}
+# Lookup steps answered with 202, still running
+_jobs = set()
+
+
+@contextmanager
+def session_progress(session_id: str):
+    """Publishes the stages recorded in the block on the session's event stream."""
+    def on_stage(name: str, seconds: float):
+        session_events.publish(session_id, _STAGE_EVENTS.get(name, "stage"),
+                               {"stage": name, "seconds": round(seconds, 3)})
+
+    with stage_listener(on_stage):
+        yield
+
+
+async def respond(request: Request, session_id: str, action: str, work) -> JSONResponse:
+    """Runs a lookup step and returns the JSON body `work()` builds.
+
+    With `Prefer: respond-async` the step runs in the background instead: the
+    client gets 202 and a job id straight away, and the body is published as the
+    job's `result` event.
+    """
+    wants_async = "respond-async" in request.headers.get("prefer", "").lower()
+    if not (SESSION_EVENTS and wants_async and session_id in session_events):
+        return JSONResponse(content=await work())
+    job = uuid.uuid4().hex[:12]
+    session_events.publish(session_id, "accepted", {"job": job, "action": action})
+    task = asyncio.create_task(_run_job(session_id, job, action, work))
+    _jobs.add(task)
+    task.add_done_callback(_jobs.discard)
+    return JSONResponse(
+        status_code=202,
+        content={"status": "accepted", "session_id": session_id, "job": job,
+                 "events": f"/session-events/{session_id}"},
+        headers={"Preference-Applied": "respond-async"},
+    )
+
+
+async def _run_job(session_id: str, job: str, action: str, work):
+    # Stages belong to this job, not to the request that was already answered
+    token = begin_request()
+    try:
+        async with session_manager.activity(session_id):
+            content = await work()
+    except HTTPException as e:
+        session_events.publish(session_id, "failed", {
+            "job": job, "action": action, "status_code": e.status_code, "detail": e.detail,
+            "retry_after": (e.headers or {}).get("Retry-After"),
+        })
+    except Exception as e:
+        logger.exception("Background %s failed", action, extra={"session_id": session_id})
+        session_events.publish(session_id, "failed", {
+            "job": job, "action": action, "status_code": 500, "detail": f"An unexpected error occurred: {e}",
+        })
+    else:
+        session_events.publish(session_id, "result", {"job": job, "action": action, "body": content})
+    finally:
+        end_request(token)
+
 
 # --- Helper Functions ---
 
 # Selenium setup needs to be adapted for Lambda environment
 # Using headless mode is essential
-def create_driver():
-    """Creates and returns a configured Chrome WebDriver for Lambda."""
+def create_driver(single_process: bool = True):
+    """Creates and returns a configured Chrome WebDriver for Lambda.
+
+    Shared browsers (BROWSER_MODE=tabs) pass single_process=False so every tab
+    gets its own renderer and one crashed page doesn't take the others down.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    # Resolved once per process: env, baked-in /opt paths, PATH, then webdriver-manager off Lambda
+    paths = resolve_chrome_paths()
+    if paths.chromedriver is None and running_on_lambda():
+        DRIVER_FAILURES.inc(kind="create")
+        raise RuntimeError("chromedriver not found; set CHROMEDRIVER_PATH or bake it into /opt/chromedriver.")
+
     chrome_options = Options()
     chrome_options.add_argument("--headless=new") # Use new headless mode
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--window-size=1920x1080")
-    chrome_options.add_argument("--single-process")
+    if single_process:
+        chrome_options.add_argument("--single-process")
     chrome_options.add_argument("--disable-infobars")
     chrome_options.add_argument("--disable-extensions")
+    resource_policy.configure(chrome_options)
     # chrome_options.add_argument("--remote-debugging-port=9222") # May or may not be needed - Removed for testing
-    # If webdriver-manager struggles in Lambda, specify the path directly
-    # Example: service = Service('/opt/chromedriver') # Path in Lambda layer
-    # Example: chrome_options.binary_location = '/opt/chrome/chrome' # Path in Lambda layer
+    if paths.chrome:
+        chrome_options.binary_location = paths.chrome
 
-    # For local testing with webdriver-manager:
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        with stage("driver_create"):
+            # Without a resolved path Selenium Manager looks for chromedriver itself
+            service = Service(paths.chromedriver) if paths.chromedriver else Service()
+            driver = webdriver.Chrome(service=service, options=chrome_options)
     except Exception as e:
-        print(f"Failed to init driver with webdriver-manager: {e}")
-        # Add fallback or specific paths for Lambda if needed
-        # For Lambda, you'll likely need a layer with ChromeDriver and Headless Chromium
-        # service = Service('/path/to/chromedriver/in/lambda')
-        # chrome_options.binary_location = '/path/to/chrome/in/lambda'
-        # driver = webdriver.Chrome(service=service, options=chrome_options)
+        DRIVER_FAILURES.inc(kind="create")
+        logger.error("Failed to init driver (chromedriver from %s): %s", paths.source, e)
         raise RuntimeError("Failed to initialize Selenium WebDriver.") from e
 
     driver.set_page_load_timeout(30) # Increase timeout slightly
+    resource_policy.apply(driver)
     return driver
 
 
+# --- Driver Supervisor ---
+# Every page step is preceded by a liveness probe. A browser that fails it, or that
+# dies during the step, is replaced and the session's page restored; browsers are
+# recycled after DRIVER_MAX_USES steps or above DRIVER_MAX_RSS_MB.
+DRIVER_PROBE_TIMEOUT = float(os.getenv("DRIVER_PROBE_TIMEOUT", "3"))  # 0 disables the probe
+DRIVER_MAX_USES = int(os.getenv("DRIVER_MAX_USES", "100"))  # 0 disables
+DRIVER_MAX_RSS_MB = float(os.getenv("DRIVER_MAX_RSS_MB", "0"))  # 0 disables
+
+driver_supervisor = DriverSupervisor(
+    probe_timeout=DRIVER_PROBE_TIMEOUT,
+    max_uses=DRIVER_MAX_USES,
+    max_rss_mb=DRIVER_MAX_RSS_MB,
+)
+
+
+def _should_recycle(driver) -> bool:
+    reason = driver_supervisor.recycle_reason(driver)
+    if reason is None:
+        return False
+    DRIVER_RECYCLES.inc(reason=reason)
+    logger.info("Recycling browser (%s, %d uses)", reason, driver_supervisor.uses(driver))
+    return True
+
+
+# --- Driver Pool ---
+# Idle drivers are started ahead of time and parked on the challan page so
+# /start-session only has to check one out instead of launching Chrome.
+DRIVER_POOL_MIN = int(os.getenv("DRIVER_POOL_MIN", "1"))
+DRIVER_POOL_MAX = int(os.getenv("DRIVER_POOL_MAX", "4"))
+DRIVER_ACQUIRE_TIMEOUT = float(os.getenv("DRIVER_ACQUIRE_TIMEOUT", "30"))
+
+driver_pool = DriverPool(
+    create_driver,
+    min_size=DRIVER_POOL_MIN,
+    max_size=DRIVER_POOL_MAX,
+    park_url=CHALLAN_URL,
+    acquire_timeout=DRIVER_ACQUIRE_TIMEOUT,
+    should_recycle=_should_recycle,
+)
+
+# --- Browser Host ---
+# BROWSER_MODE=tabs serves sessions from a few shared Chrome processes, one isolated
+# tab (browser context) per session, instead of a pooled Chrome per session.
+BROWSER_MODE_POOL = "pool"
+BROWSER_MODE_TABS = "tabs"
+BROWSER_MODE = os.getenv("BROWSER_MODE", BROWSER_MODE_POOL).lower()
+if BROWSER_MODE not in (BROWSER_MODE_POOL, BROWSER_MODE_TABS):
+    logger.warning("Unknown BROWSER_MODE '%s', using '%s'.", BROWSER_MODE, BROWSER_MODE_POOL)
+    BROWSER_MODE = BROWSER_MODE_POOL
+BROWSER_HOST_MAX_BROWSERS = int(os.getenv("BROWSER_HOST_MAX_BROWSERS", "2"))
+BROWSER_HOST_TABS_PER_BROWSER = int(os.getenv("BROWSER_HOST_TABS_PER_BROWSER", "8"))
+
+browser_host = BrowserHost(
+    lambda: create_driver(single_process=False),
+    max_browsers=BROWSER_HOST_MAX_BROWSERS,
+    tabs_per_browser=BROWSER_HOST_TABS_PER_BROWSER,
+    acquire_timeout=DRIVER_ACQUIRE_TIMEOUT,
+    on_tab_open=resource_policy.apply,
+    should_recycle=_should_recycle,
+)
+
+
+def _acquire_browser(session_id: str) -> Dict:
+    """Checks out a browser for a session; returns the session data entries that hold it."""
+    if driver_workers is not None:
+        return {"remote": driver_workers.open(session_id)}
+    if BROWSER_MODE == BROWSER_MODE_TABS:
+        return {"tab": browser_host.open_tab()}
+    return {"driver": driver_pool.acquire()}
+
+
+def _release_browser(session_data: Dict):
+    if 'remote' in session_data:
+        session_data['remote'].close()
+    elif 'tab' in session_data:
+        browser_host.close_tab(session_data['tab'])
+    elif 'driver' in session_data:
+        # Hand the driver back; the pool resets and re-parks it in the background
+        driver_pool.release(session_data['driver'])
+
+
+def _has_browser(session_data: Dict) -> bool:
+    return 'driver' in session_data or 'tab' in session_data or 'remote' in session_data
+
+
+async def run_in_browser(session_id: str, fn, *args):
+    """Runs `fn(driver, session_data, *args)` for a session on its worker thread.
+
+    Hosted sessions run in their own tab; with driver workers the step runs in
+    the worker process that holds the session's browser.
+    """
+    session_data = active_sessions[session_id]
+    if 'remote' in session_data:
+        return await session_executor.run(session_id, session_data['remote'].run, fn.__name__, session_data, *args)
+    return await session_executor.run(session_id, _run_supervised, session_id, session_data, fn, *args)
+
+
+def _call_in_browser(session_data: Dict, fn, *args):
+    if 'tab' in session_data:
+        return session_data['tab'].run(fn, *args)
+    return fn(session_data['driver'], *args)
+
+
+def _probe_browser(session_data: Dict) -> bool:
+    if 'tab' in session_data:
+        # A shared browser whose probe hung is quit before other tabs can reach it
+        return browser_host.check_tab(
+            session_data['tab'], driver_supervisor.check_before_use, driver_supervisor.probe_pending
+        )
+    return driver_supervisor.check_before_use(session_data['driver'])
+
+
+def _run_supervised(session_id: str, session_data: Dict, fn, *args):
+    """Runs a page step after a liveness probe, replacing the browser if it is dead or dies during the step."""
+    try:
+        alive = _probe_browser(session_data)
+    except Exception as e:
+        logger.warning("Liveness probe could not reach the browser: %s", e, extra={"session_id": session_id})
+        alive = False
+    if alive:
+        try:
+            return _call_in_browser(session_data, fn, session_data, *args)
+        except Exception as e:
+            if not driver_supervisor.is_crash(e):
+                raise
+            driver_supervisor.record_crash()
+            logger.warning("Browser died during %s: %s", fn.__name__, e, extra={"session_id": session_id})
+            reason = "crash"
+    else:
+        reason = "probe"
+
+    _replace_browser(session_id, session_data, reason)
+    _call_in_browser(session_data, _restore_cookies, session_data)
+    if fn is _refresh_captcha_in_page:
+        return None  # The new browser has no page to refresh in; the caller reloads it
+    if fn is _submit_challan_form:
+        # The solved captcha belonged to the page that died and can't be submitted
+        captcha_b64 = _call_in_browser(session_data, _load_captcha_page, session_data)
+        return {
+            "status": "error",
+            "message": "The browser for this lookup stopped responding and was replaced. "
+                       "Please solve the new captcha and submit again.",
+            "data": None,
+            "outcome": OUTCOME_UNKNOWN,
+            "captcha_image": captcha_b64,
+        }
+    return _call_in_browser(session_data, fn, session_data, *args)
+
+
+def _replace_browser(session_id: str, session_data: Dict, reason: str):
+    """Swaps a dead browser for a new one from the same pool or host."""
+    DRIVER_RESTARTS.inc(reason=reason)
+    if 'tab' in session_data:
+        tab = session_data.pop('tab')
+        if browser_host.browser_alive(tab, driver_supervisor.is_alive):
+            browser_host.close_tab(tab)  # Only this tab's renderer is gone
+        else:
+            # Other sessions' tabs in it are dead too; their own probes replace them
+            browser_host.discard_browser(tab)
+    elif 'driver' in session_data:
+        driver_pool.discard(session_data.pop('driver'))
+    try:
+        session_data.update(_acquire_browser(session_id))
+    except Exception:
+        driver_supervisor.record_restart(ok=False)
+        DRIVER_FAILURES.inc(kind="restart")
+        raise
+    driver_supervisor.record_restart()
+    logger.info("Replaced the session's browser (%s)", reason, extra={"session_id": session_id})
+
+
+def _restore_cookies(driver, session_data: Dict):
+    """Gives a replacement browser the session's cookies, so the site sees the same visitor."""
+    cookies = session_data.get('cookies')
+    if not cookies:
+        return
+    url = session_data.get('base_url') or CHALLAN_URL
+    try:
+        # CDP sets them without first navigating to the site's origin
+        driver.execute_cdp_cmd("Network.setCookies", {
+            "cookies": [{"name": name, "value": value, "url": url} for name, value in cookies.items()]
+        })
+    except Exception as e:
+        logger.warning("Could not restore cookies in the replacement browser: %s", e)
+
+
+# Session data that is plain JSON and worth handing to another worker; pending
+# tasks, aiohttp sessions and drivers stay local
+_SESSION_STATE_KEYS = (
+    'engine', 'cookies', 'base_url', 'hidden_fields', 'form_action', 'frame_index',
+    'vehicle_number', 'vehicle_number_input', 'client_id',
+)
+
+
+# Store calls block (sqlite, redis), so they are made on a worker thread
+async def save_session(session_id: str):
+    """Writes a session's state to a shared store so the next step can run on any worker."""
+    session_data = active_sessions.get(session_id)
+    if session_data is None or not session_store.shared:
+        return
+    state = {key: session_data[key] for key in _SESSION_STATE_KEYS if key in session_data}
+    if 'http' in session_data:
+        state['http'] = session_data['http'].state()
+    if 'remote' in session_data:
+        state['driver_worker'] = session_data['remote'].address
+    state['saved_at'] = session_data['store_synced_at'] = time.time()
+    try:
+        await asyncio.to_thread(session_store.put, session_id, state)
+    except Exception as e:
+        session_store.record_error()
+        logger.error("Could not save session state: %s", e, extra={"session_id": session_id})
+
+
+async def load_session(session_id: str) -> bool:
+    """Makes a session available to this worker, from the shared store if another worker ran its last step.
+
+    A session this worker already holds is brought up to date, since the previous
+    step may have run elsewhere. Returns False when the session doesn't exist.
+    """
+    if not session_store.shared:
+        return session_id in active_sessions
+    try:
+        state = await asyncio.to_thread(session_store.get, session_id)
+    except Exception as e:
+        session_store.record_error()
+        logger.error("Could not read session state: %s", e, extra={"session_id": session_id})
+        return session_id in active_sessions
+    if state is None:
+        if session_id in active_sessions:
+            # Ended or expired through another worker; drop what is left of it here
+            close_session_sync(session_id, release=False)
+        return False
+
+    session_data = active_sessions.get(session_id)
+    if session_data is not None and state.get('saved_at', 0) <= session_data.get('store_synced_at', 0):
+        return True  # This worker wrote the latest state itself
+    if session_data is None:
+        if 'driver_worker' in state:
+            if driver_workers is None:
+                logger.warning("Session uses a driver worker but DRIVER_WORKERS is not set here.",
+                               extra={"session_id": session_id})
+                return False
+        elif state.get('engine') != ENGINE_HTTP:
+            return False  # Its browser lives in the worker that opened it
+        session_data = {}
+        session_manager.add(session_id, session_data, adopted=True)
+        logger.info("Session picked up from the session store", extra={"session_id": session_id})
+    else:
+        # A captcha prefetched here belongs to page state another worker has since replaced
+        _cancel_captcha_prefetch(session_data)
+
+    session_data['store_synced_at'] = state.get('saved_at', 0)
+    session_data.update({key: state[key] for key in _SESSION_STATE_KEYS if key in state})
+    if 'http' in state:
+        if 'http' not in session_data:
+            session_data['http'] = HttpChallanSession(CHALLAN_URL, timeout=HTTP_LOOKUP_TIMEOUT)
+        session_data['http'].restore(state['http'])
+    elif 'http' in session_data:
+        # Another worker moved the session over to a browser
+        _close_http_session(session_data.pop('http'))
+    if 'driver_worker' in state and 'remote' not in session_data:
+        session_data['remote'] = driver_workers.browser(state['driver_worker'], session_id)
+    return True
+
+
 # --- Session Cleanup ---
 # Optional: Implement a mechanism if long-running sessions need cleanup,
 # but Lambda's ephemeral nature makes it less critical than a persistent server.
@@ -86,6 +648,57 @@ def create_driver():
 # Create FastAPI app
 app = FastAPI(title="Vehicle Challan API - Lambda")
 
+
+@app.on_event("startup")
+async def warm_driver_pool():
+    # Not called under Mangum (lifespan="off"); the pool then warms on first acquire
+    # and the reaper starts with the first session.
+    if LOOKUP_ENGINE != ENGINE_HTTP and driver_workers is None:
+        if BROWSER_MODE == BROWSER_MODE_TABS:
+            browser_host.start()
+        else:
+            driver_pool.start()
+    session_manager.start_reaper()
+
+
+@app.on_event("shutdown")
+async def shutdown_driver_pool():
+    for task in list(_jobs):
+        task.cancel()
+    fleet_batches.shutdown()
+    await session_manager.stop_reaper()
+    session_manager.close_all()
+    session_executor.shutdown()
+    driver_pool.shutdown()
+    browser_host.shutdown()
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Times every request and reports its stages in a Server-Timing header."""
+    token = begin_request()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        total = time.perf_counter() - started
+        stages = end_request(token)
+        endpoint = request.scope.get("endpoint")
+        # Route name rather than path, so session ids don't become label values
+        REQUEST_SECONDS.observe(total, route=getattr(endpoint, "__name__", "unmatched"),
+                                method=request.method, status=status)
+    response.headers["Server-Timing"] = server_timing_header(stages, total)
+    return response
+
+
+async def track_session_activity(session_id: str):
+    """Dependency that loads a session and keeps it from being reaped while one of its requests runs."""
+    await load_session(session_id)
+    async with session_manager.activity(session_id):
+        yield
+
 # --- Template Engine Setup ---
 templates = Jinja2Templates(directory="templates")
 
@@ -106,347 +719,880 @@ app.add_middleware(
 
 # --- Helper Functions --- (Keep existing helpers like extract_text_from_image, etc.)
 
-def extract_text_from_image(image_bytes: bytes) -> str:
+# --- Plate OCR ---
+# Uploads are downscaled before they go to the model and results are memoized by image hash
+OCR_MODEL = os.getenv("OCR_MODEL", "gemini-1.5-flash")
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "1280"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+# Send only an OpenCV crop of the plate, falling back to the full photo when needed
+OCR_LOCALIZE = os.getenv("OCR_LOCALIZE", "1").lower() not in ("0", "false", "no", "off")
+
+# The GenAI client is built on the first OCR request
+plate_ocr = PlateOcr(
+    client_factory=_create_genai_client,
+    model=OCR_MODEL,
+    max_dimension=OCR_MAX_DIMENSION,
+    jpeg_quality=OCR_JPEG_QUALITY,
+    cache_size=OCR_CACHE_SIZE,
+    localize=OCR_LOCALIZE,
+)
+
+
+async def extract_text_from_image(image_bytes: bytes) -> str:
     """Uses Google's Generative AI to extract text from an image."""
-    try:
-        # Create a temporary file and convert to PIL Image
-        image = Image.open(BytesIO(image_bytes))
-        
-        # Create the prompt
-        prompt = """
-        Extract any vehicle registration number from this image.
-        The number should be in the format of Indian vehicle registration (e.g., AB12CD3456).
-        Only provide the vehicle registration number, nothing else with out space.
-        """
-
-        # Generate content directly with the image
-        response = client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=[
-                {
-                    "parts": [
-                        {"text": prompt},
-                        {"inline_data": {
-                            "mime_type": "image/jpeg",
-                            "data": base64.b64encode(image_bytes).decode('utf-8')
-                        }}
-                    ]
-                }
-            ]
+    ocr = await plate_ocr.extract(image_bytes)
+    return ocr["text"]
+
+
+# With the eager page-load strategy driver.get() returns before images finish, so
+# the captcha <img> is polled until it has either rendered or failed
+_CAPTCHA_STATE_JS = """
+const img = document.querySelector('#captchaDivtab1 img');
+if (!img) { return document.getElementById('captchaDivtab1') ? 'loaded' : null; }
+if (!img.complete) { return null; }
+return img.naturalWidth > 0 ? 'loaded' : 'broken';
+"""
+_CAPTCHA_SRC_JS = "const img = document.querySelector('#captchaDivtab1 img'); return img ? img.src : null;"
+
+
+def _wait_for_captcha_image(driver, timeout: float = 15) -> str:
+    from selenium.webdriver.support.ui import WebDriverWait
+    return WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+        lambda d: d.execute_script(_CAPTCHA_STATE_JS)
+    )
+
+
+def _load_captcha_page(driver, session_data: Dict) -> str:
+    """Blocking part of get_captcha; runs on the session's worker thread."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    # Navigate to the challan URL
+    started = time.perf_counter()
+    driver.get(CHALLAN_URL)
+    # driver.save_screenshot("1.png")
+
+    # Wait for the page to load
+    WebDriverWait(driver, 15).until( # Slightly longer wait
+        EC.presence_of_element_located((By.TAG_NAME, "body"))
+    )
+    record_stage("navigation", time.perf_counter() - started)
+
+    # Store the cookies from Selenium session
+    selenium_cookies = driver.get_cookies()
+    session_data['cookies'] = {cookie['name']: cookie['value'] for cookie in selenium_cookies}
+
+    # Store base URL
+    session_data['base_url'] = driver.current_url
+
+    # Look for the captcha image
+    started = time.perf_counter()
+    captcha_element = WebDriverWait(driver, 15).until(
+        EC.presence_of_element_located((By.ID, "captchaDivtab1"))
+    )
+    if _wait_for_captcha_image(driver) == 'broken' and resource_policy.enabled:
+        # A blocked-URL pattern caught the captcha. The policy drops the patterns
+        # that match its URL, so only browsers blocked before this pay the reload.
+        captcha_src = driver.execute_script(_CAPTCHA_SRC_JS)
+        if captcha_src and resource_policy.allow(captcha_src):
+            resource_policy.apply(driver)
+        else:
+            logger.warning("Captcha image was blocked by the resource policy, reloading without blocking.")
+            resource_policy.unblock(driver)
+        driver.get(CHALLAN_URL)
+        captcha_element = WebDriverWait(driver, 15).until(
+            EC.presence_of_element_located((By.ID, "captchaDivtab1"))
         )
+        _wait_for_captcha_image(driver)
+        session_data['cookies'] = {cookie['name']: cookie['value'] for cookie in driver.get_cookies()}
+
+    # Take a screenshot of the captcha element
+    captcha_screenshot = captcha_element.screenshot_as_png
+    captcha_base64 = base64.b64encode(captcha_screenshot).decode('utf-8')
+    record_stage("captcha_screenshot", time.perf_counter() - started)
+
+    # Simplified frame handling - assume no frame initially
+    session_data['frame_index'] = None
+
+    # Extract form fields
+    session_data['hidden_fields'] = {}
+    hidden_inputs = driver.find_elements(By.XPATH, "//input[@type='hidden']")
+    for hidden in hidden_inputs:
+        name = hidden.get_attribute('name')
+        value = hidden.get_attribute('value')
+        if name:
+            session_data['hidden_fields'][name] = value if value else ""
+
+    # Get form action
+    try:
+        form_tag = driver.find_element(By.TAG_NAME, 'form') # Assuming one form relevant
+        action = form_tag.get_attribute('action')
+        if action:
+            session_data['form_action'] = action
+    except Exception:
+        session_data['form_action'] = None # Handle cases where form/action isn't found
+
+    return captcha_base64
+
+
+async def _load_captcha_http(session_data: Dict) -> str:
+    """Fetches the captcha over plain HTTP and records the same form state as the Selenium path."""
+    http_session: HttpChallanSession = session_data['http']
+    with stage("http_captcha"):
+        captcha_image = await http_session.load_captcha()
+    session_data['cookies'] = http_session.cookies
+    session_data['base_url'] = http_session.base_url
+    session_data['hidden_fields'] = dict(http_session.hidden_fields)
+    session_data['form_action'] = http_session.form_action
+    session_data['frame_index'] = None
+    return base64.b64encode(captcha_image).decode('utf-8')
+
+
+async def _fallback_to_selenium(session_id: str):
+    """Switches a session from the HTTP engine to a pooled Chrome driver."""
+    session_data = active_sessions[session_id]
+    session_data['engine'] = ENGINE_SELENIUM
+    http_session = session_data.pop('http', None)
+    if http_session is not None:
+        await http_session.close()
+    if not _has_browser(session_data):
+        try:
+            session_data.update(await asyncio.to_thread(_acquire_browser, session_id))
+        except DriverPoolExhausted as e:
+            raise HTTPException(status_code=503, detail=f"All browsers are busy, try again shortly: {e}")
 
-        # Extract the text from the response
-        extracted_text = response.text.strip()
 
-        return extracted_text
-    except Exception as e:
-        print(f"Error during Google Generative AI processing: {e}")
-        # Consider more specific error handling or logging
-        return ""
+async def get_captcha(session_id: str):
+    """Loads the captcha for a session once the upstream scheduler has a slot for it."""
+    if session_id not in active_sessions:
+         raise HTTPException(status_code=404, detail="Session not found or driver not initialized")
+    with session_progress(session_id):
+        async with upstream_slot(session_id, "captcha"):
+            captcha_b64 = await _load_captcha(session_id)
+    session_events.publish(session_id, "captcha_ready", {"captcha_image": captcha_b64})
+    return captcha_b64
 
 
-async def get_captcha(session_id: str):
+async def _load_captcha(session_id: str):
     """Initializes driver, navigates to URL, and extracts captcha for a session."""
-    if session_id not in active_sessions or 'driver' not in active_sessions[session_id]:
+    if session_id not in active_sessions:
          raise HTTPException(status_code=404, detail="Session not found or driver not initialized")
 
-    driver = active_sessions[session_id]['driver']
     session_data = active_sessions[session_id]
 
+    if session_data.get('engine') == ENGINE_HTTP:
+        try:
+            return await _load_captcha_http(session_data)
+        except HttpLookupError as e:
+            if LOOKUP_ENGINE == ENGINE_HTTP:
+                logger.error("Error getting captcha over HTTP: %s", e, extra={"session_id": session_id})
+                raise HTTPException(status_code=502, detail=f"Failed to retrieve captcha: {e}")
+            logger.warning("HTTP captcha path failed, falling back to Selenium: %s", e,
+                           extra={"session_id": session_id})
+            await _fallback_to_selenium(session_id)
+
+    if not _has_browser(session_data):
+         raise HTTPException(status_code=404, detail="Session not found or driver not initialized")
+
     try:
-        # Navigate to the challan URL
-        driver.get(CHALLAN_URL)
-        # driver.save_screenshot("1.png")
+        return await run_in_browser(session_id, _load_captcha_page)
+    except Exception as e:
+        DRIVER_FAILURES.inc(kind="captcha_load")
+        logger.error("Error getting captcha: %s", e, extra={"session_id": session_id})
+        # Clean up driver on error? Depends on desired retry logic
+        # close_session_sync(session_id) # Example cleanup
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve captcha: {e}")
 
-        # Wait for the page to load
-        WebDriverWait(driver, 15).until( # Slightly longer wait
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
+
+# --- In-place Captcha Refresh ---
+# A retry only needs a new captcha image, not a new page: the refresh control is
+# clicked (or the image re-requested) inside the loaded page and only the captcha
+# is screenshotted again. A full reload is the fallback.
+CAPTCHA_REFRESH_TIMEOUT = float(os.getenv("CAPTCHA_REFRESH_TIMEOUT", "5"))
+
+# Returns the current captcha src, after clicking the page's refresh control or,
+# failing that, pointing the image at a cache-busted copy of its URL
+_CAPTCHA_REFRESH_JS = """
+const img = document.querySelector('#captchaDivtab1 img');
+if (!img) { return null; }
+const oldSrc = img.src;
+const control = document.querySelector("#refreshCaptchatab1, [id^='refreshCaptcha']");
+if (control) {
+  control.click();
+  return {old_src: oldSrc, method: 'control'};
+}
+const url = new URL(img.getAttribute('src'), location.href);
+url.searchParams.set('t', Date.now());
+img.src = url.href;
+return {old_src: oldSrc, method: 'src'};
+"""
+
+# 'loaded' once the captcha shows a different image than before, 'broken' if it failed
+_CAPTCHA_REFRESHED_JS = """
+const img = document.querySelector('#captchaDivtab1 img');
+if (!img || img.src === arguments[0] || !img.complete) { return null; }
+return img.naturalWidth > 0 ? 'loaded' : 'broken';
+"""
+
+# Hidden inputs in a single round-trip, to tell whether the form state changed
+_HIDDEN_FIELDS_JS = """
+const fields = {};
+document.querySelectorAll("input[type='hidden']").forEach(input => {
+  if (input.name) { fields[input.name] = input.value || ''; }
+});
+return fields;
+"""
+
+
+def _refresh_captcha_in_page(driver, session_data: Dict):
+    """Blocking in-place refresh; returns the new captcha as base64, or None to fall back."""
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    refresh = driver.execute_script(_CAPTCHA_REFRESH_JS)
+    if not refresh:
+        return None
+    try:
+        state = WebDriverWait(driver, CAPTCHA_REFRESH_TIMEOUT, poll_frequency=0.1).until(
+            lambda d: d.execute_script(_CAPTCHA_REFRESHED_JS, refresh['old_src'])
         )
+    except TimeoutException:
+        logger.info("Captcha did not change after refresh (%s), reloading the page.", refresh['method'])
+        return None
+    if state != 'loaded':
+        return None
 
-        # Store the cookies from Selenium session
-        selenium_cookies = driver.get_cookies()
-        session_data['cookies'] = {cookie['name']: cookie['value'] for cookie in selenium_cookies}
+    # A refresh normally leaves the form alone; only record it again if it did change
+    hidden_fields = driver.execute_script(_HIDDEN_FIELDS_JS) or {}
+    if hidden_fields != session_data.get('hidden_fields'):
+        logger.info("Hidden form fields changed after captcha refresh, updating session state.")
+        session_data['hidden_fields'] = hidden_fields
+        session_data['cookies'] = {cookie['name']: cookie['value'] for cookie in driver.get_cookies()}
 
-        # Store base URL
-        session_data['base_url'] = driver.current_url
+    captcha_element = driver.find_element(By.ID, "captchaDivtab1")
+    return base64.b64encode(captcha_element.screenshot_as_png).decode('utf-8')
 
-        # Look for the captcha image
-        captcha_element = WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.ID, "captchaDivtab1"))
+
+async def refresh_captcha_in_place(session_id: str):
+    """Returns a new captcha without reloading the page, or None when a full reload is needed."""
+    session_data = active_sessions[session_id]
+    if 'hidden_fields' not in session_data:
+        return None  # Nothing loaded yet
+
+    if session_data.get('engine') == ENGINE_HTTP:
+        http_session = session_data.get('http')
+        if http_session is None:
+            return None
+        try:
+            async with upstream_slot(session_id, "refresh"):
+                with stage("captcha_refresh"):
+                    captcha_image = await http_session.refresh_captcha()
+        except HttpLookupError as e:
+            logger.warning("In-place captcha refresh over HTTP failed: %s", e, extra={"session_id": session_id})
+            return None
+        session_data['hidden_fields'] = dict(http_session.hidden_fields)
+        session_data['form_action'] = http_session.form_action
+        return base64.b64encode(captcha_image).decode('utf-8')
+
+    if not _has_browser(session_data):
+        return None
+    try:
+        async with upstream_slot(session_id, "refresh"):
+            with stage("captcha_refresh"):
+                return await run_in_browser(session_id, _refresh_captcha_in_page)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning("In-place captcha refresh failed: %s", e, extra={"session_id": session_id})
+        return None
+
+
+# --- Submission Outcome Detection ---
+# Total time to wait after submit for any recognizable result page
+OUTCOME_TIMEOUT = float(os.getenv("OUTCOME_TIMEOUT", "20"))
+OUTCOME_POLL_INTERVAL = float(os.getenv("OUTCOME_POLL_INTERVAL", "0.2"))
+
+# Probes every outcome in a single round-trip, in the same priority order the
+# page was previously checked in. The table is only reported once no loading
+# indicator is visible so a half-rendered table isn't parsed.
+_OUTCOME_PROBE_JS = f"""
+const has = (xpath) => document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue !== null;
+if (has("{CAPTCHA_ERROR_XPATH}")) return ["{OUTCOME_CAPTCHA_ERROR}", null];
+if (has("{NO_CHALLANS_XPATH}")) return ["{OUTCOME_NO_CHALLANS}", null];
+const spinners = Array.from(document.querySelectorAll(".loading, .spinner, #loading"));
+if (spinners.some((el) => el.offsetParent !== null)) return null;
+const table = document.getElementById("rtable");
+if (table) return ["{OUTCOME_TABLE}", table.outerHTML];
+return null;
+"""
+
+
+def _wait_for_outcome(driver, timeout: float):
+    """Waits for whichever submission outcome appears first.
+
+    Returns (outcome, table_html); table_html is only set for OUTCOME_TABLE.
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    try:
+        outcome, table_html = WebDriverWait(driver, timeout, poll_frequency=OUTCOME_POLL_INTERVAL).until(
+            lambda d: d.execute_script(_OUTCOME_PROBE_JS)
         )
+        return outcome, table_html
+    except TimeoutException:
+        return OUTCOME_UNKNOWN, None
 
-        # Take a screenshot of the captcha element
-        captcha_screenshot = captcha_element.screenshot_as_png
-        captcha_base64 = base64.b64encode(captcha_screenshot).decode('utf-8')
 
-        # Simplified frame handling - assume no frame initially
-        session_data['frame_index'] = None
+def _submit_challan_form(driver, session_data: Dict, vehicle_number: str, captcha_solution: str) -> Dict:
+    """Blocking part of process_challan_submission; runs on the session's worker thread."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
 
-        # Extract form fields
-        session_data['hidden_fields'] = {}
-        hidden_inputs = driver.find_elements(By.XPATH, "//input[@type='hidden']")
-        for hidden in hidden_inputs:
-            name = hidden.get_attribute('name')
-            value = hidden.get_attribute('value')
-            if name:
-                session_data['hidden_fields'][name] = value if value else ""
+    # Store vehicle number in session data if needed later
+    session_data['vehicle_number'] = vehicle_number
 
-        # Get form action
+    # Check if in frame and switch if necessary (basic check)
+    if session_data.get('frame_index') is not None:
         try:
-            form_tag = driver.find_element(By.TAG_NAME, 'form') # Assuming one form relevant
-            action = form_tag.get_attribute('action')
-            if action:
-                session_data['form_action'] = action
-        except Exception:
-            session_data['form_action'] = None # Handle cases where form/action isn't found
-
+            driver.switch_to.frame(session_data['frame_index'])
+        except Exception as e:
+            logger.warning("Failed to switch back to frame %s: %s", session_data['frame_index'], e)
+            driver.switch_to.default_content() # Try to recover
+
+    # Fill in the vehicle registration number
+    started = time.perf_counter()
+    vehicle_input = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.ID, "REG_NO"))
+    )
+    vehicle_input.clear()
+    vehicle_input.send_keys(vehicle_number)
+
+    # Fill in the captcha solution
+    captcha_input = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.ID, "captchatab1"))
+    )
+    captcha_input.clear()
+    captcha_input.send_keys(captcha_solution)
+
+    # Submit the form
+    submit_button = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.ID, "tab1btn"))
+    )
+    driver.execute_script("arguments[0].click();", submit_button)
+    record_stage("form_fill", time.perf_counter() - started)
+
+    # One wait for every possible outcome instead of a spinner wait followed by
+    # three serial 5s probes
+    started = time.perf_counter()
+    outcome, table_html = _wait_for_outcome(driver, OUTCOME_TIMEOUT)
+    outcome_wait = time.perf_counter() - started
+    record_stage("outcome_wait", outcome_wait)
+
+    # The table's outerHTML came back with the outcome probe; it is parsed
+    # in-process instead of one chromedriver round-trip per cell
+    with stage("table_parse"):
+        results = build_submission_result(outcome, vehicle_number, table_html)
+    results["timing"] = {
+        "outcome_wait": round(outcome_wait, 3),
+        "outcome_timeout": OUTCOME_TIMEOUT,
+    }
+    return results
+
+
+async def _submit_challan_http(session_id: str, vehicle_number: str, captcha_solution: str) -> Dict:
+    """Submits over plain HTTP; on failure moves the session to Selenium for the next attempt."""
+    session_data = active_sessions[session_id]
+    session_data['vehicle_number'] = vehicle_number
 
-        return captcha_base64
-    except Exception as e:
-        print(f"Error getting captcha for session {session_id}: {e}")
-        # Clean up driver on error? Depends on desired retry logic
-        # close_session_sync(session_id) # Example cleanup
-        raise HTTPException(status_code=500, detail=f"Failed to retrieve captcha: {e}")
+    try:
+        with stage("http_submit"):
+            results = await session_data['http'].submit(vehicle_number, captcha_solution)
+        if results["outcome"] != OUTCOME_UNKNOWN:
+            results["engine"] = ENGINE_HTTP
+            return results
+        failure = "unrecognized result page"
+    except HttpLookupError as e:
+        failure = str(e)
+
+    logger.warning("HTTP submission failed: %s", failure, extra={"session_id": session_id})
+    if LOOKUP_ENGINE == ENGINE_HTTP:
+        raise HTTPException(status_code=502, detail=f"Failed during challan submission: {failure}")
+
+    # The captcha the user solved belongs to the HTTP session and can't be
+    # replayed in a browser, so the next captcha has to come from Selenium.
+    await _fallback_to_selenium(session_id)
+    return {
+        "status": "error",
+        "message": "Lookup could not be completed. Please refresh the captcha and try again.",
+        "data": None,
+        "outcome": OUTCOME_UNKNOWN,
+        "engine": ENGINE_SELENIUM,
+    }
 
 
 async def process_challan_submission(session_id: str, vehicle_number: str, captcha_solution: str):
+    """Submits the form for a session once the upstream scheduler has a slot for it."""
+    if session_id not in active_sessions:
+         raise HTTPException(status_code=404, detail="Session not found or driver not initialized")
+    with session_progress(session_id):
+        async with upstream_slot(session_id, "submit"):
+            session_events.publish(session_id, "submitted", {"vehicle_number": vehicle_number})
+            results = await _submit_challan(session_id, vehicle_number, captcha_solution)
+    session_events.publish(session_id, "outcome", {
+        key: results.get(key) for key in ("outcome", "status", "message", "engine")
+    })
+    challans = (results.get("data") or {}).get("challans") or []
+    for index, challan in enumerate(challans):
+        session_events.publish(session_id, "challan_row", {"index": index, "total": len(challans), "challan": challan})
+    if results.get("captcha_image"):
+        session_events.publish(session_id, "captcha_ready", {"captcha_image": results["captcha_image"]})
+    return results
+
+
+async def _submit_challan(session_id: str, vehicle_number: str, captcha_solution: str):
     """Process challan submission and extract results for a session."""
-    if session_id not in active_sessions or 'driver' not in active_sessions[session_id]:
+    if session_id not in active_sessions:
          raise HTTPException(status_code=404, detail="Session not found or driver not initialized")
 
-    driver = active_sessions[session_id]['driver']
     session_data = active_sessions[session_id]
+    if session_data.get('engine') == ENGINE_HTTP:
+        return await _submit_challan_http(session_id, vehicle_number, captcha_solution)
+
+    if not _has_browser(session_data):
+         raise HTTPException(status_code=404, detail="Session not found or driver not initialized")
 
     try:
-        # Store vehicle number in session data if needed later
-        session_data['vehicle_number'] = vehicle_number
+        results = await run_in_browser(session_id, _submit_challan_form, vehicle_number, captcha_solution)
+        results["engine"] = ENGINE_SELENIUM
+        return results
+    except Exception as e:
+        DRIVER_FAILURES.inc(kind="submit")
+        logger.error("Error processing challan submission: %s", e, extra={"session_id": session_id})
+        raise HTTPException(status_code=500, detail=f"Failed during challan submission: {e}")
 
-        # Check if in frame and switch if necessary (basic check)
-        if session_data.get('frame_index') is not None:
-            try:
-                driver.switch_to.frame(session_data['frame_index'])
-            except Exception as e:
-                print(f"Warning: Failed to switch back to frame {session_data['frame_index']}: {e}")
-                driver.switch_to.default_content() # Try to recover
 
-        # Fill in the vehicle registration number
-        vehicle_input = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "REG_NO"))
-        )
-        vehicle_input.clear()
-        vehicle_input.send_keys(vehicle_number)
+def _close_http_session(http_session: HttpChallanSession):
+    try:
+        asyncio.get_running_loop().create_task(http_session.close())
+    except RuntimeError:
+        # Called from a sync context without a running loop
+        try:
+            asyncio.run(http_session.close())
+        except Exception as e:
+            logger.warning("Error closing HTTP session: %s", e)
 
-        # Fill in the captcha solution
-        captcha_input = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "captchatab1"))
-        )
-        captcha_input.clear()
-        captcha_input.send_keys(captcha_solution)
 
-        # Submit the form
-        submit_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "tab1btn"))
-        )
-        driver.execute_script("arguments[0].click();", submit_button)
+# --- Captcha Prefetch ---
+# The captcha page doesn't depend on the vehicle number, so it is loaded while OCR
+# runs, unless the plate is already known to have a cached result. CAPTCHA_PREFETCH
+# also loads it speculatively as soon as the session starts. That costs a page load
+# for every lookup the cache answers, so it is off by default.
+CAPTCHA_PREFETCH = os.getenv("CAPTCHA_PREFETCH", "0").lower() not in ("0", "false", "no", "off")
+# Prefetched captchas older than this are reloaded rather than shown
+CAPTCHA_PREFETCH_MAX_AGE = float(os.getenv("CAPTCHA_PREFETCH_MAX_AGE", "120"))
 
-        # Wait for any loading indicators to disappear
-        try:
-            WebDriverWait(driver, 10).until_not(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".loading, .spinner, #loading"))
-            )
-        except:
-            pass
 
-        results = {"status": "unknown", "message": "", "data": None}
+async def _load_captcha_timed(session_id: str):
+    """Returns (captcha_b64, load_seconds, loaded_at)."""
+    started = time.perf_counter()
+    captcha_b64 = await get_captcha(session_id)
+    return captcha_b64, time.perf_counter() - started, time.monotonic()
 
-        # First check for captcha error
-        try:
-            error_element_captcha = WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Please Enter Correct Captcha')]"))
-            )
-            results["status"] = "error"
-            results["message"] = "Invalid captcha entered. Please try again."
-            return results
-        except:
-            pass  # No captcha error, continue
 
-        # Then check for no pending challans
-        try:
-            no_challan_text = WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'No Pending') and contains(text(), 'Challans')]"))
-            )
-            results["status"] = "success"
-            results["message"] = "No pending challans found for this vehicle."
-            results["data"] = {
-                "vehicle_info": {"vehicle_number": vehicle_number},
-                "challans": []
-            }
-            return results
-        except:
-            pass  # No "No Pending Challans" message, continue to check for challan table
+def _start_captcha_prefetch(session_id: str):
+    """Starts loading the captcha in the background unless a load is already pending."""
+    session_data = active_sessions[session_id]
+    if session_data.get('captcha_task') is None:
+        session_data['captcha_task'] = asyncio.create_task(_load_captcha_timed(session_id))
+
+
+def _cancel_captcha_prefetch(session_data: Dict):
+    task = session_data.pop('captcha_task', None)
+    if task is not None and not task.done():
+        task.cancel()
+
 
-        # Finally check for challan table
+async def _take_captcha(session_id: str):
+    """Returns (captcha_b64, load_seconds, prefetched), using a pending prefetch when it's still fresh."""
+    task = active_sessions[session_id].pop('captcha_task', None)
+    if task is not None:
         try:
-            table = WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.ID, "rtable"))
-            )
-            
-            # Extract vehicle info from the first row
-            vehicle_info = {}
-            try:
-                vehicle_rows = table.find_elements(By.XPATH, ".//tr[position()=1]")
-                if vehicle_rows:
-                    vehicle_row = vehicle_rows[0]
-                    vehicle_info = {
-                        "vehicle_number": vehicle_row.find_element(By.XPATH, ".//div[contains(text(), 'TS')]").text.strip(),
-                        "owner_name": vehicle_row.find_element(By.XPATH, ".//div[contains(text(), 'CHITKULA') or contains(text(), 'REDDY')]").text.strip()
-                    }
-            except Exception as e:
-                print(f"Warning: Could not extract vehicle/owner info: {e}")
-                vehicle_info = {"vehicle_number": vehicle_number}
-
-            # Find all challan rows
-            rows = table.find_elements(By.XPATH, ".//tr[.//input[@type='checkbox' and @id='manualErr']]")
-            challans = []
-            
-            for row in rows:
-                try:
-                    cells = row.find_elements(By.TAG_NAME, "td")
-                    if len(cells) >= 16:
-                        violation_cell = cells[8]
-                        violation_table = violation_cell.find_element(By.TAG_NAME, "table")
-                        violation_text = violation_table.find_element(By.XPATH, ".//td[1]").text.strip()
-                        
-                        challan = {
-                            "sno": cells[0].text.strip(),
-                            "unit_name": cells[2].text.strip(),
-                            "echallan_no": cells[3].text.strip(),
-                            "date": cells[4].text.strip(),
-                            "time": cells[5].text.strip(),
-                            "place": cells[6].find_element(By.XPATH, ".//div").text.strip(),
-                            "ps_limits": cells[7].find_element(By.XPATH, ".//div").text.strip(),
-                            "violation": violation_text,
-                            "fine_amount": cells[12].text.strip(),
-                            "user_charges": cells[13].text.strip(),
-                            "total_fine": cells[14].text.strip(),
-                            "has_image": "Click For Image" in cells[15].text
-                        }
-                        challans.append(challan)
-                except Exception as row_error:
-                    print(f"Error processing row: {row_error}")
-                    continue
-
-            # Extract grand total
-            try:
-                total_row = table.find_element(By.XPATH, ".//tr[.//strong[contains(text(), 'Grand Total')]]")
-                total_cells = total_row.find_elements(By.TAG_NAME, "td")
-                grand_total = {
-                    "fine_amount": total_cells[-4].text.strip(),
-                    "user_charges": total_cells[-3].text.strip(),
-                    "total_fine": total_cells[-2].text.strip()
-                }
-            except Exception as total_error:
-                print(f"Error extracting grand total: {total_error}")
-                grand_total = None
-
-            results["status"] = "success"
-            results["message"] = "Challans found."
-            results["data"] = {
-                "vehicle_info": vehicle_info,
-                "challans": challans,
-                "grand_total": grand_total
-            }
-            return results
+            captcha_b64, load_seconds, loaded_at = await task
+            if time.monotonic() - loaded_at <= CAPTCHA_PREFETCH_MAX_AGE:
+                return captcha_b64, load_seconds, True
+            logger.info("Prefetched captcha is stale, reloading.", extra={"session_id": session_id})
+        except (HTTPException, asyncio.CancelledError) as e:
+            logger.warning("Captcha prefetch failed, reloading: %s", e, extra={"session_id": session_id})
+    captcha_b64, load_seconds, _ = await _load_captcha_timed(session_id)
+    return captcha_b64, load_seconds, False
+
+
+def _off_loop(fn, *args):
+    """Runs a blocking call on a worker thread when called on the event loop, inline otherwise."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        fn(*args)
+        return
+    loop.run_in_executor(None, fn, *args)
 
-        except Exception as table_error:
-            print(f"Error finding or processing challan table: {table_error}")
-            # If we get here, we couldn't find any of the expected elements
-            results["status"] = "error"
-            results["message"] = "Could not determine challan status. Please try again."
-            return results
 
+def _delete_session_state(session_id: str):
+    try:
+        session_store.delete(session_id)
     except Exception as e:
-        print(f"Error processing challan submission for session {session_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed during challan submission: {e}")
+        session_store.record_error()
+        logger.error("Could not delete session state: %s", e, extra={"session_id": session_id})
+
+
+async def close_session(session_id: str, release: bool = True):
+    """close_session_sync for endpoints: returns once the stored state is gone too."""
+    closed = _close_local_session(session_id, release)
+    if release and session_store.shared:
+        await asyncio.to_thread(_delete_session_state, session_id)
+    return closed
 
 
 # --- Synchronous close helper (can be called from sync contexts if needed) ---
-def close_session_sync(session_id: str):
-    if session_id in active_sessions:
-        print(f"Closing session: {session_id}")
-        session_info = active_sessions.pop(session_id)
-        if 'driver' in session_info:
+def close_session_sync(session_id: str, release: bool = True):
+    """Closes a session. With release=False only this worker's copy is dropped; the stored
+    state and a driver worker's browser stay in place for the workers still using them.
+
+    On the event loop the stored state is deleted in the background.
+    """
+    closed = _close_local_session(session_id, release)
+    if release and session_store.shared:
+        _off_loop(_delete_session_state, session_id)
+    return closed
+
+
+def _close_local_session(session_id: str, release: bool) -> bool:
+    session_info = session_manager.remove(session_id)
+    session_events.close(session_id)
+    if session_info is not None:
+        logger.info("Closing session", extra={"session_id": session_id, "release": release})
+        _cancel_captcha_prefetch(session_info)
+        if 'http' in session_info:
+            _close_http_session(session_info['http'])
+        def release_browser():
             try:
-                session_info['driver'].quit()
+                _release_browser(session_info)
             except Exception as e:
-                print(f"Error closing driver for session {session_id}: {e}")
+                logger.error("Error releasing driver: %s", e, extra={"session_id": session_id})
+
+        # A browser in this process can't be used from anywhere else, so it always goes back
+        keep_browser = not _has_browser(session_info) or (not release and 'remote' in session_info)
+        # Release only after any WebDriver call still running for this session has finished
+        session_executor.close(session_id, None if keep_browser else release_browser)
         return True
     return False
 
+
+def expire_session(session_id: str):
+    """Reaper callback; a session another worker has used within the TTL only loses this worker's copy."""
+    if not session_store.shared:
+        close_session_sync(session_id)
+        return
+    session_info = active_sessions.get(session_id)
+    close_session_sync(session_id, release=False)
+    if session_info is not None and 'remote' in session_info:
+        # The driver worker's browser goes too unless the session is still in the store
+        _off_loop(_release_remote_if_ended, session_id, session_info['remote'])
+
+
+def _release_remote_if_ended(session_id: str, remote):
+    try:
+        live = session_store.get(session_id) is not None
+    except Exception:
+        live = False
+    if not live:
+        try:
+            remote.close()
+        except Exception as e:
+            logger.error("Error releasing driver: %s", e, extra={"session_id": session_id})
+
+# --- Fleet Batches ---
+# POST /batches takes a list of registration numbers. A few sessions at a time load
+# their captcha ahead of the operator, solved captchas are submitted from a queue in
+# the background, and results are collected as NDJSON. Batch state is written to its
+# own store (sqlite by default, opened on the first /batches request) so a batch can
+# be resumed after a restart. A running batch is leased to the worker running it;
+# other workers answer 409 until the lease runs out. Off by default on Lambda, which
+# doesn't keep background work running between requests.
+FLEET_BATCHES = os.getenv("FLEET_BATCHES", "0" if running_on_lambda() else "1").lower() not in (
+    "0", "false", "no", "off"
+)
+BATCH_LOOKAHEAD = int(os.getenv("BATCH_LOOKAHEAD", "3"))  # Captchas kept loaded ahead of the operator
+BATCH_SUBMIT_CONCURRENCY = int(os.getenv("BATCH_SUBMIT_CONCURRENCY", "2"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))
+BATCH_MAX_VEHICLES = int(os.getenv("BATCH_MAX_VEHICLES", "1000"))
+BATCH_STORE = os.getenv("BATCH_STORE", "memory" if running_on_lambda() else "sqlite").lower()
+BATCH_STORE_PATH = os.getenv("BATCH_STORE_PATH", "challan_batches.sqlite3")
+BATCH_TTL = float(os.getenv("BATCH_TTL", "86400"))  # Batches not updated for this long are forgotten
+BATCH_LEASE = float(os.getenv("BATCH_LEASE", "60"))  # Seconds before another worker may take a batch over
+
+BATCH_VEHICLES = registry.counter(
+    "challan_batch_vehicles_total", "Batch vehicles finished, by status.", labels=("status", "cached")
+)
+
+
+async def _batch_open_session(client_id: str, vehicle_number: str) -> str:
+    try:
+        session_id = await _open_session(client_id)
+    except SessionLimitExceeded as e:
+        raise UpstreamBusy(str(e), e.retry_after, "sessions")
+    except DriverPoolExhausted as e:
+        raise UpstreamBusy(str(e), 5, "drivers")
+    active_sessions[session_id]['vehicle_number_input'] = vehicle_number
+    # A loaded captcha may wait a long time for the operator; the batch closes its own sessions
+    session_manager.pin(session_id)
+    await save_session(session_id)
+    return session_id
+
+
+async def _batch_step(session_id: str, fn, *args):
+    """Runs a lookup step for a batch session; a 429 from the upstream queue becomes UpstreamBusy."""
+    if not await load_session(session_id):
+        raise RuntimeError("Session expired")
+    try:
+        async with session_manager.activity(session_id):
+            return await fn(session_id, *args)
+    except HTTPException as e:
+        if e.status_code == 429:
+            raise UpstreamBusy(e.detail, int((e.headers or {}).get("Retry-After", 5)), "upstream")
+        raise RuntimeError(e.detail) from e
+
+
+async def _batch_load_captcha(session_id: str) -> str:
+    return await _batch_step(session_id, get_captcha)
+
+
+async def _batch_submit(session_id: str, vehicle_number: str, captcha_solution: str) -> Dict:
+    return await _batch_step(session_id, _submit_and_record, vehicle_number, captcha_solution)
+
+
+def _batch_cached(vehicle_number: str):
+    cached = result_cache.get(vehicle_number)
+    if cached is None:
+        return None
+    cached_result, cache_age = cached
+    return dict(cached_result, cache_age=round(cache_age, 1))
+
+
+fleet_batches = FleetBatches(
+    store_factory=lambda: SessionStore(backend=BATCH_STORE, ttl=BATCH_TTL, path=BATCH_STORE_PATH,
+                                       url=SESSION_STORE_URL, prefix="challan:batch:"),
+    open_session=_batch_open_session,
+    load_captcha=_batch_load_captcha,
+    submit=_batch_submit,
+    close_session=close_session_sync,
+    cached=_batch_cached,
+    lookahead=BATCH_LOOKAHEAD,
+    submit_concurrency=BATCH_SUBMIT_CONCURRENCY,
+    max_attempts=BATCH_MAX_ATTEMPTS,
+    max_vehicles=BATCH_MAX_VEHICLES,
+    captcha_max_age=CAPTCHA_PREFETCH_MAX_AGE,
+    lease=BATCH_LEASE,
+    on_finish=lambda status, cached: BATCH_VEHICLES.inc(status=status, cached=str(cached).lower()),
+)
+registry.gauge("challan_batch_ready_captchas", "Batch captchas loaded and waiting for the operator.",
+               lambda: fleet_batches.count(READY))
+registry.gauge("challan_batch_queued_submissions", "Solved batch captchas waiting to be submitted.",
+               lambda: fleet_batches.count(QUEUED))
+
+
+def get_batch(batch_id: str) -> FleetBatch:
+    if not FLEET_BATCHES:
+        raise HTTPException(status_code=404, detail="Fleet batches are turned off (FLEET_BATCHES=0)")
+    try:
+        batch = fleet_batches.get(batch_id)
+    except BatchHeldElsewhere as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
 # --- API Endpoints ---
 
 @app.post("/start-session")
-async def start_session():
-    """Starts a new Selenium session and returns a session ID."""
-    session_id = str(uuid.uuid4())
+async def start_session(request: Request):
+    """Starts a new lookup session and returns a session ID."""
+    session_manager.start_reaper()
     try:
-        driver = create_driver()
-        active_sessions[session_id] = {"driver": driver}
-        print(f"Session created: {session_id}")
-        return JSONResponse(content={
+        session_id = await _open_session(client_id_for(request))
+        content = {
             "session_id": session_id,
-            "status": "session_started"
-        })
+            "status": "session_started",
+            "engine": active_sessions[session_id]["engine"]
+        }
+        if SESSION_EVENTS:
+            session_events.open(session_id)
+            content["events"] = f"/session-events/{session_id}"
+        if CAPTCHA_PREFETCH:
+            _start_captcha_prefetch(session_id)
+        return JSONResponse(content=content)
+    except SessionLimitExceeded as e:
+        logger.warning("Refusing new session: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DriverPoolExhausted as e:
+        logger.warning("Error creating session: %s", e)
+        raise HTTPException(status_code=503, detail=f"All browsers are busy, try again shortly: {e}",
+                            headers={"Retry-After": "5"})
     except Exception as e:
-        print(f"Error creating session: {e}")
-        # Clean up if driver was partially created but failed before storing
-        if session_id in active_sessions and 'driver' in active_sessions[session_id]:
-             active_sessions[session_id]['driver'].quit()
-             del active_sessions[session_id]
+        logger.error("Error creating session: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to start session: {e}")
 
 
-@app.post("/process-vehicle/{session_id}")
+async def _open_session(client_id: str) -> str:
+    """Admits and creates a session on the configured engine and returns its ID.
+
+    Raises SessionLimitExceeded when the session or memory cap is reached.
+    """
+    async with session_manager.admission():
+        return await _create_session(client_id)
+
+
+async def _create_session(client_id: str) -> str:
+    session_id = str(uuid.uuid4())
+    try:
+        if LOOKUP_ENGINE == ENGINE_SELENIUM:
+            # Checking out is instant when a warm driver is idle; a miss launches Chrome,
+            # so keep it off the event loop either way.
+            browser = await asyncio.to_thread(_acquire_browser, session_id)
+            session_manager.add(session_id, dict(browser, engine=ENGINE_SELENIUM, client_id=client_id))
+        else:
+            # No browser until the HTTP path actually fails
+            http_session = HttpChallanSession(CHALLAN_URL, timeout=HTTP_LOOKUP_TIMEOUT)
+            session_manager.add(session_id, {"http": http_session, "engine": ENGINE_HTTP, "client_id": client_id})
+        logger.info("Session created", extra={"session_id": session_id, "engine": active_sessions[session_id]["engine"]})
+        await save_session(session_id)
+        return session_id
+    except Exception:
+        # Clean up if driver was partially created but failed before storing
+        if session_id in active_sessions and _has_browser(active_sessions[session_id]):
+             session_info = session_manager.remove(session_id)
+             if 'driver' in session_info:
+                 driver_pool.discard(session_info['driver'])
+             else:
+                 _release_browser(session_info)
+        raise
+
+
+@app.post("/process-vehicle/{session_id}", dependencies=[Depends(track_session_activity)])
 async def process_vehicle(session_id: str, request: Request):
     """Processes an image upload or direct vehicle number for a session."""
     if session_id not in active_sessions:
         raise HTTPException(status_code=404, detail="Session not found")
 
+    started = time.perf_counter()
     form_data = await request.form()
     image_file = form_data.get("image")
     vehicle_number_direct = form_data.get("vehicle_number")
-    vehicle_number = ""
+    image_bytes = None
+
+    force_refresh = str(form_data.get("force_refresh", "")).strip().lower() in ("1", "true", "yes", "on")
 
     if image_file:
         if hasattr(image_file, "file"):
+            # Read now: the upload is gone once the request is answered
             image_bytes = await image_file.read()
-            vehicle_number = extract_text_from_image(image_bytes)
-            if not vehicle_number:
-                 raise HTTPException(status_code=400, detail="Could not extract vehicle number from image.")
+            # Overlap the page load and captcha capture with OCR; the total becomes
+            # max(OCR, page load) instead of their sum. A photo read before whose
+            # plate has a cached result needs no captcha at all.
+            known_plate = plate_ocr.peek(image_bytes)
+            if force_refresh or not (known_plate and result_cache.peek(known_plate)):
+                _start_captcha_prefetch(session_id)
         else:
             raise HTTPException(status_code=400, detail="Invalid image file.")
-    elif vehicle_number_direct:
-        vehicle_number = vehicle_number_direct.strip().upper()
-    else:
+    elif not vehicle_number_direct:
         raise HTTPException(status_code=400, detail="No image or vehicle number provided.")
 
-    active_sessions[session_id]['vehicle_number_input'] = vehicle_number # Store the number used
+    async def work():
+        timings = {}
+        ocr_metrics = None
+        if image_bytes is not None:
+            ocr_started = time.perf_counter()
+            with session_progress(session_id), stage("ocr"):
+                ocr = await plate_ocr.extract(image_bytes)
+            timings["ocr"] = round(time.perf_counter() - ocr_started, 3)
+            vehicle_number = ocr["text"]
+            ocr_metrics = ocr["metrics"]
+            if ocr_metrics.get("cache_hit"):
+                OCR_REQUESTS.inc(result="cache_hit")
+            elif "error" in ocr_metrics:
+                OCR_REQUESTS.inc(result="failed")
+            else:
+                OCR_REQUESTS.inc(result="ok" if vehicle_number else "unreadable")
+            session_events.publish(session_id, "ocr_result", {"vehicle_number": vehicle_number, "ocr": ocr_metrics})
+            if not vehicle_number:
+                 # The captcha keeps loading and is reused by the next attempt
+                 raise HTTPException(status_code=400, detail="Could not extract vehicle number from image.")
+        else:
+            vehicle_number = vehicle_number_direct.strip().upper()
 
-    # After successful vehicle number processing, get the captcha
-    try:
-        captcha_b64 = await get_captcha(session_id)
-        return JSONResponse(content={
-            "session_id": session_id,
-            "status": "vehicle_processed",
-            "vehicle_number": vehicle_number,
-            "captcha_image": captcha_b64
-        })
-    except Exception as e:
-        print(f"Error getting captcha after vehicle processing: {e}")
-        raise HTTPException(status_code=500, detail=f"Vehicle number processed but failed to get captcha: {e}")
+        active_sessions[session_id]['vehicle_number_input'] = vehicle_number # Store the number used
+        await save_session(session_id)
+
+        # Repeat lookups are answered from the cache without loading the captcha page
+        if force_refresh:
+            result_cache.record_bypass()
+        else:
+            cached = result_cache.get(vehicle_number)
+            if cached is not None:
+                # A captcha loading alongside OCR isn't needed after all
+                _cancel_captcha_prefetch(active_sessions[session_id])
+                cached_result, cache_age = cached
+                return {
+                    "session_id": session_id,
+                    "status": "cached_result",
+                    "vehicle_number": vehicle_number,
+                    "cached": True,
+                    "cache_age": round(cache_age, 1),
+                    "result": cached_result,
+                    "ocr": ocr_metrics,
+                    "timings": dict(timings, total=round(time.perf_counter() - started, 3))
+                }
+
+        # After successful vehicle number processing, get the captcha
+        try:
+            wait_started = time.perf_counter()
+            captcha_b64, captcha_load, prefetched = await _take_captcha(session_id)
+            await save_session(session_id)
+            # Only the part of the captcha load that OCR didn't hide
+            record_stage("captcha_wait", time.perf_counter() - wait_started)
+            timings.update({
+                "captcha_load": round(captcha_load, 3),
+                "captcha_wait": round(time.perf_counter() - wait_started, 3),
+                "captcha_prefetched": prefetched,
+                "total": round(time.perf_counter() - started, 3),
+            })
+            return {
+                "session_id": session_id,
+                "status": "vehicle_processed",
+                "vehicle_number": vehicle_number,
+                "captcha_image": captcha_b64,
+                "ocr": ocr_metrics,
+                "timings": timings
+            }
+        except HTTPException as e:
+            if e.status_code == 429:
+                raise  # Upstream queue is full; the client retries after Retry-After
+            logger.error("Error getting captcha after vehicle processing: %s", e.detail, extra={"session_id": session_id})
+            raise HTTPException(status_code=500, detail=f"Vehicle number processed but failed to get captcha: {e.detail}")
+        except Exception as e:
+            logger.error("Error getting captcha after vehicle processing: %s", e, extra={"session_id": session_id})
+            raise HTTPException(status_code=500, detail=f"Vehicle number processed but failed to get captcha: {e}")
+
+    return await respond(request, session_id, "process-vehicle", work)
 
 
-@app.post("/submit-challan/{session_id}")
+@app.post("/submit-challan/{session_id}", dependencies=[Depends(track_session_activity)])
 async def submit_challan(session_id: str, request: Request):
     """Submits the vehicle number and captcha solution."""
     if session_id not in active_sessions:
@@ -461,65 +1607,312 @@ async def submit_challan(session_id: str, request: Request):
 
     vehicle_number = active_sessions[session_id]['vehicle_number_input']
 
+    async def work():
+        return await _submit_and_record(session_id, vehicle_number, captcha_solution)
+
+    return await respond(request, session_id, "submit-challan", work)
+
+
+async def _submit_and_record(session_id: str, vehicle_number: str, captcha_solution: str) -> Dict:
+    """Submits a solved captcha, then counts the outcome and caches a successful result."""
     try:
         result = await process_challan_submission(session_id, vehicle_number, captcha_solution)
-        return JSONResponse(content=result)
+        SUBMISSIONS.inc(outcome=result.get("outcome", OUTCOME_UNKNOWN), engine=result.get("engine", ""))
+        if result.get("status") == "success":
+            result_cache.set(vehicle_number, result)
+        await save_session(session_id)
+        return result
     except HTTPException as e:
         # Re-raise HTTP exceptions from underlying functions
+        SUBMISSIONS.inc(outcome="failed", engine=active_sessions.get(session_id, {}).get("engine", ""))
         raise e
     except Exception as e:
-        print(f"Unexpected error during challan submission for session {session_id}: {e}")
+        SUBMISSIONS.inc(outcome="failed", engine=active_sessions.get(session_id, {}).get("engine", ""))
+        logger.exception("Unexpected error during challan submission", extra={"session_id": session_id})
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
 
-@app.post("/refresh-captcha/{session_id}")
-async def refresh_captcha(session_id: str):
+@app.post("/refresh-captcha/{session_id}", dependencies=[Depends(track_session_activity)])
+async def refresh_captcha(session_id: str, request: Request):
      """Gets a new captcha image for the session."""
      if session_id not in active_sessions:
          raise HTTPException(status_code=404, detail="Session not found")
-     try:
-        # Re-fetch the captcha page using the existing driver
-        # Note: This assumes the site provides a new captcha on page reload or via a specific refresh button.
-        # If there's a refresh button, clicking it would be better.
-        captcha_b64 = await get_captcha(session_id) # Re-calls the get_captcha logic
-        return JSONResponse(content={"captcha_image": captcha_b64})
-     except HTTPException as e:
-         raise e # Propagate errors from get_captcha
-     except Exception as e:
-         print(f"Error refreshing captcha for session {session_id}: {e}")
-         raise HTTPException(status_code=500, detail=f"Failed to refresh captcha: {e}")
+
+     async def work():
+        try:
+            started = time.perf_counter()
+            _cancel_captcha_prefetch(active_sessions[session_id]) # An explicit refresh supersedes a pending load
+            with session_progress(session_id):
+                captcha_b64 = await refresh_captcha_in_place(session_id)
+            method = "in_place"
+            if captcha_b64 is None:
+                # Re-fetch the whole captcha page
+                captcha_b64 = await get_captcha(session_id)
+                method = "reload"
+            else:
+                session_events.publish(session_id, "captcha_ready", {"captcha_image": captcha_b64})
+            CAPTCHA_REFRESHES.inc(method=method)
+            await save_session(session_id)
+            return {
+                "captcha_image": captcha_b64,
+                "refresh": method,
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+        except HTTPException as e:
+            raise e # Propagate errors from get_captcha
+        except Exception as e:
+            logger.error("Error refreshing captcha: %s", e, extra={"session_id": session_id})
+            raise HTTPException(status_code=500, detail=f"Failed to refresh captcha: {e}")
+
+     return await respond(request, session_id, "refresh-captcha", work)
 
 
 @app.post("/end-session/{session_id}")
 async def end_session(session_id: str):
     """Closes the Selenium driver and cleans up the session."""
-    if close_session_sync(session_id):
+    await load_session(session_id)  # It may have been opened by another worker
+    if await close_session(session_id):
         return JSONResponse(content={"status": "session_closed", "session_id": session_id})
     else:
         raise HTTPException(status_code=404, detail="Session not found")
 
 
+@app.post("/batches")
+async def create_batch(request: Request):
+    """Starts a fleet batch from a JSON `vehicles` list, or a form field with one number per line or comma.
+
+    `force_refresh` queries the site for every vehicle instead of using cached results.
+    """
+    if not FLEET_BATCHES:
+        raise HTTPException(status_code=404, detail="Fleet batches are turned off (FLEET_BATCHES=0)")
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="The request body is not valid JSON.")
+        if not isinstance(body, dict):
+            raise HTTPException(status_code=400, detail="The request body must be a JSON object.")
+    else:
+        body = await request.form()
+    vehicles = body.get("vehicles")
+    force_refresh = str(body.get("force_refresh", "")).strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(vehicles, str):
+        vehicles = vehicles.replace(",", "\n").splitlines()
+    if not isinstance(vehicles, list):
+        raise HTTPException(status_code=400, detail="Give the registration numbers as `vehicles`.")
+    try:
+        batch = fleet_batches.create([str(vehicle) for vehicle in vehicles], client_id_for(request),
+                                     force_refresh=force_refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("Batch created", extra={"batch_id": batch.batch_id, "vehicles": len(batch.items)})
+    return JSONResponse(content=dict(
+        batch.describe(items=False),
+        next=f"/batches/{batch.batch_id}/next",
+        results=f"/batches/{batch.batch_id}/results",
+    ))
+
+
+@app.get("/batches/stats")
+async def batch_stats():
+    """Reports batches, captchas waiting for the operator, queued submissions and operator wait time."""
+    return JSONResponse(content=fleet_batches.stats())
+
+
+@app.get("/batches/{batch_id}")
+async def batch_status(batch_id: str):
+    """Progress and per-vehicle status of a batch; a batch from before a restart is resumed."""
+    return JSONResponse(content=get_batch(batch_id).describe())
+
+
+@app.get("/batches/{batch_id}/next")
+async def batch_next_captcha(batch_id: str, wait: float = 20.0, exclude: str = ""):
+    """The next loaded captcha, waiting up to `wait` seconds; `exclude` skips indexes already on screen."""
+    try:
+        skipped = [int(index) for index in exclude.split(",") if index.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="`exclude` is a comma-separated list of indexes.")
+    batch = get_batch(batch_id)
+    return JSONResponse(content=await batch.next_captcha(skipped, wait=max(0.0, min(wait, 30.0))))
+
+
+@app.post("/batches/{batch_id}/solve")
+async def batch_solve(batch_id: str, request: Request):
+    """Queues a solved captcha for submission and answers with the next captcha if one is loaded."""
+    batch = get_batch(batch_id)
+    form_data = await request.form()
+    captcha_solution = form_data.get("captcha")
+    if not captcha_solution:
+        raise HTTPException(status_code=400, detail="Captcha solution is required.")
+    try:
+        index = int(form_data.get("index", ""))
+        content = batch.solve(index, captcha_solution)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e) or "`index` is required.")
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    content["next"] = await batch.next_captcha([index])
+    return JSONResponse(content=content)
+
+
+@app.post("/batches/{batch_id}/refresh-captcha")
+async def batch_refresh_captcha(batch_id: str, request: Request):
+    """Loads a new captcha for a vehicle whose captcha can't be read; it comes back through /next."""
+    batch = get_batch(batch_id)
+    form_data = await request.form()
+    try:
+        return JSONResponse(content=batch.refresh(int(form_data.get("index", ""))))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e) or "`index` is required.")
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/batches/{batch_id}/results")
+async def batch_results(batch_id: str, since: int = 0, follow: bool = False):
+    """Finished vehicles as NDJSON in completion order, from line `since`; `follow` streams until the batch is done."""
+    batch = get_batch(batch_id)
+
+    async def lines():
+        async for line in batch.results(since=since, follow=follow):
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    """Stops a batch and closes its sessions; finished results are kept."""
+    batch = get_batch(batch_id)
+    fleet_batches.cancel(batch)
+    return JSONResponse(content=batch.describe(items=False))
+
+
+@app.get("/sessions/stats")
+async def session_stats():
+    """Reports active/busy session counts, reaper and admission counters, memory use and the session store."""
+    return JSONResponse(content=dict(session_manager.stats(), store=session_store.stats()))
+
+
+@app.get("/ocr/stats")
+async def ocr_stats():
+    """Reports plate OCR call counts, memoization hits, bytes sent and model time."""
+    return JSONResponse(content=plate_ocr.stats())
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Reports result cache size and hit/miss counters."""
+    return JSONResponse(content=result_cache.stats())
+
+
+@app.get("/driver-pool/stats")
+async def driver_pool_stats():
+    """Reports driver pool occupancy and hit/miss/wait counters."""
+    return JSONResponse(content=driver_pool.stats())
+
+
+@app.get("/resource-policy/stats")
+async def resource_policy_stats():
+    """Reports the page-load strategy, blocked URL patterns and blocking counters."""
+    return JSONResponse(content=resource_policy.stats())
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: stage and request latency histograms, counters and gauges."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/browser-host/stats")
+async def browser_host_stats():
+    """Reports shared browsers, open tabs and tab wait counters (BROWSER_MODE=tabs)."""
+    return JSONResponse(content=dict(browser_host.stats(), mode=BROWSER_MODE))
+
+
+@app.get("/session-events/stats")
+async def session_events_stats():
+    """Reports open event streams, their subscribers and events published."""
+    return JSONResponse(content=dict(session_events.stats(), background_jobs=len(_jobs)))
+
+
+@app.get("/session-events/{session_id}")
+async def session_event_stream(session_id: str, request: Request):
+    """Streams a session's events as server-sent events until the session ends."""
+    if not SESSION_EVENTS:
+        raise HTTPException(status_code=404, detail="Session events are turned off (SESSION_EVENTS=0)")
+    if session_id not in session_events:
+        if not await load_session(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+        session_events.open(session_id)  # Started on another worker
+    try:
+        last_event_id = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_event_id = 0
+
+    async def stream():
+        async for item in session_events.subscribe(session_id, last_event_id):
+            yield format_sse(item)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/driver-supervisor/stats")
+async def driver_supervisor_stats():
+    """Reports liveness probes, browsers replaced after crashes and browsers recycled."""
+    return JSONResponse(content=driver_supervisor.stats())
+
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    """Reports upstream slots in use, queued requests, queue times and 429 counts."""
+    return JSONResponse(content=upstream_scheduler.stats())
+
+
+@app.get("/driver-workers/stats")
+async def driver_workers_stats():
+    """Reports sessions and browser pools of each driver worker (DRIVER_WORKERS)."""
+    if driver_workers is None:
+        return JSONResponse(content={"workers": []})
+    return JSONResponse(content={"workers": await asyncio.to_thread(driver_workers.stats)})
+
+
 # Mangum handler for AWS Lambda
 handler = Mangum(app, lifespan="off") # lifespan='off' might be needed for some background tasks/cleanup
 
+# DRIVER_PRELAUNCH=1 starts the first Chrome while the module is imported. On Lambda
+# that is the init phase, which runs before the first request rather than during it
+# (and, with provisioned concurrency or SnapStart-style warmers, ahead of traffic).
+DRIVER_PRELAUNCH = os.getenv("DRIVER_PRELAUNCH", "0").lower() in ("1", "true", "yes", "on")
+if DRIVER_PRELAUNCH and LOOKUP_ENGINE != ENGINE_HTTP and driver_workers is None:
+    with stage("driver_prelaunch"):
+        if BROWSER_MODE == BROWSER_MODE_TABS:
+            browser_host.prewarm()
+        else:
+            driver_pool.prewarm()
+
 
 # --- Optional: Local Development Startup ---
 if __name__ == "__main__":
     import uvicorn
     # Note: Running locally might have issues if GOOGLE_API_KEY isn't set as an env var
-    print("Starting Uvicorn server locally...")
-    uvicorn.run(app, host="127.0.0.1", port=8000)
-
-    # Add a cleanup hook for local development if needed
+    # Sessions are closed by the shutdown event; this hook only catches what is
+    # left if the server exits without running it. It must be registered before
+    # uvicorn.run, which blocks until the server stops.
     import atexit
     def cleanup_all_sessions():
-        print("Cleaning up all active Selenium sessions...")
+        logger.info("Cleaning up all active Selenium sessions...")
         session_ids = list(active_sessions.keys())
         for session_id in session_ids:
             close_session_sync(session_id)
-        print("Cleanup complete.")
+        logger.info("Cleanup complete.")
     atexit.register(cleanup_all_sessions)
 
+    logger.info("Starting Uvicorn server locally...")
+    uvicorn.run(app, host="127.0.0.1", port=8000)
+
 # Remove WebSocket related code:
 # - Removed WebSocket imports
 # - Removed ConnectionManager class
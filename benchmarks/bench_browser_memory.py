@@ -0,0 +1,149 @@
+"""Compares memory per session: a Chrome per session versus tabs in shared Chromes.
+
+Opens N sessions in each mode, loads the challan page in every one and reports
+the resident memory of this process and all its children (chromedriver, Chrome)
+from /proc, in total and per session. Then every session runs `--lookups` full
+lookups at the same time (captcha page, submission, results) and the latency
+per lookup and the throughput are reported, so a mode that serializes its
+sessions shows up. Needs Chrome; point it at the stand-in site, accepting any
+captcha, to avoid hitting the real one:
+
+    python benchmarks/challan_site.py --port 8081 --accept-any-captcha &
+    python benchmarks/bench_browser_memory.py --sessions 10 --url http://127.0.0.1:8081/publicview/
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from browser_host import BrowserHost  # noqa: E402
+from session_manager import process_tree_rss_mb  # noqa: E402
+
+
+def settle(seconds: float) -> float:
+    time.sleep(seconds)
+    return process_tree_rss_mb() or 0.0
+
+
+def lookup(app, driver, index: int) -> float:
+    """One lookup as a session runs it; returns its latency in seconds."""
+    started = time.perf_counter()
+    session_data = {}
+    app._load_captcha_page(driver, session_data)
+    result = app._submit_challan_form(driver, session_data, f"AP01BENCH{index:04d}", "ANY")
+    if result.get("status") != "success":
+        raise RuntimeError(f"Lookup failed: {result.get('message')}")
+    return time.perf_counter() - started
+
+
+def run_lookups(runners, lookups: int):
+    """Runs `lookups` lookups in every session at once; returns (latencies, elapsed seconds)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def session(index, run):
+        for _ in range(lookups):
+            try:
+                latency = run(index)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                return
+            with lock:
+                latencies.append(latency)
+
+    threads = [threading.Thread(target=session, args=(index, run)) for index, run in enumerate(runners)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        print(f"  {len(errors)} session(s) failed, first error: {errors[0]}")
+    return latencies, time.perf_counter() - started
+
+
+def bench_pool(app, sessions: int, url: str, settle_seconds: float, lookups: int):
+    """Today's model: a separate single-process Chrome for each session."""
+    drivers = []
+    started = time.perf_counter()
+    try:
+        for _ in range(sessions):
+            driver = app.create_driver()
+            driver.get(url)
+            drivers.append(driver)
+        elapsed = time.perf_counter() - started
+        rss = settle(settle_seconds)
+        runners = [lambda index, driver=driver: lookup(app, driver, index) for driver in drivers]
+        return rss, elapsed, run_lookups(runners, lookups)
+    finally:
+        for driver in drivers:
+            driver.quit()
+
+
+def bench_tabs(app, sessions: int, url: str, settle_seconds: float, lookups: int, tabs_per_browser: int):
+    """Shared model: one isolated tab per session in as few Chromes as `tabs_per_browser` allows."""
+    max_browsers = -(-sessions // tabs_per_browser)
+    host = BrowserHost(lambda: app.create_driver(single_process=False),
+                       max_browsers=max_browsers, tabs_per_browser=tabs_per_browser)
+    started = time.perf_counter()
+    try:
+        tabs = []
+        for _ in range(sessions):
+            tab = host.open_tab()
+            tab.run(lambda driver: driver.get(url))
+            tabs.append(tab)
+        elapsed = time.perf_counter() - started
+        rss = settle(settle_seconds)
+        runners = [lambda index, tab=tab: tab.run(lookup, app, index) for tab in tabs]
+        return rss, elapsed, run_lookups(runners, lookups)
+    finally:
+        host.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--url", default=os.getenv("CHALLAN_URL", "http://127.0.0.1:8081/publicview/"))
+    parser.add_argument("--tabs-per-browser", type=int, default=8)
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds to wait before sampling memory")
+    parser.add_argument("--mode", choices=("both", "pool", "tabs"), default="both")
+    parser.add_argument("--lookups", type=int, default=3, help="Lookups each session runs concurrently (0 skips)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("CHALLAN_URL", args.url)
+    import app
+
+    baseline = settle(0)
+    print(f"baseline RSS: {baseline:.0f} MB, {args.sessions} sessions on {args.url}")
+    print(f"{'mode':6} {'total MB':>9} {'MB/session':>11} {'open s':>7} "
+          f"{'p50 s':>7} {'p95 s':>7} {'lookups/s':>10}")
+    for mode in ("pool", "tabs"):
+        if args.mode not in ("both", mode):
+            continue
+        if mode == "pool":
+            rss, elapsed, (latencies, lookup_time) = bench_pool(app, args.sessions, args.url, args.settle,
+                                                                args.lookups)
+        else:
+            rss, elapsed, (latencies, lookup_time) = bench_tabs(app, args.sessions, args.url, args.settle,
+                                                                args.lookups, args.tabs_per_browser)
+        per_session = (rss - baseline) / args.sessions
+        if latencies:
+            ordered = sorted(latencies)
+            p50 = statistics.median(ordered)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            throughput = len(latencies) / lookup_time
+            timing = f"{p50:7.2f} {p95:7.2f} {throughput:10.2f}"
+        else:
+            timing = f"{'-':>7} {'-':>7} {'-':>10}"
+        print(f"{mode:6} {rss - baseline:9.0f} {per_session:11.1f} {elapsed:7.1f} {timing}")
+        # Let the quit browsers' memory be returned before the next mode samples
+        time.sleep(args.settle)
+
+
+if __name__ == "__main__":
+    main()
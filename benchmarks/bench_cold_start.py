@@ -0,0 +1,122 @@
+"""Measures Lambda-style cold starts: importing app plus the first Mangum invocations.
+
+Every run is a fresh interpreter, like a new Lambda execution environment. It
+reports the time to import `app` (the init phase) and to serve the first and
+second API Gateway (HTTP API v2) events through `app.handler`. `--eager` also
+times the old import profile, with google-genai, Selenium, OpenCV and PIL
+imported up front, for comparison:
+
+    python benchmarks/bench_cold_start.py --runs 5 --eager
+
+With `--url` pointing at a challan site (e.g. benchmarks/challan_site.py) the
+first request is a POST /start-session over the HTTP engine instead of a stats
+call. `--importtime` lists app's slowest imports from `python -X importtime`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+EAGER_IMPORTS = "import google.genai, selenium.webdriver, cv2, PIL.Image\n"
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+{eager}import app
+imported = time.perf_counter() - started
+
+def event(method, path):
+    return {{
+        "version": "2.0", "routeKey": "$default", "rawPath": path, "rawQueryString": "",
+        "headers": {{"host": "lambda.local", "content-type": "application/json"}},
+        "requestContext": {{"http": {{"method": method, "path": path, "protocol": "HTTP/1.1",
+                                      "sourceIp": "127.0.0.1", "userAgent": "bench"}},
+                            "stage": "$default", "requestId": "bench"}},
+        "isBase64Encoded": False, "body": "",
+    }}
+
+timings = {{"import_s": imported}}
+for name, method, path in {requests!r}:
+    started = time.perf_counter()
+    response = app.handler(event(method, path), None)
+    timings[name + "_s"] = time.perf_counter() - started
+    timings[name + "_status"] = response["statusCode"]
+print(json.dumps(timings))
+"""
+
+
+def child_env(url):
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "cold-start-benchmark")
+    env.setdefault("AWS_LAMBDA_FUNCTION_NAME", "challan-cold-start-benchmark")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env.update({"LOOKUP_ENGINE": "http", "CAPTCHA_PREFETCH": "0", "DRIVER_PRELAUNCH": "0"})
+    if url:
+        env["CHALLAN_URL"] = url
+    return env
+
+
+def run_once(eager: bool, url):
+    first = ("first", "POST", "/start-session") if url else ("first", "GET", "/sessions/stats")
+    requests = [first, ("second", "GET", "/ocr/stats")]
+    code = CHILD.format(eager=EAGER_IMPORTS if eager else "", requests=requests)
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=child_env(url),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(top: int):
+    """The slowest of app's own imports by cumulative import time."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                            env=child_env(None), capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Modules imported directly by app (one nesting level below it); deeper
+        # entries are already counted in their parent's cumulative time
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true", help="also measure with heavy modules imported up front")
+    parser.add_argument("--url", help="challan page URL; makes the first request POST /start-session")
+    parser.add_argument("--importtime", type=int, metavar="N", help="show the N slowest imports made by app")
+    args = parser.parse_args()
+
+    variants = [("lazy", False)] + ([("eager", True)] if args.eager else [])
+    results = {}
+    print(f"{'variant':8} {'import ms':>10} {'1st req ms':>11} {'2nd req ms':>11} {'cold total ms':>14}")
+    for name, eager in variants:
+        samples = [run_once(eager, args.url) for _ in range(args.runs)]
+        results[name] = samples
+        median = {key: statistics.median(s[key] for s in samples)
+                  for key in ("import_s", "first_s", "second_s")}
+        statuses = sorted({s["first_status"] for s in samples})
+        print(f"{name:8} {median['import_s'] * 1000:10.0f} {median['first_s'] * 1000:11.0f} "
+              f"{median['second_s'] * 1000:11.1f} {(median['import_s'] + median['first_s']) * 1000:14.0f}"
+              f"  (first status {','.join(map(str, statuses))})")
+
+    if args.eager:
+        lazy, eager = (statistics.median(s["import_s"] + s["first_s"] for s in results[name])
+                       for name in ("lazy", "eager"))
+        print(f"\ncold start to first response: {eager * 1000:.0f} -> {lazy * 1000:.0f} ms "
+              f"({100 * (lazy / eager - 1):+.0f}%)")
+
+    if args.importtime:
+        print(f"\n{'module':40} {'cumulative ms':>14}")
+        for micros, module in import_profile(args.importtime):
+            print(f"{module:40} {micros / 1000:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
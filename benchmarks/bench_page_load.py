@@ -0,0 +1,85 @@
+"""Measures captcha page load time and bytes transferred with and without the resource policy.
+
+For each variant a fresh Chrome loads the page `--runs` times. The timer stops
+when the captcha image has rendered, which is when the app can screenshot it.
+Bytes come from the Performance API (navigation plus resource `transferSize`),
+so cross-origin resources without Timing-Allow-Origin count as 0. Needs Chrome:
+
+    python benchmarks/challan_site.py --port 8081 --assets --latency 0.05 &
+    python benchmarks/bench_page_load.py --url http://127.0.0.1:8081/publicview/
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+TRANSFER_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+return {
+  bytes: (nav ? nav.transferSize : 0) + resources.reduce((sum, r) => sum + (r.transferSize || 0), 0),
+  requests: resources.length + 1,
+  dom_content_loaded_ms: nav ? nav.domContentLoadedEventEnd : null,
+};
+"""
+
+
+def measure(app, url: str, runs: int):
+    driver = app.create_driver()
+    samples = []
+    try:
+        for _ in range(runs):
+            # Drop the HTTP cache so every run downloads what a new session would
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            started = time.perf_counter()
+            driver.get(url)
+            captcha_state = app._wait_for_captcha_image(driver)
+            ready_ms = (time.perf_counter() - started) * 1000
+            transfer = driver.execute_script(TRANSFER_JS)
+            samples.append(dict(transfer, ready_ms=ready_ms, captcha=captcha_state))
+    finally:
+        driver.quit()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=os.getenv("CHALLAN_URL", "http://127.0.0.1:8081/publicview/"))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    import app
+
+    policy = app.resource_policy
+    variants = [
+        ("baseline", False),
+        (f"policy ({policy.page_load_strategy})", True),
+    ]
+    print(f"{'variant':18} {'ready ms':>9} {'DCL ms':>8} {'KB':>8} {'requests':>9}  captcha")
+    results = {}
+    for name, enabled in variants:
+        policy.enabled = enabled
+        samples = measure(app, args.url, args.runs)
+        results[name] = samples
+        print(f"{name:18} {statistics.median(s['ready_ms'] for s in samples):9.0f} "
+              f"{statistics.median(s['dom_content_loaded_ms'] or 0 for s in samples):8.0f} "
+              f"{statistics.median(s['bytes'] for s in samples) / 1024:8.1f} "
+              f"{statistics.median(s['requests'] for s in samples):9.0f}  "
+              f"{','.join(sorted({s['captcha'] for s in samples}))}")
+
+    base, tuned = results.values()
+    base_ms = statistics.median(s["ready_ms"] for s in base)
+    tuned_ms = statistics.median(s["ready_ms"] for s in tuned)
+    base_kb = statistics.median(s["bytes"] for s in base) / 1024
+    tuned_kb = statistics.median(s["bytes"] for s in tuned) / 1024
+    print()
+    print(f"time to captcha: {base_ms:.0f} -> {tuned_ms:.0f} ms ({100 * (tuned_ms / base_ms - 1):+.0f}%)")
+    if base_kb:
+        print(f"transferred: {base_kb:.1f} -> {tuned_kb:.1f} KB ({100 * (tuned_kb / base_kb - 1):+.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmarks plate localization over a folder of sample photos.
+
+For every image it reports whether a plate was found, the time spent localizing,
+and the bytes that would be uploaded for the crop versus the downscaled full
+photo. With --ocr it also calls the model on both and compares latency and
+whether the crop reading is a valid registration number (needs GOOGLE_API_KEY).
+
+    python benchmarks/bench_plate_localizer.py samples/ [--ocr] [--expected expected.csv]
+
+`--expected` takes a CSV of `filename,registration_number` lines to score accuracy.
+"""
+import argparse
+import asyncio
+import csv
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from plate_localizer import crop_plate  # noqa: E402
+from plate_ocr import PlateOcr, is_valid_registration, prepare_image  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_expected(path):
+    if not path:
+        return {}
+    with open(path, newline="") as f:
+        return {row[0]: row[1].replace(" ", "").upper() for row in csv.reader(f) if len(row) >= 2}
+
+
+async def read(ocr: PlateOcr, payload: bytes, mime_type: str):
+    started = time.perf_counter()
+    text, _ = await ocr._read_plate(payload, mime_type)
+    return text, time.perf_counter() - started
+
+
+async def run(args):
+    files = sorted(
+        name for name in os.listdir(args.folder) if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not files:
+        print(f"No images found in {args.folder}")
+        return
+
+    expected = load_expected(args.expected)
+    ocr = None
+    if args.ocr:
+        from google import genai
+        ocr = PlateOcr(genai.Client(api_key=os.getenv("GOOGLE_API_KEY")), model=args.model)
+
+    rows = []
+    for name in files:
+        with open(os.path.join(args.folder, name), "rb") as f:
+            image_bytes = f.read()
+
+        started = time.perf_counter()
+        crop, _ = crop_plate(image_bytes, args.jpeg_quality)
+        localize_ms = (time.perf_counter() - started) * 1000
+        full_payload, full_mime, _ = prepare_image(image_bytes, args.max_dimension, args.jpeg_quality)
+
+        row = {
+            "file": name,
+            "localized": crop is not None,
+            "localize_ms": localize_ms,
+            "original_bytes": len(image_bytes),
+            "full_bytes": len(full_payload),
+            "crop_bytes": len(crop) if crop else None,
+        }
+        if ocr:
+            row["full_text"], row["full_s"] = await read(ocr, full_payload, full_mime)
+            if crop:
+                row["crop_text"], row["crop_s"] = await read(ocr, crop, "image/jpeg")
+                row["crop_valid"] = is_valid_registration(row["crop_text"])
+        rows.append(row)
+
+    print(f"{'file':30} {'plate':>5} {'loc ms':>7} {'full B':>8} {'crop B':>8}", end="")
+    print(f" {'full s':>7} {'crop s':>7}  readings" if ocr else "")
+    for row in rows:
+        crop_bytes = row["crop_bytes"] if row["crop_bytes"] is not None else "-"
+        print(f"{row['file'][:30]:30} {'yes' if row['localized'] else 'no':>5} "
+              f"{row['localize_ms']:7.1f} {row['full_bytes']:8} {crop_bytes:>8}", end="")
+        if ocr:
+            crop_s = f"{row['crop_s']:7.2f}" if "crop_s" in row else f"{'-':>7}"
+            print(f" {row['full_s']:7.2f} {crop_s}  full={row['full_text']} crop={row.get('crop_text', '-')}")
+        else:
+            print()
+
+    localized = [row for row in rows if row["localized"]]
+    print()
+    print(f"images: {len(rows)}, plate found: {len(localized)} ({100 * len(localized) / len(rows):.0f}%)")
+    print(f"localization: median {statistics.median(r['localize_ms'] for r in rows):.1f} ms, "
+          f"max {max(r['localize_ms'] for r in rows):.1f} ms")
+    if localized:
+        full = sum(r["full_bytes"] for r in localized)
+        cropped = sum(r["crop_bytes"] for r in localized)
+        print(f"upload size where a plate was found: full {full} B -> crop {cropped} B "
+              f"({100 * (cropped / full - 1):+.0f}%)")
+    if ocr:
+        full_times = [r["full_s"] for r in rows]
+        crop_times = [r["crop_s"] for r in rows if "crop_s" in r]
+        print(f"model latency: full median {statistics.median(full_times):.2f}s", end="")
+        print(f", crop median {statistics.median(crop_times):.2f}s" if crop_times else "")
+        valid = sum(1 for r in rows if r.get("crop_valid"))
+        print(f"crop readings with a valid registration format: {valid}/{len(localized)}")
+        if expected:
+            scored = [r for r in rows if r["file"] in expected]
+            for key in ("full_text", "crop_text"):
+                correct = sum(1 for r in scored if r.get(key) == expected[r["file"]])
+                print(f"{key.split('_')[0]} accuracy: {correct}/{len(scored)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", help="Folder of sample vehicle photos")
+    parser.add_argument("--ocr", action="store_true", help="Also call the model on full and cropped images")
+    parser.add_argument("--model", default="gemini-1.5-flash")
+    parser.add_argument("--max-dimension", type=int, default=1280)
+    parser.add_argument("--jpeg-quality", type=int, default=85)
+    parser.add_argument("--expected", help="CSV of filename,registration_number")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Local stand-in for the echallan public view site, for offline testing and load tests.
+
+Serves the same markup the lookup code relies on: the `captchaDivtab1` captcha,
+the `REG_NO` / `captchatab1` / `tab1btn` form with a hidden token, a
+"Please Enter Correct Captcha" error, a "No Pending Challans" page and an
+`rtable` results table with a configurable number of rows. With `--assets` the
+page also pulls a stylesheet, a web font, a banner image and an analytics
+script, like the real site does, for page-load benchmarks.
+
+Run it and point the app at it:
+
+    python benchmarks/challan_site.py --port 8081 --rows 5
+    CHALLAN_URL=http://127.0.0.1:8081/publicview/ python app.py
+"""
+import argparse
+import asyncio
+import random
+import string
+import uuid
+from io import BytesIO
+
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+SESSION_COOKIE = "JSESSIONID"
+CAPTCHA_HEADER = "X-Captcha-Text"
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><title>e-Challan Public View</title>{assets_head}</head>
+<body>
+{assets_body}<form id="publicViewForm" method="post" action="/publicview/search">
+  <input type="hidden" name="token" value="{token}">
+  <input type="hidden" name="viewType" value="tab1">
+  <label for="REG_NO">Vehicle No</label>
+  <input type="text" id="REG_NO" name="REG_NO">
+  <div id="captchaDivtab1"><img id="captchaImgtab1" src="/publicview/captcha?t={nonce}" alt="captcha"></div>
+  <a id="refreshCaptchatab1" href="#"
+     onclick="document.getElementById('captchaImgtab1').src='/publicview/captcha?t='+Date.now();return false;">Refresh</a>
+  <input type="text" id="captchatab1" name="captchatab1">
+  <button type="submit" id="tab1btn" name="tab1btn" value="Submit">Submit</button>
+</form>
+{result}
+</body>
+</html>
+"""
+
+ROW_TEMPLATE = """<tr>
+  <td>{sno}</td><td><input type="checkbox" id="manualErr" value="{challan_no}"></td>
+  <td>Cyberabad</td><td>{challan_no}</td><td>{date}</td><td>{time}</td>
+  <td><div>{place}</div></td><td><div>{ps}</div></td>
+  <td><table><tr><td>{violation}</td><td>{section}</td><td>1</td></tr></table></td>
+  <td>{fine}</td><td>{charges}</td><td>{total}</td><td><a href="#">Click For Image</a></td>
+</tr>"""
+
+ASSETS_HEAD = """
+<link rel="stylesheet" href="/static/site.css">
+<script src="/static/analytics.js"></script>"""
+ASSETS_BODY = """<img id="banner" src="/static/banner.jpg" alt="e-Challan" width="960">
+"""
+SITE_CSS = """@font-face { font-family: "Site"; src: url("/static/site-font.woff2") format("woff2"); }
+body { font-family: "Site", sans-serif; }
+"""
+ANALYTICS_JS = "window.dataLayer = window.dataLayer || [];"
+
+PLACES = ["Gachibowli", "Madhapur", "Kukatpally", "Miyapur", "Kondapur"]
+VIOLATIONS = ["No Helmet", "Over Speeding", "Wrong Parking", "Signal Jump", "Triple Riding"]
+
+
+class ChallanSite:
+    def __init__(self, rows: int = 3, latency: float = 0.0, accept_any_captcha: bool = False,
+                 reveal_captcha: bool = False, assets: bool = False):
+        self.rows = rows
+        self.assets = assets
+        self.latency = latency
+        self.accept_any_captcha = accept_any_captcha
+        self.reveal_captcha = reveal_captcha
+        # session id -> {"token": ..., "captcha": ...}
+        self.sessions = {}
+        self._static = None
+
+    def _session(self, request: web.Request):
+        session_id = request.cookies.get(SESSION_COOKIE)
+        if session_id not in self.sessions:
+            session_id = uuid.uuid4().hex
+            self.sessions[session_id] = {"token": uuid.uuid4().hex, "captcha": None}
+        return session_id, self.sessions[session_id]
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _page(self, state, result: str = "") -> str:
+        return PAGE_TEMPLATE.format(
+            token=state["token"],
+            nonce=uuid.uuid4().hex[:8],
+            result=result,
+            assets_head=ASSETS_HEAD if self.assets else "",
+            assets_body=ASSETS_BODY if self.assets else "",
+        )
+
+    def _static_files(self):
+        if self._static is None:
+            # Noise doesn't compress, so the banner weighs about what a real photo does
+            banner = Image.frombytes("RGB", (960, 320), random.Random(0).randbytes(960 * 320 * 3))
+            buffer = BytesIO()
+            banner.save(buffer, format="JPEG", quality=90)
+            self._static = {
+                "banner.jpg": (buffer.getvalue(), "image/jpeg"),
+                "site-font.woff2": (random.Random(1).randbytes(80 * 1024), "font/woff2"),
+                "site.css": (SITE_CSS.encode(), "text/css"),
+                "analytics.js": (ANALYTICS_JS.encode(), "application/javascript"),
+            }
+        return self._static
+
+    async def static(self, request: web.Request) -> web.Response:
+        await self._delay()
+        asset = self._static_files().get(request.match_info["name"])
+        if asset is None:
+            raise web.HTTPNotFound()
+        body, content_type = asset
+        return web.Response(body=body, content_type=content_type)
+
+    async def page(self, request: web.Request) -> web.Response:
+        await self._delay()
+        session_id, state = self._session(request)
+        response = web.Response(text=self._page(state), content_type="text/html")
+        response.set_cookie(SESSION_COOKIE, session_id)
+        return response
+
+    async def captcha(self, request: web.Request) -> web.Response:
+        await self._delay()
+        session_id, state = self._session(request)
+        text = "".join(random.choices(string.ascii_uppercase + string.digits, k=5))
+        state["captcha"] = text
+
+        image = Image.new("RGB", (120, 40), "white")
+        ImageDraw.Draw(image).text((30, 14), text, fill="black")
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+
+        response = web.Response(body=buffer.getvalue(), content_type="image/png")
+        response.set_cookie(SESSION_COOKIE, session_id)
+        if self.reveal_captcha:
+            response.headers[CAPTCHA_HEADER] = text
+        return response
+
+    async def search(self, request: web.Request) -> web.Response:
+        await self._delay()
+        session_id, state = self._session(request)
+        form = await request.post()
+
+        expected = state.get("captcha")
+        given = (form.get("captchatab1") or "").strip().upper()
+        token_ok = form.get("token") == state["token"]
+        captcha_ok = self.accept_any_captcha or (expected is not None and given == expected)
+        state["captcha"] = None  # one attempt per captcha, like the real site
+
+        if not token_ok or not captcha_ok:
+            result = "<p class='error'>Please Enter Correct Captcha</p>"
+        else:
+            result = self.render_results((form.get("REG_NO") or "").strip().upper())
+        response = web.Response(text=self._page(state, result), content_type="text/html")
+        response.set_cookie(SESSION_COOKIE, session_id)
+        return response
+
+    def render_results(self, vehicle_number: str) -> str:
+        if self.rows <= 0:
+            return "<h3>No Pending Challans</h3>"
+
+        rng = random.Random(vehicle_number)
+        rows = []
+        fine_total = charges_total = 0
+        for index in range(self.rows):
+            fine = rng.choice([100, 200, 500, 1000])
+            charges = 35
+            fine_total += fine
+            charges_total += charges
+            rows.append(ROW_TEMPLATE.format(
+                sno=index + 1,
+                challan_no=f"CYB{rng.randint(10**8, 10**9 - 1)}",
+                date=f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-2024",
+                time=f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+                place=rng.choice(PLACES),
+                ps=rng.choice(PLACES),
+                violation=rng.choice(VIOLATIONS),
+                section="177 MVA",
+                fine=fine,
+                charges=charges,
+                total=fine + charges,
+            ))
+
+        return f"""<table id="rtable">
+<tr><td colspan="16"><div>Vehicle No:</div><div>{vehicle_number}</div><div>TEST OWNER</div></td></tr>
+{''.join(rows)}
+<tr><td colspan="12"><strong>Grand Total</strong></td><td>{fine_total}</td><td>{charges_total}</td><td>{fine_total + charges_total}</td><td></td></tr>
+</table>"""
+
+
+def create_app(rows: int = 3, latency: float = 0.0, accept_any_captcha: bool = False,
+               reveal_captcha: bool = False, assets: bool = False) -> web.Application:
+    site = ChallanSite(rows=rows, latency=latency, accept_any_captcha=accept_any_captcha,
+                       reveal_captcha=reveal_captcha, assets=assets)
+    app = web.Application()
+    app["site"] = site
+    app.router.add_get("/publicview/", site.page)
+    app.router.add_get("/publicview/captcha", site.captcha)
+    app.router.add_post("/publicview/search", site.search)
+    app.router.add_get("/static/{name}", site.static)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rows", type=int, default=3, help="Challan rows per lookup; 0 serves 'No Pending Challans'")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay added to every response")
+    parser.add_argument("--accept-any-captcha", action="store_true", help="Treat every captcha answer as correct")
+    parser.add_argument("--reveal-captcha", action="store_true",
+                        help=f"Send the captcha text in the {CAPTCHA_HEADER} response header")
+    parser.add_argument("--assets", action="store_true",
+                        help="Make the page load a stylesheet, web font, banner image and analytics script")
+    args = parser.parse_args()
+    web.run_app(
+        create_app(args.rows, args.latency, args.accept_any_captcha, args.reveal_captcha, args.assets),
+        host=args.host,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
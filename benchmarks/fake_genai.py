@@ -0,0 +1,101 @@
+"""Stand-in for the google-genai client, so OCR can be load-tested without the Gemini API.
+
+Point the app at it with
+
+    OCR_CLIENT_FACTORY=benchmarks.fake_genai:from_env python app.py
+
+Both `client.models.generate_content` and `client.aio.models.generate_content`
+are provided. Each call sleeps for FAKE_OCR_LATENCY (+/- FAKE_OCR_JITTER) seconds
+and answers with FAKE_OCR_PLATE, or with a valid registration number derived from
+the image bytes so different photos read as different vehicles.
+FAKE_OCR_FAILURE_RATE makes that fraction of calls raise.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import string
+import time
+from typing import Optional
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def plate_for(payload: bytes) -> str:
+    """A stable, valid-looking registration number for an image."""
+    digest = hashlib.sha256(payload).digest()
+    letters = "".join(string.ascii_uppercase[b % 26] for b in digest[:2])
+    return f"TS{digest[2] % 38 + 1:02d}{letters}{int.from_bytes(digest[3:5], 'big') % 10000:04d}"
+
+
+def _image_bytes(contents) -> bytes:
+    for part in contents if isinstance(contents, (list, tuple)) else [contents]:
+        data = getattr(getattr(part, "inline_data", None), "data", None)
+        if data:
+            return data
+    return b""
+
+
+class _Backend:
+    def __init__(self, latency: float, jitter: float, failure_rate: float, plate: Optional[str]):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.plate = plate
+        self.calls = 0
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def answer(self, contents) -> FakeResponse:
+        self.calls += 1
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Fake OCR backend failure")
+        return FakeResponse(self.plate or plate_for(_image_bytes(contents)))
+
+
+class _Models:
+    def __init__(self, backend: _Backend):
+        self._backend = backend
+
+    def generate_content(self, model: str, contents, **kwargs) -> FakeResponse:
+        time.sleep(self._backend.delay())
+        return self._backend.answer(contents)
+
+
+class _AsyncModels:
+    def __init__(self, backend: _Backend):
+        self._backend = backend
+
+    async def generate_content(self, model: str, contents, **kwargs) -> FakeResponse:
+        await asyncio.sleep(self._backend.delay())
+        return self._backend.answer(contents)
+
+
+class _Aio:
+    def __init__(self, backend: _Backend):
+        self.models = _AsyncModels(backend)
+
+
+class FakeGenAIClient:
+    def __init__(self, latency: float = 0.3, jitter: float = 0.0, failure_rate: float = 0.0,
+                 plate: Optional[str] = None):
+        self._backend = _Backend(latency, jitter, failure_rate, plate)
+        self.models = _Models(self._backend)
+        self.aio = _Aio(self._backend)
+
+    @property
+    def calls(self) -> int:
+        return self._backend.calls
+
+
+def from_env() -> FakeGenAIClient:
+    return FakeGenAIClient(
+        latency=float(os.getenv("FAKE_OCR_LATENCY", "0.3")),
+        jitter=float(os.getenv("FAKE_OCR_JITTER", "0.1")),
+        failure_rate=float(os.getenv("FAKE_OCR_FAILURE_RATE", "0")),
+        plate=os.getenv("FAKE_OCR_PLATE") or None,
+    )
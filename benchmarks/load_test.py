@@ -0,0 +1,331 @@
+"""Offline load test: concurrent start -> process -> submit -> end flows against the API.
+
+By default everything runs locally. The stand-in challan site is started in
+this process (accepting any captcha answer). The app is started under uvicorn
+in a subprocess, with the fake OCR backend from benchmarks/fake_genai.py. No
+request reaches the real site or the Gemini API.
+
+    python benchmarks/load_test.py --concurrency 10 --flows 200 --mode image
+
+The report gives p50/p95/p99 latency per endpoint, completed flows per second and
+the app's peak RSS (the server process and its children, e.g. Chrome). Save a run
+with --json and compare later runs against it with --baseline to catch regressions:
+
+    python benchmarks/load_test.py --json baseline.json
+    python benchmarks/load_test.py --baseline baseline.json --tolerance 0.2
+
+Use --base-url to load an app that is already running (add --server-pid for RSS), and
+--workers to run several uvicorn workers sharing sessions through the SQLite store.
+--clients spreads the users over several API keys, to see the upstream scheduler
+share the challan site between them.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from io import BytesIO
+
+import aiohttp
+from aiohttp import web
+from PIL import Image
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from benchmarks.challan_site import create_app as create_site  # noqa: E402
+from session_manager import process_tree_rss_mb  # noqa: E402
+
+ENDPOINTS = ("start-session", "process-vehicle", "submit-challan", "end-session")
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def random_plate() -> str:
+    return (f"TS{random.randint(1, 38):02d}{''.join(random.choices(string.ascii_uppercase, k=2))}"
+            f"{random.randint(0, 9999):04d}")
+
+
+def random_photo() -> bytes:
+    """A small photo with random content, so OCR memoization never hits."""
+    image = Image.new("RGB", (640, 480), tuple(random.randint(0, 255) for _ in range(3)))
+    image.putpixel((random.randrange(640), random.randrange(480)), (0, 0, 0))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.flows_ok = 0
+        self.flows_failed = 0
+
+    def record(self, endpoint: str, seconds: float, status):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+
+
+async def call(http: aiohttp.ClientSession, recorder: Recorder, endpoint: str, url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        async with http.post(url, **kwargs) as response:
+            body = await response.json(content_type=None)
+            status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        recorder.record(endpoint, time.perf_counter() - started, type(e).__name__)
+        return None, None
+    recorder.record(endpoint, time.perf_counter() - started, status)
+    return status, body
+
+
+async def run_flow(http: aiohttp.ClientSession, base_url: str, recorder: Recorder, mode: str, api_key=None):
+    headers = {"X-API-Key": api_key} if api_key else None
+    status, body = await call(http, recorder, "start-session", f"{base_url}/start-session", headers=headers)
+    if status != 200:
+        recorder.flows_failed += 1
+        return
+    session_id = body["session_id"]
+    ok = False
+    try:
+        form = aiohttp.FormData()
+        if mode == "image":
+            form.add_field("image", random_photo(), filename="plate.jpg", content_type="image/jpeg")
+        else:
+            form.add_field("vehicle_number", random_plate())
+        status, body = await call(http, recorder, "process-vehicle",
+                                  f"{base_url}/process-vehicle/{session_id}", data=form)
+        if status != 200:
+            return
+        if body.get("status") == "cached_result":
+            ok = True
+            return
+        status, body = await call(http, recorder, "submit-challan",
+                                  f"{base_url}/submit-challan/{session_id}", data={"captcha": "ANY"})
+        ok = status == 200 and body.get("status") == "success"
+    finally:
+        await call(http, recorder, "end-session", f"{base_url}/end-session/{session_id}")
+        if ok:
+            recorder.flows_ok += 1
+        else:
+            recorder.flows_failed += 1
+
+
+async def sample_rss(pid: int, peak: dict, stop: asyncio.Event, interval: float = 0.2):
+    while not stop.is_set():
+        rss = await asyncio.to_thread(process_tree_rss_mb, pid)
+        if rss is not None:
+            peak["rss_mb"] = max(peak.get("rss_mb", 0.0), rss)
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def wait_until_up(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(f"{base_url}/sessions/stats") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"App at {base_url} did not come up within {timeout:.0f}s")
+
+
+def start_app(args, site_url: str):
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault("CHALLAN_URL", site_url)
+    env.setdefault("LOOKUP_ENGINE", args.engine)
+    env.setdefault("OCR_CLIENT_FACTORY", "benchmarks.fake_genai:from_env")
+    env.setdefault("GOOGLE_API_KEY", "offline")
+    env.setdefault("MAX_SESSIONS", str(max(20, args.concurrency)))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env.setdefault("FAKE_OCR_LATENCY", str(args.ocr_latency))
+    if args.workers > 1:
+        # Steps of one flow may land on different workers, so they share sessions on disk
+        env.setdefault("SESSION_STORE", "sqlite")
+        env.setdefault("SESSION_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="challan-load-"), "sessions.sqlite3"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--workers", str(args.workers)],
+        cwd=ROOT,
+        env=env,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def run(args) -> dict:
+    site_runner = None
+    app_process = None
+    try:
+        if args.base_url:
+            base_url = args.base_url.rstrip("/")
+            server_pid = args.server_pid
+        else:
+            site_runner = web.AppRunner(create_site(rows=args.rows, latency=args.site_latency,
+                                                    accept_any_captcha=True))
+            await site_runner.setup()
+            site_port = free_port()
+            await web.TCPSite(site_runner, "127.0.0.1", site_port).start()
+            app_process, base_url = start_app(args, f"http://127.0.0.1:{site_port}/publicview/")
+            server_pid = app_process.pid
+        await wait_until_up(base_url)
+
+        recorder = Recorder()
+        peak = {}
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(server_pid, peak, stop)) if server_pid else None
+
+        remaining = iter(range(args.flows))
+        deadline = time.monotonic() + args.duration if args.duration else None
+
+        async def user(http, number):
+            api_key = f"load-test-{number % args.clients}" if args.clients else None
+            while deadline is None or time.monotonic() < deadline:
+                if deadline is None and next(remaining, None) is None:
+                    return
+                await run_flow(http, base_url, recorder, args.mode, api_key)
+
+        timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+        connector = aiohttp.TCPConnector(limit=args.concurrency * 2)
+        started = time.perf_counter()
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+            await asyncio.gather(*(user(http, number) for number in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        if sampler:
+            await sampler
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            try:
+                app_process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                app_process.kill()
+        if site_runner is not None:
+            await site_runner.cleanup()
+
+    return {
+        "config": {
+            "concurrency": args.concurrency,
+            "mode": args.mode,
+            "engine": args.engine if not args.base_url else None,
+            "rows": args.rows,
+        },
+        "elapsed_s": elapsed,
+        "flows_ok": recorder.flows_ok,
+        "flows_failed": recorder.flows_failed,
+        "throughput_flows_per_s": recorder.flows_ok / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak.get("rss_mb"),
+        "endpoints": {
+            endpoint: {
+                "count": len(recorder.latencies[endpoint]),
+                "statuses": dict(recorder.statuses[endpoint]),
+                "p50_ms": percentile(recorder.latencies[endpoint], 50) * 1000,
+                "p95_ms": percentile(recorder.latencies[endpoint], 95) * 1000,
+                "p99_ms": percentile(recorder.latencies[endpoint], 99) * 1000,
+                "max_ms": max(recorder.latencies[endpoint], default=0.0) * 1000,
+            }
+            for endpoint in ENDPOINTS
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':16} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+    for endpoint, stats in report["endpoints"].items():
+        statuses = ", ".join(f"{code}:{count}" for code, count in sorted(stats["statuses"].items()))
+        print(f"{endpoint:16} {stats['count']:6} {stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} "
+              f"{stats['p99_ms']:8.1f} {stats['max_ms']:8.1f}  {statuses}")
+    print()
+    print(f"flows: {report['flows_ok']} ok, {report['flows_failed']} failed in {report['elapsed_s']:.1f}s "
+          f"({report['throughput_flows_per_s']:.2f} flows/s)")
+    rss = report["peak_rss_mb"]
+    print(f"peak RSS: {rss:.0f} MB" if rss is not None else "peak RSS: n/a (no server pid)")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Returns regressions: p95 latencies or throughput worse than baseline by more than `tolerance`."""
+    regressions = []
+    for endpoint, stats in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint, {}).get("p95_ms")
+        if before and stats["count"] and stats["p95_ms"] > before * (1 + tolerance):
+            regressions.append(f"{endpoint} p95 {before:.1f} -> {stats['p95_ms']:.1f} ms")
+    before = baseline.get("throughput_flows_per_s")
+    if before and report["throughput_flows_per_s"] < before * (1 - tolerance):
+        regressions.append(f"throughput {before:.2f} -> {report['throughput_flows_per_s']:.2f} flows/s")
+    before = baseline.get("peak_rss_mb")
+    if before and report["peak_rss_mb"] and report["peak_rss_mb"] > before * (1 + tolerance):
+        regressions.append(f"peak RSS {before:.0f} -> {report['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=10, help="Simulated users running flows in parallel")
+    parser.add_argument("--flows", type=int, default=100, help="Total flows to run (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Run for this many seconds instead")
+    parser.add_argument("--mode", choices=("image", "number"), default="image",
+                        help="Upload a photo (exercises OCR) or send the vehicle number")
+    parser.add_argument("--engine", choices=("http", "selenium", "auto"), default="http",
+                        help="LOOKUP_ENGINE for the app started by this script")
+    parser.add_argument("--rows", type=int, default=3, help="Challan rows the stand-in site returns")
+    parser.add_argument("--site-latency", type=float, default=0.05, help="Seconds the stand-in site adds per response")
+    parser.add_argument("--ocr-latency", type=float, default=0.3, help="Seconds per fake OCR call")
+    parser.add_argument("--request-timeout", type=float, default=60)
+    parser.add_argument("--clients", type=int, default=0,
+                        help="Spread users over this many API keys (the upstream scheduler queues per key)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="uvicorn workers; more than one shares sessions through SESSION_STORE=sqlite")
+    parser.add_argument("--base-url", help="Load an already running app instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID of the app given by --base-url, for RSS")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare against a report saved with --json; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs. the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from driver_pool import DriverPoolExhausted
+
+logger = logging.getLogger(__name__)
+
+# WebDriver command names (selenium.webdriver.remote.command.Command)
+_SWITCH_TO_WINDOW = "switchToWindow"
+_CLOSE = "close"
+
+# The (browser, window handle) the current thread's page step works in
+_target: contextvars.ContextVar[Optional[Tuple["_Browser", str]]] = contextvars.ContextVar(
+    "browser_host_target", default=None
+)
+
+
+class _Browser:
+    """One long-lived Chrome and the tabs currently open in it.
+
+    WebDriver commands go to whichever window is current, so every command sent
+    through `driver` takes `lock` and first switches to the window of the page
+    step it belongs to. Steps in different tabs interleave command by command;
+    a step's waits and polls don't hold the browser.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.lock = threading.RLock()
+        self._execute = driver.execute
+        driver.execute = self._execute_in_target
+        # The initial window stays open so Chrome doesn't exit when the last tab closes
+        self.home_handle = driver.current_window_handle
+        self.current_handle = self.home_handle
+        self.tabs = 0
+        self.tabs_opened = 0
+        # Set once the browser should be replaced; it takes no new tabs and quits when empty
+        self.retiring = False
+
+    def run_in(self, handle: str, fn: Callable, *args, **kwargs):
+        """Runs `fn(driver, *args, **kwargs)` with every command it sends going to window `handle`."""
+        token = _target.set((self, handle))
+        try:
+            return fn(self.driver, *args, **kwargs)
+        finally:
+            _target.reset(token)
+
+    def _execute_in_target(self, command: str, params: Optional[dict] = None):
+        target = _target.get()
+        handle = target[1] if target is not None and target[0] is self else None
+        with self.lock:
+            if handle is not None and handle != self.current_handle:
+                self._execute(_SWITCH_TO_WINDOW, {"handle": handle})
+                self.current_handle = handle
+            response = self._execute(command, params)
+            if command == _SWITCH_TO_WINDOW:
+                self.current_handle = (params or {}).get("handle")
+            elif command == _CLOSE:
+                self.current_handle = None
+            return response
+
+    def quit(self):
+        """Quits without waiting for the lock, which a hung command may be holding."""
+        self.driver.execute = self._execute
+        self.driver.quit()
+
+
+class BrowserTab:
+    """A session's tab in a shared Chrome, in its own browser context.
+
+    Each context has separate cookies, storage and cache, like an incognito
+    window, so sessions sharing a browser can't see each other's site state.
+    """
+
+    def __init__(self, browser: _Browser, context_id: str, handle: str):
+        self._browser = browser
+        self.context_id = context_id
+        self.handle = handle
+        self.closed = False
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Runs `fn(driver, *args, **kwargs)` with this tab as the current window.
+
+        Each command `fn` sends switches to this tab first, so other tabs in
+        the same browser only wait for single commands, not for `fn`.
+        """
+        if self.closed:
+            raise RuntimeError("Browser tab is closed.")
+        return self._browser.run_in(self.handle, fn, *args, **kwargs)
+
+
+class BrowserHost:
+    """Serves many sessions from a few long-lived Chrome processes, one isolated tab each.
+
+    A Chrome per session costs hundreds of MB; a tab in an existing Chrome costs
+    a renderer. `open_tab()` places a session in the least busy browser with a
+    free slot, launches another browser while under `max_browsers`, and
+    otherwise waits for a tab to close. When a tab closes and
+    `should_recycle(driver)` is true for its browser, the browser stops taking
+    tabs and is quit once its last tab is gone; a new one is launched alongside.
+    """
+
+    def __init__(self, factory: Callable, max_browsers: int = 2, tabs_per_browser: int = 8,
+                 acquire_timeout: float = 30.0, on_tab_open: Optional[Callable] = None,
+                 should_recycle: Optional[Callable] = None):
+        if max_browsers < 1 or tabs_per_browser < 1:
+            raise ValueError("max_browsers and tabs_per_browser must be at least 1")
+        self.factory = factory
+        self.max_browsers = max_browsers
+        self.tabs_per_browser = tabs_per_browser
+        self.acquire_timeout = acquire_timeout
+        # Called with the driver switched to each new tab, for per-target CDP setup
+        self.on_tab_open = on_tab_open
+        self.should_recycle = should_recycle
+
+        self._browsers: List[_Browser] = []
+        self._launching = 0
+        self._cond = threading.Condition()
+        self._workers = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser-host")
+        self._started = False
+        self._closed = False
+
+        self._stats = {
+            "tabs_opened": 0,
+            "tabs_closed": 0,
+            "tab_failures": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "browsers_launched": 0,
+            "launch_failures": 0,
+            "browsers_recycled": 0,
+        }
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Launches the first browser in the background. Safe to call repeatedly."""
+        with self._cond:
+            if self._started or self._closed:
+                return
+            self._started = True
+            if self._browsers or self._launching:
+                return
+            self._launching += 1
+        try:
+            self._workers.submit(self._prelaunch)
+        except RuntimeError:
+            with self._cond:
+                self._launching -= 1
+
+    def prewarm(self):
+        """Launches the first browser on the calling thread (see DriverPool.prewarm)."""
+        with self._cond:
+            if self._closed or self._browsers or self._launching:
+                return
+            self._started = True
+            self._launching += 1
+        self._prelaunch()
+
+    def shutdown(self):
+        """Quits every browser, closing any tabs still open in them."""
+        with self._cond:
+            self._closed = True
+            browsers = list(self._browsers)
+            self._browsers.clear()
+            self._cond.notify_all()
+        for browser in browsers:
+            self._quit(browser)
+        self._workers.shutdown(wait=False)
+
+    # --- Tabs ---
+
+    def open_tab(self, timeout: Optional[float] = None) -> BrowserTab:
+        """Opens a blank tab in a fresh browser context for one session."""
+        self.start()
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited_from = None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise DriverPoolExhausted("Browser host is shut down.")
+                browser = self._least_busy()
+                if browser is not None:
+                    browser.tabs += 1
+                    break
+                if self._serving() + self._launching < self.max_browsers:
+                    self._launching += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._record_wait(waited_from)
+                    raise DriverPoolExhausted(
+                        f"No browser tab became available within {timeout:.1f}s "
+                        f"({self.max_browsers} browsers x {self.tabs_per_browser} tabs)."
+                    )
+                if waited_from is None:
+                    waited_from = time.monotonic()
+                self._cond.wait(remaining)
+            self._record_wait(waited_from)
+
+        if browser is None:
+            # Cold path: launch a browser outside the lock
+            browser = self._launch()
+            with self._cond:
+                browser.tabs += 1
+
+        try:
+            with browser.lock:
+                driver = browser.driver
+                context_id = driver.execute_cdp_cmd(
+                    "Target.createBrowserContext", {"disposeOnDetach": False}
+                )["browserContextId"]
+                # ChromeDriver's window handles are DevTools target ids
+                handle = driver.execute_cdp_cmd(
+                    "Target.createTarget", {"url": "about:blank", "browserContextId": context_id}
+                )["targetId"]
+                driver.switch_to.window(handle)
+                if self.on_tab_open:
+                    self.on_tab_open(driver)
+        except Exception:
+            with self._cond:
+                browser.tabs -= 1
+                self._stats["tab_failures"] += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            browser.tabs_opened += 1
+            self._stats["tabs_opened"] += 1
+        return BrowserTab(browser, context_id, handle)
+
+    def close_tab(self, tab: BrowserTab):
+        """Closes a session's tab and disposes of its context (cookies, storage, cache)."""
+        if tab.closed:
+            return
+        tab.closed = True
+        browser = tab._browser
+        try:
+            with browser.lock:
+                driver = browser.driver
+                driver.execute_cdp_cmd("Target.closeTarget", {"targetId": tab.handle})
+                driver.execute_cdp_cmd("Target.disposeBrowserContext", {"browserContextId": tab.context_id})
+                driver.switch_to.window(browser.home_handle)
+        except Exception as e:
+            logger.warning("Error closing browser tab %s: %s", tab.handle, e)
+        with self._cond:
+            browser.tabs -= 1
+            self._stats["tabs_closed"] += 1
+            self._cond.notify()
+        self._recycle_if_due(browser)
+
+    def browser_alive(self, tab: BrowserTab, probe: Callable) -> bool:
+        """Runs `probe(driver)` in the browser's first window, to tell a crashed tab from a crashed browser."""
+        browser = tab._browser
+        try:
+            return bool(browser.run_in(browser.home_handle, probe))
+        except Exception:
+            return False
+
+    def check_tab(self, tab: BrowserTab, probe: Callable, hung: Callable) -> bool:
+        """Runs `probe(driver)` in a tab. When it fails and `hung(driver)` says its command
+        is still in flight, the browser is quit at once: the hung command holds the
+        browser's lock, and the other tabs' commands queued behind it fail instead of
+        waiting for it."""
+        browser = tab._browser
+        alive = bool(tab.run(probe))
+        if not alive and hung(browser.driver):
+            logger.warning("Hosted browser stopped answering; quitting it and its %d tab(s)", browser.tabs)
+            self.discard_browser(tab)
+        return alive
+
+    def discard_browser(self, tab: BrowserTab):
+        """Quits the browser behind a tab that crashed; its other tabs stop working too."""
+        tab.closed = True
+        browser = tab._browser
+        with self._cond:
+            if browser not in self._browsers:
+                return
+            self._browsers.remove(browser)
+            self._cond.notify_all()
+        self._quit(browser)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "browsers": len(self._browsers),
+                "retiring": len(self._browsers) - self._serving(),
+                "launching": self._launching,
+                "open_tabs": sum(browser.tabs for browser in self._browsers),
+                "tabs_per_browser": self.tabs_per_browser,
+                "max_browsers": self.max_browsers,
+                "capacity": self.max_browsers * self.tabs_per_browser,
+            })
+        waits = stats["waits"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / waits if waits else 0.0
+        return stats
+
+    # --- Internals ---
+
+    def _least_busy(self) -> Optional[_Browser]:
+        candidates = [browser for browser in self._browsers
+                      if browser.tabs < self.tabs_per_browser and not browser.retiring]
+        return min(candidates, key=lambda browser: browser.tabs) if candidates else None
+
+    def _serving(self) -> int:
+        return sum(1 for browser in self._browsers if not browser.retiring)
+
+    def _recycle_if_due(self, browser: _Browser):
+        if not browser.retiring and self.should_recycle is not None:
+            try:
+                due = self.should_recycle(browser.driver)
+            except Exception as e:
+                logger.warning("Browser host could not check a browser for recycling: %s", e)
+                due = False
+            if due:
+                with self._cond:
+                    browser.retiring = True
+                    # Its slot is free for a replacement right away
+                    self._cond.notify_all()
+        with self._cond:
+            if not browser.retiring or browser.tabs or browser not in self._browsers:
+                return
+            self._browsers.remove(browser)
+            self._stats["browsers_recycled"] += 1
+        self._quit(browser)
+
+    def _record_wait(self, waited_from: Optional[float]):
+        if waited_from is not None:
+            self._stats["waits"] += 1
+            self._stats["wait_time_total"] += time.monotonic() - waited_from
+
+    def _launch(self) -> _Browser:
+        try:
+            browser = _Browser(self.factory())
+        except Exception:
+            with self._cond:
+                self._launching -= 1
+                self._stats["launch_failures"] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._launching -= 1
+            self._stats["browsers_launched"] += 1
+            if self._closed:
+                closed = True
+            else:
+                self._browsers.append(browser)
+                closed = False
+            self._cond.notify_all()
+        if closed:
+            self._quit(browser)
+            raise DriverPoolExhausted("Browser host is shut down.")
+        return browser
+
+    def _prelaunch(self):
+        try:
+            self._launch()
+        except Exception as e:
+            logger.error("Browser host failed to pre-launch a browser: %s", e)
+
+    @staticmethod
+    def _quit(browser: _Browser):
+        try:
+            browser.quit()
+        except Exception as e:
+            logger.warning("Error quitting hosted browser: %s", e)
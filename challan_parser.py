@@ -0,0 +1,182 @@
+import logging
+from typing import Dict, List, Optional
+
+from lxml import html as lxml_html
+
+from plate_ocr import is_valid_registration
+
+logger = logging.getLogger(__name__)
+
+
+def _text(element) -> str:
+    """Whitespace-normalized text of an element, close to what WebElement.text returns."""
+    if element is None:
+        return ""
+    return " ".join(element.text_content().split())
+
+
+def _first(elements):
+    return elements[0] if elements else None
+
+
+def find_results_table(html: str):
+    """Returns the `#rtable` element from a page or table snapshot, or None."""
+    if not html or not html.strip():
+        return None
+    root = lxml_html.fromstring(html)
+    return _first(root.xpath("descendant-or-self::*[@id='rtable']"))
+
+
+def _parse_vehicle_info(table, vehicle_number: str) -> Dict:
+    first_row = _first(table.xpath(".//tr[1]"))
+    if first_row is None:
+        return {"vehicle_number": vehicle_number}
+
+    texts = [t for t in (_text(div) for div in first_row.xpath(".//div")) if t]
+    for index, text in enumerate(texts):
+        if is_valid_registration(text.replace(" ", "").upper()):
+            # The owner name is rendered in the div right after the registration number
+            owner_name = next((t for t in texts[index + 1:] if not t.endswith(":")), None)
+            info = {"vehicle_number": text}
+            if owner_name:
+                info["owner_name"] = owner_name
+            return info
+
+    logger.warning("Could not extract vehicle/owner info from results table")
+    return {"vehicle_number": vehicle_number}
+
+
+def _parse_challan_row(row) -> Optional[Dict]:
+    # All descendant cells in document order, matching find_elements(By.TAG_NAME, "td"):
+    # the nested violation table's cells shift the fine columns to 12-15.
+    cells = row.xpath(".//td")
+    if len(cells) < 16:
+        return None
+
+    violation_table = _first(cells[8].xpath(".//table"))
+    if violation_table is None:
+        raise ValueError("violation cell has no nested table")
+
+    return {
+        "sno": _text(cells[0]),
+        "unit_name": _text(cells[2]),
+        "echallan_no": _text(cells[3]),
+        "date": _text(cells[4]),
+        "time": _text(cells[5]),
+        "place": _text(_first(cells[6].xpath(".//div"))),
+        "ps_limits": _text(_first(cells[7].xpath(".//div"))),
+        "violation": _text(_first(violation_table.xpath(".//td[1]"))),
+        "fine_amount": _text(cells[12]),
+        "user_charges": _text(cells[13]),
+        "total_fine": _text(cells[14]),
+        "has_image": "Click For Image" in _text(cells[15]),
+    }
+
+
+def _parse_grand_total(table) -> Optional[Dict]:
+    total_row = _first(table.xpath(".//tr[.//strong[contains(text(), 'Grand Total')]]"))
+    if total_row is None:
+        return None
+    total_cells = total_row.xpath(".//td")
+    if len(total_cells) < 4:
+        return None
+    return {
+        "fine_amount": _text(total_cells[-4]),
+        "user_charges": _text(total_cells[-3]),
+        "total_fine": _text(total_cells[-2]),
+    }
+
+
+def parse_results_table(table, vehicle_number: str) -> Dict:
+    """Extracts vehicle info, challan rows and the grand total from a parsed `#rtable`."""
+    challans: List[Dict] = []
+    for row in table.xpath(".//tr[.//input[@type='checkbox' and @id='manualErr']]"):
+        try:
+            challan = _parse_challan_row(row)
+        except Exception as row_error:
+            logger.warning("Error processing row: %s", row_error)
+            continue
+        if challan:
+            challans.append(challan)
+
+    return {
+        "vehicle_info": _parse_vehicle_info(table, vehicle_number),
+        "challans": challans,
+        "grand_total": _parse_grand_total(table),
+    }
+
+
+def parse_challan_html(html: str, vehicle_number: str) -> Optional[Dict]:
+    """Parses a page (or `#rtable` outerHTML) snapshot in one pass.
+
+    Returns the `data` dict used in /submit-challan responses, or None when the
+    snapshot has no results table.
+    """
+    table = find_results_table(html)
+    if table is None:
+        return None
+    return parse_results_table(table, vehicle_number)
+
+
+# --- Submission outcomes ---
+
+OUTCOME_CAPTCHA_ERROR = "captcha_error"
+OUTCOME_NO_CHALLANS = "no_challans"
+OUTCOME_TABLE = "table"
+OUTCOME_UNKNOWN = "unknown"
+
+CAPTCHA_ERROR_XPATH = "//*[contains(text(), 'Please Enter Correct Captcha')]"
+NO_CHALLANS_XPATH = "//*[contains(text(), 'No Pending') and contains(text(), 'Challans')]"
+
+
+def detect_outcome_html(html: str) -> str:
+    """Classifies a result page snapshot, in the same priority order as the browser probe."""
+    if not html or not html.strip():
+        return OUTCOME_UNKNOWN
+    root = lxml_html.fromstring(html)
+    if root.xpath(CAPTCHA_ERROR_XPATH):
+        return OUTCOME_CAPTCHA_ERROR
+    if root.xpath(NO_CHALLANS_XPATH):
+        return OUTCOME_NO_CHALLANS
+    if root.xpath("descendant-or-self::*[@id='rtable']"):
+        return OUTCOME_TABLE
+    return OUTCOME_UNKNOWN
+
+
+def build_submission_result(outcome: str, vehicle_number: str, html: Optional[str] = None) -> Dict:
+    """Builds the /submit-challan response body for a detected outcome.
+
+    `html` is the page or `#rtable` snapshot and is only needed for OUTCOME_TABLE.
+    """
+    results = {"status": "unknown", "message": "", "data": None, "outcome": outcome}
+
+    if outcome == OUTCOME_CAPTCHA_ERROR:
+        results["status"] = "error"
+        results["message"] = "Invalid captcha entered. Please try again."
+        return results
+
+    if outcome == OUTCOME_NO_CHALLANS:
+        results["status"] = "success"
+        results["message"] = "No pending challans found for this vehicle."
+        results["data"] = {
+            "vehicle_info": {"vehicle_number": vehicle_number},
+            "challans": []
+        }
+        return results
+
+    if outcome == OUTCOME_TABLE:
+        try:
+            data = parse_challan_html(html, vehicle_number)
+            if data is None:
+                raise ValueError("results snapshot did not contain #rtable")
+            results["status"] = "success"
+            results["message"] = "Challans found."
+            results["data"] = data
+            return results
+        except Exception as table_error:
+            logger.error("Error processing challan table: %s", table_error)
+
+    # If we get here, we couldn't find any of the expected elements
+    results["status"] = "error"
+    results["message"] = "Could not determine challan status. Please try again."
+    return results
@@ -0,0 +1,79 @@
+import logging
+import os
+import shutil
+import threading
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Where Lambda container images and layers conventionally put the binaries
+BAKED_CHROMEDRIVER_PATHS = ("/opt/chromedriver", "/opt/chromedriver/chromedriver", "/opt/bin/chromedriver")
+BAKED_CHROME_PATHS = ("/opt/chrome/chrome", "/opt/chrome-linux64/chrome", "/opt/bin/headless-chromium")
+CHROMEDRIVER_COMMANDS = ("chromedriver",)
+CHROME_COMMANDS = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+
+
+class ChromePaths(NamedTuple):
+    chromedriver: Optional[str]
+    chrome: Optional[str]
+    # Where the chromedriver path came from: env, baked, path, webdriver_manager or none
+    source: str
+
+
+def running_on_lambda() -> bool:
+    return bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+
+def _executable(path: str) -> Optional[str]:
+    return path if os.path.isfile(path) and os.access(path, os.X_OK) else None
+
+
+def _find(env_var: str, baked_paths, commands):
+    """Returns (path, source) from the env var, a baked-in location or PATH."""
+    configured = os.getenv(env_var)
+    if configured:
+        return configured, "env"
+    for path in baked_paths:
+        if _executable(path):
+            return path, "baked"
+    for command in commands:
+        path = shutil.which(command)
+        if path:
+            return path, "path"
+    return None, "none"
+
+
+_resolved: Optional[ChromePaths] = None
+_lock = threading.Lock()
+
+
+def resolve_chrome_paths() -> ChromePaths:
+    """Finds chromedriver and the Chrome binary once per process.
+
+    Checks CHROMEDRIVER_PATH / CHROME_BINARY, then the baked-in /opt locations,
+    then PATH. webdriver_manager is only used as a last resort outside Lambda
+    (and can be switched off with CHROMEDRIVER_AUTO_INSTALL=0): it downloads
+    over the network, which a Lambda image neither can nor should do on every
+    cold start. A None chromedriver leaves the lookup to Selenium itself.
+    """
+    global _resolved
+    with _lock:
+        if _resolved is not None:
+            return _resolved
+
+        chromedriver, source = _find("CHROMEDRIVER_PATH", BAKED_CHROMEDRIVER_PATHS, CHROMEDRIVER_COMMANDS)
+        chrome, _ = _find("CHROME_BINARY", BAKED_CHROME_PATHS, CHROME_COMMANDS)
+
+        auto_install = os.getenv("CHROMEDRIVER_AUTO_INSTALL", "1").lower() not in ("0", "false", "no", "off")
+        if chromedriver is None and auto_install and not running_on_lambda():
+            try:
+                from webdriver_manager.chrome import ChromeDriverManager
+                chromedriver, source = ChromeDriverManager().install(), "webdriver_manager"
+            except Exception as e:
+                logger.warning("webdriver-manager could not install chromedriver: %s", e)
+
+        _resolved = ChromePaths(chromedriver, chrome, source)
+        logger.info("Resolved Chrome paths", extra={
+            "chromedriver": chromedriver, "chrome": chrome, "chromedriver_source": source,
+        })
+        return _resolved
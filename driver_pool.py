@@ -0,0 +1,269 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPoolExhausted(RuntimeError):
+    """Raised when no driver could be checked out before the acquire timeout."""
+
+
+class DriverPool:
+    """Keeps a set of started WebDrivers ready so sessions don't pay for a cold Chrome launch.
+
+    Idle drivers are parked on `park_url` so the first navigation of a session
+    hits a warm connection and cache. `acquire()` hands out an idle driver
+    immediately when one exists, creates one if the pool is below `max_size`,
+    and otherwise waits for a driver to be released. Released drivers for which
+    `should_recycle(driver)` is true are quit and replaced instead of reused.
+    """
+
+    def __init__(self, factory: Callable, min_size: int = 1, max_size: int = 4,
+                 park_url: Optional[str] = None, acquire_timeout: float = 30.0,
+                 should_recycle: Optional[Callable] = None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.factory = factory
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.park_url = park_url
+        self.acquire_timeout = acquire_timeout
+        self.should_recycle = should_recycle
+
+        self._idle = deque()
+        self._total = 0  # idle + checked out + being created
+        self._cond = threading.Condition()
+        self._workers = ThreadPoolExecutor(max_workers=2, thread_name_prefix="driver-pool")
+        self._started = False
+        self._closed = False
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "created": 0,
+            "create_failures": 0,
+            "released": 0,
+            "reset_failures": 0,
+            "discarded": 0,
+            "recycled": 0,
+        }
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Begins warming the pool up to `min_size` in the background. Safe to call repeatedly."""
+        with self._cond:
+            if self._started or self._closed:
+                return
+            self._started = True
+        self._schedule_refill()
+
+    def prewarm(self):
+        """Creates drivers up to `min_size` on the calling thread.
+
+        Used during Lambda init, where work started at import time is not billed
+        against the first request but background threads are frozen once the
+        handler returns.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._started = True
+            missing = min(self.min_size - len(self._idle), self.max_size - self._total)
+            if missing <= 0:
+                return
+            self._total += missing
+        for _ in range(missing):
+            self._create_idle()
+
+    def shutdown(self):
+        """Quits every idle driver and stops handing out new ones."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for driver in idle:
+            self._quit(driver)
+        self._workers.shutdown(wait=False)
+
+    # --- Checkout / return ---
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Checks out a ready driver, creating one if the pool has spare capacity."""
+        self.start()
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited_from = None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise DriverPoolExhausted("Driver pool is shut down.")
+                if self._idle:
+                    driver = self._idle.popleft()
+                    if waited_from is None:
+                        self._stats["hits"] += 1
+                    else:
+                        self._record_wait(time.monotonic() - waited_from)
+                    break
+                if self._total < self.max_size:
+                    self._total += 1
+                    self._stats["misses"] += 1
+                    if waited_from is not None:
+                        self._record_wait(time.monotonic() - waited_from)
+                    driver = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if waited_from is not None:
+                        self._record_wait(time.monotonic() - waited_from)
+                    raise DriverPoolExhausted(
+                        f"No driver became available within {timeout:.1f}s (max_size={self.max_size})."
+                    )
+                if waited_from is None:
+                    waited_from = time.monotonic()
+                self._cond.wait(remaining)
+
+        if driver is None:
+            # Cold path: build the driver outside the lock.
+            try:
+                driver = self.factory()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._stats["create_failures"] += 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["created"] += 1
+
+        self._schedule_refill()
+        return driver
+
+    def release(self, driver):
+        """Returns a driver to the pool. It is reset and re-parked in the background."""
+        with self._cond:
+            self._stats["released"] += 1
+        try:
+            self._workers.submit(self._reset_and_return, driver)
+        except RuntimeError:
+            # Executor already shut down
+            self.discard(driver)
+
+    def discard(self, driver):
+        """Quits a driver that should not be reused (crashed, poisoned) and frees its slot."""
+        self._quit(driver)
+        with self._cond:
+            self._total -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+        self._schedule_refill()
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "idle": len(self._idle),
+                "in_use": self._total - len(self._idle),
+                "total": self._total,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        waits = stats["waits"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / waits if waits else 0.0
+        return stats
+
+    # --- Internals ---
+
+    def _record_wait(self, seconds: float):
+        self._stats["waits"] += 1
+        self._stats["wait_time_total"] += seconds
+        self._stats["wait_time_max"] = max(self._stats["wait_time_max"], seconds)
+
+    def _schedule_refill(self):
+        with self._cond:
+            if self._closed:
+                return
+            missing = min(self.min_size - len(self._idle), self.max_size - self._total)
+            if missing <= 0:
+                return
+            self._total += missing
+        for _ in range(missing):
+            try:
+                self._workers.submit(self._create_idle)
+            except RuntimeError:
+                with self._cond:
+                    self._total -= 1
+
+    def _create_idle(self):
+        try:
+            driver = self.factory()
+            self._park(driver)
+        except Exception as e:
+            logger.error("Driver pool failed to pre-warm a driver: %s", e)
+            with self._cond:
+                self._total -= 1
+                self._stats["create_failures"] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._stats["created"] += 1
+        self._return_idle(driver)
+
+    def _reset_and_return(self, driver):
+        try:
+            recycle = self.should_recycle is not None and self.should_recycle(driver)
+        except Exception as e:
+            logger.warning("Driver pool could not check a returned driver for recycling: %s", e)
+            recycle = False
+        if recycle:
+            with self._cond:
+                self._stats["recycled"] += 1
+            self.discard(driver)
+            return
+        try:
+            driver.delete_all_cookies()
+            try:
+                driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+            except Exception:
+                pass  # Storage may be unavailable on the current origin
+            self._park(driver)
+        except Exception as e:
+            logger.warning("Driver pool failed to reset a returned driver, discarding it: %s", e)
+            with self._cond:
+                self._stats["reset_failures"] += 1
+            self.discard(driver)
+            return
+        self._return_idle(driver)
+
+    def _park(self, driver):
+        if self.park_url:
+            driver.get(self.park_url)
+
+    def _return_idle(self, driver):
+        with self._cond:
+            if self._closed:
+                self._total -= 1
+                closed = True
+            else:
+                self._idle.append(driver)
+                closed = False
+                self._cond.notify()
+        if closed:
+            self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning("Error quitting pooled driver: %s", e)
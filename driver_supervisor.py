@@ -0,0 +1,196 @@
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+from session_manager import process_tree_rss_mb
+
+logger = logging.getLogger(__name__)
+
+# Error text WebDriver gives when the browser behind it is gone rather than the page misbehaving
+_CRASH_MARKERS = (
+    "chrome not reachable",
+    "tab crashed",
+    "session deleted",
+    "invalid session id",
+    "no such window",
+    "target window already closed",
+    "disconnected",
+    "connection refused",
+    "max retries exceeded",
+    "timed out receiving message from renderer",
+)
+
+RECYCLE_USES = "uses"
+RECYCLE_RSS = "rss"
+
+
+class DriverSupervisor:
+    """Keeps session browsers healthy.
+
+    `check_before_use()` is a cheap liveness probe run before every page step:
+    chromedriver must still be running and the page must answer a trivial
+    script within `probe_timeout`. `is_crash()` tells a dead browser from an
+    ordinary page error. `recycle_reason()` is asked when a browser goes back to
+    the pool (or a shared browser's tab closes) and says whether it has served
+    `max_uses` steps or grown past `max_rss_mb`, so it is replaced instead of
+    reused. Replacing and restoring sessions is left to the caller, which knows
+    where the browser came from.
+
+    A probe that times out is abandoned, not stopped: its command is still in
+    flight until the browser answers or is quit. `probe_pending()` says so, and
+    the driver fails every probe until then without starting another one. A
+    caller sharing the driver between sessions should quit it before letting
+    anyone else send it commands.
+    """
+
+    def __init__(self, probe_timeout: float = 3.0, max_uses: int = 100, max_rss_mb: float = 0.0):
+        self.probe_timeout = probe_timeout
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+
+        self._uses = weakref.WeakKeyDictionary()
+        # Probes still running per driver; a hung browser blocks its probe until
+        # the browser is quit, so each probe gets its own thread rather than a
+        # slot in a shared pool that hung browsers could use up
+        self._pending = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {
+            "probes": 0,
+            "probe_failures": 0,
+            "probe_timeouts": 0,
+            "probe_time_total": 0.0,
+            "crashes": 0,
+            "restarts": 0,
+            "restart_failures": 0,
+            "recycled_uses": 0,
+            "recycled_rss": 0,
+        }
+
+    # --- Liveness ---
+
+    def check_before_use(self, driver) -> bool:
+        """Probes a driver about to run a step; a live driver's use count goes up."""
+        alive = self.is_alive(driver)
+        if alive:
+            with self._lock:
+                self._uses[driver] = self._uses.get(driver, 0) + 1
+        return alive
+
+    def is_alive(self, driver) -> bool:
+        """The probe alone, without counting a use."""
+        if not self.probe_timeout:
+            return True
+        started = time.perf_counter()
+        alive = self._probe(driver)
+        with self._lock:
+            self._stats["probes"] += 1
+            self._stats["probe_time_total"] += time.perf_counter() - started
+            if not alive:
+                self._stats["probe_failures"] += 1
+        return alive
+
+    def probe_pending(self, driver) -> bool:
+        """Whether an earlier probe of this driver timed out and is still waiting for it."""
+        with self._lock:
+            done = self._pending.get(driver)
+        return done is not None and not done.is_set()
+
+    def _probe(self, driver) -> bool:
+        process = getattr(getattr(driver, "service", None), "process", None)
+        if process is not None and process.poll() is not None:
+            return False  # chromedriver exited
+        if self.probe_pending(driver):
+            return False  # Still hung on the last probe
+        done = threading.Event()
+        outcome = {}
+
+        def probe():
+            try:
+                outcome["result"] = driver.execute_script("return 1")
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        with self._lock:
+            self._pending[driver] = done
+        # In the caller's context, so a hosted tab's probe runs in that tab
+        threading.Thread(target=contextvars.copy_context().run, args=(probe,), name="driver-probe",
+                         daemon=True).start()
+        if not done.wait(self.probe_timeout):
+            logger.warning("Browser failed its liveness probe: no answer within %.1fs", self.probe_timeout)
+            with self._lock:
+                self._stats["probe_timeouts"] += 1
+            return False
+        if "error" in outcome:
+            error = outcome["error"]
+            logger.warning("Browser failed its liveness probe: %s", error or type(error).__name__)
+            return False
+        return outcome.get("result") == 1
+
+    @staticmethod
+    def is_crash(exc: BaseException) -> bool:
+        """Whether an exception from a page step means the browser itself died or hung up."""
+        from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException
+
+        seen = set()
+        while exc is not None and id(exc) not in seen:
+            seen.add(id(exc))
+            if isinstance(exc, (InvalidSessionIdException, NoSuchWindowException, ConnectionError)):
+                return True
+            message = str(exc).lower()
+            if any(marker in message for marker in _CRASH_MARKERS):
+                return True
+            exc = exc.__cause__ or exc.__context__
+        return False
+
+    # --- Recycling ---
+
+    def uses(self, driver) -> int:
+        with self._lock:
+            return self._uses.get(driver, 0)
+
+    def recycle_reason(self, driver) -> Optional[str]:
+        """RECYCLE_USES or RECYCLE_RSS when a driver should be quit instead of reused, else None."""
+        if self.max_uses and self.uses(driver) >= self.max_uses:
+            reason = RECYCLE_USES
+        elif self.max_rss_mb and (self.rss_mb(driver) or 0) >= self.max_rss_mb:
+            reason = RECYCLE_RSS
+        else:
+            return None
+        with self._lock:
+            self._stats[f"recycled_{reason}"] += 1
+        return reason
+
+    @staticmethod
+    def rss_mb(driver) -> Optional[float]:
+        """Memory of chromedriver and the Chrome processes under it."""
+        process = getattr(getattr(driver, "service", None), "process", None)
+        if process is None:
+            return None
+        return process_tree_rss_mb(process.pid)
+
+    # --- Bookkeeping for the caller's replacements ---
+
+    def record_crash(self):
+        with self._lock:
+            self._stats["crashes"] += 1
+
+    def record_restart(self, ok: bool = True):
+        with self._lock:
+            self._stats["restarts" if ok else "restart_failures"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        probes = stats["probes"]
+        stats["probe_time_avg"] = stats["probe_time_total"] / probes if probes else 0.0
+        stats.update({
+            "probe_timeout": self.probe_timeout,
+            "max_uses": self.max_uses,
+            "max_rss_mb": self.max_rss_mb,
+        })
+        return stats
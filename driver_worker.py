@@ -0,0 +1,320 @@
+"""Hosts the Chrome drivers in their own process so any API worker can drive any session.
+
+Run one (or a few) next to the API workers:
+
+    python driver_worker.py --listen unix:/tmp/challan-driver.sock
+    DRIVER_WORKERS=unix:/tmp/challan-driver.sock SESSION_STORE=sqlite uvicorn app:app --workers 4
+
+The protocol is one JSON object per line in each direction, over TCP
+(`host:port`) or a Unix socket (`unix:/path`). Requests carry an `op`:
+
+- `open {session_id}` checks a browser out of the worker's pool (or tabs).
+- `run {session_id, fn, args, state}` runs one of the page steps in app.py on
+  the session's browser. `state` is the session's form state as the API
+  worker knows it; the reply has the updated `state`, the step's `result` and
+  the stage timings it recorded. A step that fails with an HTTPException
+  replies with kind `http` and its `status`, `detail` and `headers`, which
+  the API worker raises again as the same HTTPException.
+- `close {session_id}` releases the browser.
+- `stats` reports the worker's sessions and pool.
+
+Replies are `{"ok": true, ...}` or `{"ok": false, "kind": ..., "error": ...}`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+from driver_pool import DriverPoolExhausted
+from instrumentation import begin_request, end_request, record_stage
+from session_manager import SessionLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+# Session data the page steps read or write; everything else stays on its side
+BROWSER_STATE_KEYS = ("cookies", "base_url", "hidden_fields", "form_action", "frame_index", "vehicle_number")
+# Page steps a worker will run; they take (driver, session_data, *args)
+BROWSER_STEPS = ("_load_captcha_page", "_refresh_captcha_in_page", "_submit_challan_form")
+
+# Lines carry captcha screenshots and result tables
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+
+class DriverWorkerError(RuntimeError):
+    """A driver worker could not be reached or could not complete a request."""
+
+    def __init__(self, message: str, kind: str = "error"):
+        super().__init__(message)
+        self.kind = kind
+
+
+def _parse_address(address: str):
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+# --- Client side (API workers) ---
+
+class DriverWorkerClient:
+    """Blocking client for one driver worker; a connection per call keeps it thread-safe."""
+
+    def __init__(self, address: str, timeout: float = 120.0):
+        self.address = address
+        self.timeout = timeout
+        self._family, self._target = _parse_address(address)
+
+    def call(self, op: str, **params) -> Dict:
+        request = json.dumps(dict(params, op=op)).encode() + b"\n"
+        try:
+            with socket.socket(self._family, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self._target)
+                sock.sendall(request)
+                with sock.makefile("rb") as stream:
+                    line = stream.readline()
+        except OSError as e:
+            raise DriverWorkerError(f"Driver worker {self.address} is unreachable: {e}", kind="unreachable") from e
+        if not line:
+            raise DriverWorkerError(f"Driver worker {self.address} closed the connection", kind="unreachable")
+
+        reply = json.loads(line)
+        if reply.get("ok"):
+            return reply
+        kind = reply.get("kind", "error")
+        if kind == "limit":
+            raise SessionLimitExceeded(reply.get("error", "Driver worker is at its session limit"),
+                                       retry_after=reply.get("retry_after") or 1)
+        if kind == "exhausted":
+            raise DriverPoolExhausted(reply.get("error", "Driver worker is at capacity"))
+        if kind == "http":
+            raise HTTPException(status_code=reply.get("status", 500), detail=reply.get("detail"),
+                                headers=reply.get("headers"))
+        raise DriverWorkerError(reply.get("error", "Driver worker request failed"), kind=kind)
+
+
+class RemoteBrowser:
+    """A session's browser hosted by a driver worker; stands in for a local driver or tab."""
+
+    def __init__(self, client: DriverWorkerClient, session_id: str):
+        self.client = client
+        self.session_id = session_id
+
+    @property
+    def address(self) -> str:
+        return self.client.address
+
+    def run(self, step: str, session_data: Dict, *args):
+        """Runs a page step remotely and merges the state it changed into `session_data`.
+
+        Raises the step's HTTPException, status and detail as the worker saw them.
+        """
+        reply = self.client.call(
+            "run",
+            session_id=self.session_id,
+            fn=step,
+            args=list(args),
+            state={key: session_data[key] for key in BROWSER_STATE_KEYS if key in session_data},
+        )
+        session_data.update(reply["state"])
+        # Stage timings measured in the worker show up in this request's Server-Timing
+        for name, seconds in reply.get("stages", []):
+            record_stage(name, seconds)
+        return reply["result"]
+
+    def close(self):
+        self.client.call("close", session_id=self.session_id)
+
+
+class DriverWorkerGroup:
+    """The driver workers an API worker can use; new sessions go round-robin."""
+
+    def __init__(self, addresses: List[str], timeout: float = 120.0):
+        self.clients = [DriverWorkerClient(address, timeout) for address in addresses]
+        self._by_address = {client.address: client for client in self.clients}
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def open(self, session_id: str) -> RemoteBrowser:
+        """Checks out a browser on the first worker, in round-robin order, that has one free."""
+        with self._lock:
+            start = next(self._next)
+        failures = []
+        retry_after = []
+        for offset in range(len(self.clients)):
+            client = self.clients[(start + offset) % len(self.clients)]
+            try:
+                client.call("open", session_id=session_id)
+                return RemoteBrowser(client, session_id)
+            except (DriverPoolExhausted, DriverWorkerError, SessionLimitExceeded) as e:
+                logger.warning("Driver worker %s could not open a browser: %s", client.address, e)
+                failures.append(str(e))
+                if isinstance(e, SessionLimitExceeded):
+                    retry_after.append(e.retry_after)
+        if retry_after and len(retry_after) == len(failures):
+            # Every worker is at its session limit; the soonest free slot is the hint
+            raise SessionLimitExceeded("; ".join(failures), retry_after=min(retry_after))
+        raise DriverPoolExhausted("; ".join(failures) or "No driver workers configured")
+
+    def browser(self, address: str, session_id: str) -> RemoteBrowser:
+        """The handle for a browser another API worker opened."""
+        client = self._by_address.get(address) or DriverWorkerClient(address, self.clients[0].timeout)
+        return RemoteBrowser(client, session_id)
+
+    def stats(self) -> List[Dict]:
+        stats = []
+        for client in self.clients:
+            try:
+                reply = client.call("stats")
+                reply.pop("ok", None)
+                stats.append(dict(reply, address=client.address))
+            except (DriverPoolExhausted, DriverWorkerError) as e:
+                stats.append({"address": client.address, "error": str(e)})
+        return stats
+
+
+# --- Server side (the driver worker process) ---
+
+class DriverWorkerServer:
+    """Serves the protocol on top of app.py's own pool, tab host and page steps."""
+
+    def __init__(self, app_module):
+        self.app = app_module
+        self.requests = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = await self.dispatch(json.loads(line))
+                except Exception as e:
+                    logger.exception("Driver worker request failed")
+                    reply = {"ok": False, "kind": "error", "error": str(e)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Dict) -> Dict:
+        self.requests += 1
+        op = request.get("op")
+        session_id = request.get("session_id")
+        app = self.app
+
+        if op == "stats":
+            return {
+                "ok": True,
+                "requests": self.requests,
+                "mode": app.BROWSER_MODE,
+                "sessions": app.session_manager.stats(),
+                "driver_pool": app.driver_pool.stats(),
+                "browser_host": app.browser_host.stats(),
+            }
+        if not session_id:
+            return {"ok": False, "kind": "bad_request", "error": "session_id is required"}
+
+        if op == "open":
+            if session_id in app.active_sessions:
+                return {"ok": True}
+            try:
+                async with app.session_manager.admission():
+                    browser = await asyncio.to_thread(app._acquire_browser, session_id)
+                    app.session_manager.add(session_id, dict(browser, engine=app.ENGINE_SELENIUM))
+            except app.SessionLimitExceeded as e:
+                return {"ok": False, "kind": "limit", "error": str(e), "retry_after": e.retry_after}
+            except DriverPoolExhausted as e:
+                return {"ok": False, "kind": "exhausted", "error": str(e)}
+            logger.info("Browser opened", extra={"session_id": session_id})
+            return {"ok": True}
+
+        if op == "close":
+            return {"ok": True, "closed": app.close_session_sync(session_id)}
+
+        if op == "run":
+            step = request.get("fn")
+            if step not in BROWSER_STEPS:
+                return {"ok": False, "kind": "bad_request", "error": f"Unknown page step '{step}'"}
+            session_data = app.active_sessions.get(session_id)
+            if session_data is None:
+                return {"ok": False, "kind": "not_found", "error": "No browser open for this session"}
+            session_data.update(request.get("state") or {})
+            token = begin_request()
+            try:
+                async with app.session_manager.activity(session_id):
+                    result = await app.run_in_browser(session_id, getattr(app, step), *request.get("args", []))
+            except HTTPException as e:
+                return {"ok": False, "kind": "http", "error": str(e.detail), "status": e.status_code,
+                        "detail": e.detail, "headers": e.headers}
+            except Exception as e:
+                logger.exception("Page step failed", extra={"session_id": session_id})
+                return {"ok": False, "kind": "step_failed", "error": str(e)}
+            finally:
+                stages = end_request(token)
+            return {
+                "ok": True,
+                "result": result,
+                "state": {key: session_data[key] for key in BROWSER_STATE_KEYS if key in session_data},
+                "stages": stages,
+            }
+
+        return {"ok": False, "kind": "bad_request", "error": f"Unknown op '{op}'"}
+
+
+async def serve(address: str):
+    # This process is where the browsers live, so app.py must not forward to itself
+    os.environ.pop("DRIVER_WORKERS", None)
+    # Session state is the API workers' business; leases here are per-process
+    os.environ["SESSION_STORE"] = "memory"
+    os.environ.setdefault("LOOKUP_ENGINE", "selenium")
+    import app
+
+    server = DriverWorkerServer(app)
+    family, target = _parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(target):
+            os.unlink(target)
+        listener = await asyncio.start_unix_server(server.handle, path=target, limit=MAX_LINE_BYTES)
+    else:
+        listener = await asyncio.start_server(server.handle, *target, limit=MAX_LINE_BYTES)
+
+    if app.BROWSER_MODE == app.BROWSER_MODE_TABS:
+        app.browser_host.start()
+    else:
+        app.driver_pool.start()
+    app.session_manager.start_reaper()
+    logger.info("Driver worker listening on %s (%s mode)", address, app.BROWSER_MODE)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    async with listener:
+        await stop.wait()
+    await app.shutdown_driver_pool()
+    logger.info("Driver worker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listen", default=os.getenv("DRIVER_WORKER_LISTEN", "127.0.0.1:8765"),
+                        help="host:port or unix:/path to listen on")
+    args = parser.parse_args()
+    asyncio.run(serve(args.listen))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,627 @@
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from result_cache import normalize_vehicle_number
+from upstream_scheduler import UpstreamBusy
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"        # Waiting for a session
+LOADING = "loading"        # Session opening or captcha page loading
+READY = "ready"            # Captcha loaded, waiting for the operator
+QUEUED = "queued"          # Solved, waiting for a submission worker
+SUBMITTING = "submitting"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL = (DONE, FAILED, CANCELLED)
+STATUSES = (PENDING, LOADING, READY, QUEUED, SUBMITTING, DONE, FAILED, CANCELLED)
+
+# Item fields written to the batch store; sessions and captchas don't survive a restart
+_ITEM_STATE_KEYS = ("index", "vehicle_number", "status", "attempts", "cached", "result", "error")
+
+
+class BatchHeldElsewhere(RuntimeError):
+    """The batch is running in another process; `retry_after` is when its lease runs out."""
+
+    def __init__(self, message: str, owner: str, retry_after: int):
+        super().__init__(message)
+        self.owner = owner
+        self.retry_after = retry_after
+
+
+class FleetBatch:
+    """One list of vehicles worked through by an operator.
+
+    Up to `lookahead` vehicles at a time have a session open and their captcha
+    loaded before the operator gets to them. Solved captchas go on a queue that
+    submission workers drain in the background, so the operator moves straight
+    on to the next captcha. A wrong captcha sends the vehicle back for another
+    one in the same session, up to `max_attempts` submissions.
+    """
+
+    def __init__(self, manager: "FleetBatches", batch_id: str, client_id: str, items: List[Dict],
+                 created_at: Optional[float] = None, finished: Optional[List[int]] = None,
+                 force_refresh: bool = False):
+        self.manager = manager
+        self.batch_id = batch_id
+        self.client_id = client_id
+        self.items = items
+        # Skip the result cache and query the site for every vehicle
+        self.force_refresh = force_refresh
+        self.created_at = created_at or time.time()
+        self.updated_at = self.created_at
+        # Item indexes in the order they reached a final status; the NDJSON results follow it
+        self.finished: List[int] = finished or []
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._tasks = set()
+        self._changed = asyncio.Event()
+        self._cancelled = False
+        # Set when another process has taken the batch over
+        self._stopped = False
+        self._stats = {
+            "captchas_served": 0,
+            "captchas_reloaded": 0,
+            "operator_wait_total": 0.0,
+            "operator_waits": 0,
+            "solve_time_total": 0.0,
+            "submit_time_total": 0.0,
+            "submissions": 0,
+        }
+
+    # --- Operator ---
+
+    async def next_captcha(self, exclude: Iterable[int] = (), wait: float = 0.0) -> Dict:
+        """The lowest-index loaded captcha not in `exclude`, waiting up to `wait` seconds for one."""
+        exclude = set(exclude)
+        deadline = time.monotonic() + wait
+        waited_since = None
+        while True:
+            item = self._take_ready(exclude)
+            if item is not None or self.done or self._cancelled or self._stopped:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            waited_since = waited_since or time.monotonic()
+            self._fill()
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        if waited_since is not None:
+            # Time the operator sat in front of an empty queue: what lookahead is meant to remove
+            self._stats["operator_wait_total"] += time.monotonic() - waited_since
+            self._stats["operator_waits"] += 1
+
+        if item is None:
+            return {"status": "done" if self.done else "waiting", "progress": self.progress()}
+        self._stats["captchas_served"] += 1
+        item["served_at"] = time.monotonic()
+        return {
+            "status": "captcha",
+            "index": item["index"],
+            "vehicle_number": item["vehicle_number"],
+            "attempt": item["attempts"] + 1,
+            "captcha_image": item["captcha_image"],
+            "progress": self.progress(),
+        }
+
+    def _take_ready(self, exclude) -> Optional[Dict]:
+        for item in self.items:
+            if item["status"] != READY or item["index"] in exclude:
+                continue
+            if time.monotonic() - item["ready_at"] > self.manager.captcha_max_age:
+                # The site may have expired it; load a new one in the same session
+                self._stats["captchas_reloaded"] += 1
+                self._start_reload(item)
+                continue
+            return item
+        return None
+
+    def solve(self, index: int, captcha: str) -> Dict:
+        """Queues a solved captcha for submission and returns at once."""
+        item = self._item(index)
+        if item["status"] != READY:
+            raise ValueError(f"Vehicle {index} has no captcha waiting (status: {item['status']}).")
+        item.update(status=QUEUED, captcha=captcha, captcha_image=None, solved_at=time.monotonic())
+        if item.get("served_at"):
+            self._stats["solve_time_total"] += item["solved_at"] - item["served_at"]
+        self._start_workers()
+        self._queue.put_nowait(item)
+        self._touch()
+        self._fill()
+        return {"index": index, "status": QUEUED}
+
+    def refresh(self, index: int) -> Dict:
+        """Loads a new captcha for a vehicle whose captcha the operator can't read."""
+        item = self._item(index)
+        if item["status"] != READY:
+            raise ValueError(f"Vehicle {index} has no captcha waiting (status: {item['status']}).")
+        self._stats["captchas_reloaded"] += 1
+        self._start_reload(item)
+        return {"index": index, "status": LOADING}
+
+    def cancel(self):
+        """Stops the batch; vehicles not finished yet are marked cancelled and their sessions closed."""
+        self._cancelled = True
+        for task in list(self._tasks) + self._workers:
+            task.cancel()
+        for item in self.items:
+            if item["status"] not in FINAL:
+                self._finish(item, CANCELLED)
+        self._touch()
+
+    def stop(self):
+        """Stops working on the batch here without changing it; another process takes it over."""
+        self._stopped = True
+        for task in list(self._tasks) + self._workers:
+            task.cancel()
+        for item in self.items:
+            self._close_session(item)
+        self._touch()  # Ends result streams following the batch
+
+    def _item(self, index: int) -> Dict:
+        if not 0 <= index < len(self.items):
+            raise IndexError(f"No vehicle {index} in this batch.")
+        return self.items[index]
+
+    # --- Pipeline ---
+
+    def _fill(self):
+        """Starts loading captchas for pending vehicles until `lookahead` are loading or loaded."""
+        if self._cancelled or self._stopped:
+            return
+        warm = sum(1 for item in self.items if item["status"] in (LOADING, READY))
+        for item in self.items:
+            if warm >= self.manager.lookahead:
+                break
+            if item["status"] == PENDING:
+                item["status"] = LOADING
+                self._spawn(self._prepare(item))
+                warm += 1
+
+    async def _prepare(self, item: Dict):
+        cached = self.manager.cached(item["vehicle_number"]) if not self.force_refresh else None
+        if cached is not None:
+            self._finish(item, DONE, result=cached, cached=True)
+            return
+        while True:
+            try:
+                item["session_id"] = await self._open_session(item)
+                item.update(status=READY, captcha_image=await self.manager.load_captcha(item["session_id"]),
+                            ready_at=time.monotonic())
+                self._touch()
+                return
+            except UpstreamBusy as e:
+                self._close_session(item)
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.warning("Batch %s: could not load a captcha for %s: %s", self.batch_id,
+                               item["vehicle_number"], e)
+                self._retry_or_fail(item, f"Could not load captcha: {e}", count_attempt=True)
+                return
+
+    async def _open_session(self, item: Dict) -> str:
+        opening = asyncio.ensure_future(self.manager.open_session(self.client_id, item["vehicle_number"]))
+        try:
+            return await asyncio.shield(opening)
+        except asyncio.CancelledError:
+            # Opening carries on in a browser thread; close the session once it exists
+            opening.add_done_callback(self._close_opened)
+            raise
+
+    def _close_opened(self, opening: asyncio.Future):
+        if not opening.cancelled() and opening.exception() is None:
+            self._close_session({"session_id": opening.result()})
+
+    def _start_reload(self, item: Dict):
+        # Marked right away so the item isn't handed out or reloaded twice meanwhile
+        item.update(status=LOADING, captcha_image=None)
+        self._spawn(self._reload(item))
+
+    async def _reload(self, item: Dict):
+        while True:
+            try:
+                item.update(status=READY, captcha_image=await self.manager.load_captcha(item["session_id"]),
+                            ready_at=time.monotonic())
+                self._touch()
+                return
+            except UpstreamBusy as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.warning("Batch %s: could not reload the captcha for %s: %s", self.batch_id,
+                               item["vehicle_number"], e)
+                self._retry_or_fail(item, f"Could not load captcha: {e}", count_attempt=True)
+                return
+
+    def _start_workers(self):
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.manager.submit_concurrency:
+            self._workers.append(asyncio.create_task(self._submit_worker()))
+
+    async def _submit_worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._submit(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Batch %s: submission worker error", self.batch_id)
+
+    async def _submit(self, item: Dict):
+        if item["status"] != QUEUED:
+            return  # Cancelled while queued
+        item["status"] = SUBMITTING
+        started = time.monotonic()
+        try:
+            result = await self.manager.submit(item["session_id"], item["vehicle_number"], item["captcha"])
+        except UpstreamBusy as e:
+            # Never sent. The captcha is still good for a while; wait for the upstream queue to drain
+            item["status"] = QUEUED
+            await asyncio.sleep(e.retry_after)
+            if item["status"] == QUEUED:
+                self._queue.put_nowait(item)
+            return
+        except Exception as e:
+            self._record_submission(started)
+            item.pop("captcha", None)
+            item["attempts"] += 1
+            logger.warning("Batch %s: submission for %s failed: %s", self.batch_id, item["vehicle_number"], e)
+            self._retry_or_fail(item, f"Submission failed: {e}")
+            return
+        self._record_submission(started)
+
+        item.pop("captcha", None)
+        item["attempts"] += 1
+        if result.get("status") == "success":
+            self._finish(item, DONE, result=result)
+        elif item["attempts"] >= self.manager.max_attempts:
+            self._finish(item, FAILED, result=result, error=result.get("message"))
+        elif result.get("captcha_image"):
+            # The page already shows the next captcha
+            item.update(status=READY, captcha_image=result["captcha_image"], ready_at=time.monotonic(),
+                        error=result.get("message"))
+            self._touch()
+        else:
+            item["error"] = result.get("message")
+            self._start_reload(item)
+
+    def _record_submission(self, started: float):
+        self._stats["submissions"] += 1
+        self._stats["submit_time_total"] += time.monotonic() - started
+
+    def _retry_or_fail(self, item: Dict, error: str, count_attempt: bool = False):
+        """Starts the vehicle over in a new session, or fails it once it has used up its attempts."""
+        self._close_session(item)
+        if count_attempt:
+            # A captcha that never loads uses up attempts too, so the vehicle can't loop forever
+            item["attempts"] += 1
+        if item["attempts"] >= self.manager.max_attempts or self._cancelled:
+            self._finish(item, FAILED, error=error)
+            return
+        item.update(status=PENDING, error=error)
+        self._touch()
+        self._fill()
+
+    def _finish(self, item: Dict, status: str, result: Optional[Dict] = None, error: Optional[str] = None,
+                cached: bool = False):
+        self._close_session(item)
+        item.update(status=status, result=result, error=error, cached=cached, captcha_image=None)
+        item.pop("captcha", None)
+        self.finished.append(item["index"])
+        self.manager.record_finished(self, item)
+        self._touch()
+        self._fill()
+
+    def _close_session(self, item: Dict):
+        session_id = item.pop("session_id", None)
+        if session_id is not None:
+            try:
+                self.manager.close_session(session_id)
+            except Exception as e:
+                logger.warning("Batch %s: error closing session: %s", self.batch_id, e)
+
+    def _spawn(self, coro: Awaitable):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _touch(self):
+        self.updated_at = time.time()
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    # --- Reporting ---
+
+    @property
+    def done(self) -> bool:
+        return all(item["status"] in FINAL for item in self.items)
+
+    async def results(self, since: int = 0, follow: bool = False) -> AsyncIterator[Dict]:
+        """Finished vehicles in completion order from position `since`; with `follow`, until the batch is done."""
+        position = since
+        while True:
+            while position < len(self.finished):
+                yield self.result_line(self.items[self.finished[position]], position)
+                position += 1
+            if not follow or self.done or self._stopped:
+                return
+            changed = self._changed
+            await changed.wait()
+
+    def result_line(self, item: Dict, position: int) -> Dict:
+        result = item.get("result") or {}
+        return {
+            "batch_id": self.batch_id,
+            "position": position,
+            "index": item["index"],
+            "vehicle_number": item["vehicle_number"],
+            "status": item["status"],
+            "outcome": result.get("outcome"),
+            "cached": item.get("cached", False),
+            "attempts": item["attempts"],
+            "error": item.get("error"),
+            "result": item.get("result"),
+        }
+
+    def progress(self) -> Dict:
+        counts = dict.fromkeys(STATUSES, 0)
+        for item in self.items:
+            counts[item["status"]] += 1
+        return dict(counts, total=len(self.items), finished=len(self.finished))
+
+    def describe(self, items: bool = True) -> Dict:
+        stats = dict(self._stats)
+        served, submissions = stats["captchas_served"], stats["submissions"]
+        stats["solve_time_avg"] = stats["solve_time_total"] / served if served else 0.0
+        stats["submit_time_avg"] = stats["submit_time_total"] / submissions if submissions else 0.0
+        content = {
+            "batch_id": self.batch_id,
+            "status": CANCELLED if self._cancelled else DONE if self.done else "running",
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "progress": self.progress(),
+            "stats": stats,
+        }
+        if items:
+            content["items"] = [
+                {key: item.get(key) for key in ("index", "vehicle_number", "status", "attempts", "cached", "error")}
+                for item in self.items
+            ]
+        return content
+
+    def state(self) -> Dict:
+        return {
+            "batch_id": self.batch_id,
+            "client_id": self.client_id,
+            "created_at": self.created_at,
+            "finished": self.finished,
+            "force_refresh": self.force_refresh,
+            "items": [{key: item.get(key) for key in _ITEM_STATE_KEYS} for item in self.items],
+        }
+
+    @classmethod
+    def from_state(cls, manager: "FleetBatches", state: Dict) -> "FleetBatch":
+        items = []
+        for saved in state["items"]:
+            item = dict(saved)
+            if item["status"] not in FINAL:
+                # Its session and captcha were lost with the process that held them
+                item["status"] = PENDING
+            items.append(item)
+        return cls(manager, state["batch_id"], state["client_id"], items,
+                   created_at=state["created_at"], finished=state["finished"],
+                   force_refresh=state.get("force_refresh", False))
+
+
+class FleetBatches:
+    """Fleet batches by id, with their state kept in a store so a batch can be resumed.
+
+    The lookup itself is left to the caller's callbacks: `open_session(client_id,
+    vehicle_number)` returns a session id, `load_captcha(session_id)` a base64
+    captcha, `submit(session_id, vehicle_number, captcha)` the submission result,
+    `close_session(session_id)` releases it and `cached(vehicle_number)` returns a
+    cached result or None. Callbacks raise UpstreamBusy when the vehicle should
+    simply be tried again after `retry_after`.
+
+    A running batch is owned by one process, which keeps renewing a `lease`
+    in the store. Other processes sharing the store raise BatchHeldElsewhere
+    for it until the lease runs out, so its sessions and captchas are never
+    worked on twice; then the first one asked takes it over. Vehicles that
+    were in flight start over, finished ones keep their results. A finished
+    batch can be read anywhere. The store is created by `store_factory` on
+    first use. Runs on the event loop.
+    """
+
+    def __init__(self, store_factory: Callable, open_session: Callable, load_captcha: Callable, submit: Callable,
+                 close_session: Callable, cached: Callable, lookahead: int = 3, submit_concurrency: int = 2,
+                 max_attempts: int = 3, max_vehicles: int = 1000, captcha_max_age: float = 120.0,
+                 lease: float = 60.0, on_finish: Optional[Callable[[str, bool], None]] = None):
+        self.store_factory = store_factory
+        self.open_session = open_session
+        self.load_captcha = load_captcha
+        self.submit = submit
+        self.close_session = close_session
+        self.cached = cached
+        self.lookahead = lookahead
+        self.submit_concurrency = submit_concurrency
+        self.max_attempts = max_attempts
+        self.max_vehicles = max_vehicles
+        self.captcha_max_age = captcha_max_age
+        self.lease = lease
+        self.on_finish = on_finish
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._store = None
+        self._batches: Dict[str, FleetBatch] = {}
+        self._renewal: Optional[asyncio.Task] = None
+        self._stats = {"created": 0, "resumed": 0, "cancelled": 0, "done": 0, "failed": 0, "cached": 0,
+                       "duplicates_dropped": 0, "store_errors": 0, "held_elsewhere": 0, "leases_lost": 0}
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = self.store_factory()
+        return self._store
+
+    def create(self, vehicle_numbers: Iterable[str], client_id: str, force_refresh: bool = False) -> FleetBatch:
+        """Starts a batch; blank and repeated registration numbers are dropped."""
+        seen, items = set(), []
+        for vehicle_number in vehicle_numbers:
+            key = normalize_vehicle_number(vehicle_number)
+            if not key:
+                continue
+            if key in seen:
+                self._stats["duplicates_dropped"] += 1
+                continue
+            seen.add(key)
+            items.append({"index": len(items), "vehicle_number": key, "status": PENDING, "attempts": 0})
+        if not items:
+            raise ValueError("No registration numbers given.")
+        if self.max_vehicles and len(items) > self.max_vehicles:
+            raise ValueError(f"A batch takes at most {self.max_vehicles} vehicles, got {len(items)}.")
+
+        self._forget_finished()
+        batch = FleetBatch(self, uuid.uuid4().hex, client_id, items, force_refresh=force_refresh)
+        self._batches[batch.batch_id] = batch
+        self._stats["created"] += 1
+        self.save(batch)
+        self._start_renewal()
+        batch._fill()
+        return batch
+
+    def get(self, batch_id: str) -> Optional[FleetBatch]:
+        """The batch, resumed from the store if this process doesn't hold it.
+
+        Raises BatchHeldElsewhere while another process's lease on it is live.
+        """
+        batch = self._batches.get(batch_id)
+        if batch is not None:
+            return batch
+        state = self._read(batch_id)
+        if state is None:
+            return None
+        batch = FleetBatch.from_state(self, state)
+        if batch.done:
+            return batch  # Nothing left to run, so there is nothing to own
+        self._check_lease(state)
+        # Claim it, then read back: of two processes claiming at once, the last write wins
+        self.save(batch)
+        claimed = self._read(batch_id)
+        if claimed is not None:
+            self._check_lease(claimed)
+        self._batches[batch_id] = batch
+        self._stats["resumed"] += 1
+        logger.info("Batch %s resumed from the batch store (%d of %d finished)",
+                    batch_id, len(batch.finished), len(batch.items))
+        self._start_renewal()
+        batch._fill()
+        return batch
+
+    def _read(self, batch_id: str) -> Optional[Dict]:
+        try:
+            return self.store.get(batch_id)
+        except Exception as e:
+            self._record_store_error("read", e)
+            return None
+
+    def _check_lease(self, state: Dict):
+        owner = state.get("owner")
+        remaining = state.get("lease_until", 0) - time.time()
+        if owner not in (None, self.owner) and remaining > 0:
+            self._stats["held_elsewhere"] += 1
+            raise BatchHeldElsewhere(f"Batch {state['batch_id']} is running in another worker ({owner}).",
+                                     owner=owner, retry_after=max(1, math.ceil(remaining)))
+
+    def cancel(self, batch: FleetBatch):
+        batch.cancel()
+        self._stats["cancelled"] += 1
+        self.save(batch)
+
+    def save(self, batch: FleetBatch, lease: Optional[float] = None):
+        """Writes the batch's state along with this process's lease on it."""
+        lease = self.lease if lease is None else lease
+        try:
+            self.store.put(batch.batch_id, dict(batch.state(), owner=self.owner, lease_until=time.time() + lease))
+        except Exception as e:
+            self._record_store_error("write", e)
+
+    def _start_renewal(self):
+        if self._renewal is None or self._renewal.done():
+            self._renewal = asyncio.create_task(self._renew_leases())
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            for batch_id, batch in list(self._batches.items()):
+                if batch.done:
+                    continue
+                state = self._read(batch_id)
+                if state is not None and state.get("owner") not in (None, self.owner):
+                    # Lease ran out while this process was stalled and someone else took over
+                    logger.warning("Batch %s was taken over by %s; stopping it here", batch_id, state["owner"])
+                    self._stats["leases_lost"] += 1
+                    batch.stop()
+                    del self._batches[batch_id]
+                    continue
+                self.save(batch)
+
+    def record_finished(self, batch: FleetBatch, item: Dict):
+        status = item["status"]
+        if status in (DONE, FAILED):
+            self._stats[status] += 1
+        if item.get("cached"):
+            self._stats["cached"] += 1
+        if self.on_finish is not None:
+            self.on_finish(status, bool(item.get("cached")))
+        self.save(batch)
+
+    def _record_store_error(self, operation: str, error: Exception):
+        self._stats["store_errors"] += 1
+        logger.error("Could not %s batch state: %s", operation, error)
+
+    def _forget_finished(self):
+        """Drops finished batches this process hasn't touched for a while; the store still has them."""
+        idle_after = getattr(self.store, "ttl", 0) or 3600
+        now = time.time()
+        for batch_id, batch in list(self._batches.items()):
+            if batch.done and now - batch.updated_at > idle_after:
+                del self._batches[batch_id]
+
+    def count(self, status: str) -> int:
+        return sum(1 for batch in self._batches.values() for item in batch.items if item["status"] == status)
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        batches = list(self._batches.values())
+        stats.update({
+            "batches": len(batches),
+            "running": sum(1 for batch in batches if not batch.done),
+            "ready_captchas": self.count(READY),
+            "queued_submissions": self.count(QUEUED),
+            "operator_wait_total": round(sum(batch._stats["operator_wait_total"] for batch in batches), 3),
+            "lookahead": self.lookahead,
+            "submit_concurrency": self.submit_concurrency,
+            "max_attempts": self.max_attempts,
+        })
+        return stats
+
+    def shutdown(self):
+        """Stops every batch and gives up their leases, so another process can resume them at once."""
+        if self._renewal is not None:
+            self._renewal.cancel()
+        for batch in self._batches.values():
+            batch.stop()
+            if not batch.done:
+                self.save(batch, lease=0)
+        self._batches.clear()
@@ -0,0 +1,199 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import aiohttp
+from lxml import etree, html as lxml_html
+from yarl import URL
+
+from challan_parser import build_submission_result, detect_outcome_html
+
+# Form field ids on the public view page
+VEHICLE_FIELD = "REG_NO"
+CAPTCHA_FIELD = "captchatab1"
+SUBMIT_FIELD = "tab1btn"
+CAPTCHA_CONTAINER_ID = "captchaDivtab1"
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    ),
+}
+
+
+class HttpLookupError(RuntimeError):
+    """Raised when the plain HTTP path can't complete a step and Selenium should take over."""
+
+
+def _parse_page(page: str, what: str):
+    try:
+        return lxml_html.fromstring(page)
+    except (etree.LxmlError, ValueError) as e:
+        raise HttpLookupError(f"Could not parse {what}: {e}") from e
+
+
+class HttpChallanSession:
+    """Looks up challans over plain HTTP for one session.
+
+    Holds a single pooled aiohttp connection and cookie jar for the session, so a
+    lookup costs a few KB and a couple of round-trips instead of a browser process.
+    The page's cookies, hidden fields and form action are captured on load and
+    posted back on submit, mirroring what the Selenium path records.
+    """
+
+    def __init__(self, page_url: str, timeout: float = 15.0):
+        self.page_url = page_url
+        self.timeout = timeout
+        self.hidden_fields: Dict[str, str] = {}
+        self.form_action: Optional[str] = None
+        self.form_method = "post"
+        self.base_url: Optional[str] = None
+        self.captcha_url: Optional[str] = None
+        self._client: Optional[aiohttp.ClientSession] = None
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self._client is None or self._client.closed:
+            self._client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=1),
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                headers=DEFAULT_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._client
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        if self._client is None:
+            return {}
+        return {cookie.key: cookie.value for cookie in self._client.cookie_jar}
+
+    def state(self) -> Dict:
+        """Everything needed to continue this lookup in another process, as plain JSON data."""
+        return {
+            "cookies": self.cookies,
+            "hidden_fields": dict(self.hidden_fields),
+            "form_action": self.form_action,
+            "form_method": self.form_method,
+            "base_url": self.base_url,
+            "captcha_url": self.captcha_url,
+        }
+
+    def restore(self, state: Dict):
+        """Continues a lookup from `state()` taken in this or another process."""
+        self.hidden_fields = dict(state.get("hidden_fields") or {})
+        self.form_action = state.get("form_action")
+        self.form_method = state.get("form_method") or "post"
+        self.base_url = state.get("base_url")
+        self.captcha_url = state.get("captcha_url")
+        cookies = state.get("cookies")
+        if cookies and self.base_url:
+            self._session().cookie_jar.update_cookies(cookies, response_url=URL(self.base_url))
+
+    async def load_captcha(self) -> bytes:
+        """Loads the public view page, records its form state and returns the captcha image bytes."""
+        session = self._session()
+        try:
+            async with session.get(self.page_url) as response:
+                response.raise_for_status()
+                page = await response.text()
+                self.base_url = str(response.url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise HttpLookupError(f"Failed to load challan page: {e}") from e
+
+        if not page.strip():
+            raise HttpLookupError("Challan page was empty")
+        root = _parse_page(page, "challan page")
+        if not self._read_form(root):
+            raise HttpLookupError("Lookup form not found in page markup")
+
+        captcha_src = root.xpath(f"//*[@id='{CAPTCHA_CONTAINER_ID}']//img/@src")
+        if not captcha_src:
+            raise HttpLookupError("Captcha image not found in page markup")
+        self.captcha_url = urljoin(self.base_url, captcha_src[0])
+        return await self._fetch_captcha(self.captcha_url)
+
+    async def refresh_captcha(self) -> bytes:
+        """Fetches a new captcha image for the already loaded page, keeping its form state."""
+        if not self.captcha_url:
+            raise HttpLookupError("No captcha loaded yet")
+        # Bust caches the same way the page's own refresh link does
+        parts = urlsplit(self.captcha_url)
+        query = [(key, value) for key, value in parse_qsl(parts.query) if key != "t"]
+        query.append(("t", str(int(time.time() * 1000))))
+        return await self._fetch_captcha(urlunsplit(parts._replace(query=urlencode(query))))
+
+    async def _fetch_captcha(self, captcha_url: str) -> bytes:
+        session = self._session()
+        try:
+            async with session.get(captcha_url, headers={"Referer": self.base_url}) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                image = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise HttpLookupError(f"Failed to fetch captcha image: {e}") from e
+
+        if not image or not content_type.startswith("image/"):
+            raise HttpLookupError(f"Captcha response was not an image ({content_type or 'no content type'})")
+        return image
+
+    async def submit(self, vehicle_number: str, captcha_solution: str) -> Dict:
+        """Posts the lookup form and returns the same result shape as the Selenium path."""
+        if not self.form_action:
+            raise HttpLookupError("No form state captured; load the captcha first")
+
+        form = dict(self.hidden_fields)
+        form[VEHICLE_FIELD] = vehicle_number
+        form[CAPTCHA_FIELD] = captcha_solution
+        form.setdefault(SUBMIT_FIELD, "Submit")
+
+        session = self._session()
+        try:
+            if self.form_method == "get":
+                request = session.get(self.form_action, params=form, headers={"Referer": self.base_url})
+            else:
+                request = session.post(self.form_action, data=form, headers={"Referer": self.base_url})
+            async with request as response:
+                response.raise_for_status()
+                page = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise HttpLookupError(f"Failed to submit challan form: {e}") from e
+
+        if not page.strip():
+            raise HttpLookupError("Result page was empty")
+        root = _parse_page(page, "result page")
+        # The response page carries the lookup form again; keep its state current so
+        # a captcha retry can refresh in place instead of reloading. Other forms on
+        # the results page are left alone.
+        if self._read_form(root):
+            captcha_src = root.xpath(f"//*[@id='{CAPTCHA_CONTAINER_ID}']//img/@src")
+            if captcha_src:
+                self.captcha_url = urljoin(self.base_url, captcha_src[0])
+
+        try:
+            outcome = detect_outcome_html(page)
+            return build_submission_result(outcome, vehicle_number, page)
+        except (etree.LxmlError, ValueError) as e:
+            raise HttpLookupError(f"Could not read result page: {e}") from e
+
+    def _read_form(self, root) -> bool:
+        """Records the lookup form's action and hidden fields; False when the page has no lookup form."""
+        forms = root.xpath(f"//form[.//*[@id='{VEHICLE_FIELD}']]")
+        if not forms:
+            return False
+        form = forms[0]
+
+        self.form_action = urljoin(self.base_url, form.get("action") or self.base_url)
+        self.form_method = (form.get("method") or "post").lower()
+        self.hidden_fields = {}
+        # Hidden inputs anywhere on the page, same as the Selenium path records
+        for hidden in root.xpath("//input[@type='hidden']"):
+            name = hidden.get("name")
+            if name:
+                self.hidden_fields[name] = hidden.get("value") or ""
+        return True
+
+    async def close(self):
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
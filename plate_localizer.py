@@ -0,0 +1,88 @@
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Indian plates are roughly 4.7:1 (single line, 500x110mm) down to 1.7:1 (two line, 340x200mm)
+MIN_ASPECT_RATIO = 1.5
+MAX_ASPECT_RATIO = 6.0
+# Plate area as a fraction of the photo
+MIN_AREA_RATIO = 0.002
+MAX_AREA_RATIO = 0.4
+# Contours are searched on a copy scaled to this width
+DETECTION_WIDTH = 800
+# Margin kept around the detected plate, as a fraction of its size
+CROP_PADDING = 0.12
+
+
+def _candidate_score(rect: Tuple[int, int, int, int], contour, image_area: float) -> Optional[float]:
+    x, y, w, h = rect
+    if h == 0:
+        return None
+    aspect = w / h
+    area_ratio = (w * h) / image_area
+    if not (MIN_ASPECT_RATIO <= aspect <= MAX_ASPECT_RATIO):
+        return None
+    if not (MIN_AREA_RATIO <= area_ratio <= MAX_AREA_RATIO):
+        return None
+    # Prefer well-filled, quadrilateral shapes over ragged edge clusters
+    rectangularity = cv2.contourArea(contour) / float(w * h)
+    approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+    quad_bonus = 1.5 if len(approx) == 4 else 1.0
+    return rectangularity * quad_bonus * np.sqrt(area_ratio)
+
+
+def find_plate_region(image: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """Returns the (x, y, w, h) of the most plate-like region in a BGR image, or None."""
+    height, width = image.shape[:2]
+    scale = min(1.0, DETECTION_WIDTH / float(width))
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    gray = cv2.bilateralFilter(gray, 11, 17, 17)
+    edges = cv2.Canny(gray, 30, 200)
+    # Close gaps between characters so the plate border forms one contour
+    edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 3)))
+
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:40]
+
+    image_area = float(small.shape[0] * small.shape[1])
+    best, best_score = None, 0.0
+    for contour in contours:
+        rect = cv2.boundingRect(contour)
+        score = _candidate_score(rect, contour, image_area)
+        if score is not None and score > best_score:
+            best, best_score = rect, score
+
+    if best is None:
+        return None
+    x, y, w, h = (int(round(v / scale)) for v in best)
+    return x, y, w, h
+
+
+def crop_plate(image_bytes: bytes, jpeg_quality: int = 90) -> Tuple[Optional[bytes], Dict]:
+    """Finds the number plate in a photo and returns (JPEG crop, info).
+
+    The crop is None when the photo can't be decoded or no plate-like region is found.
+    """
+    array = np.frombuffer(image_bytes, dtype=np.uint8)
+    image = cv2.imdecode(array, cv2.IMREAD_COLOR)
+    if image is None:
+        return None, {"localized": False, "reason": "undecodable"}
+
+    region = find_plate_region(image)
+    if region is None:
+        return None, {"localized": False, "reason": "no_candidate"}
+
+    x, y, w, h = region
+    pad_x, pad_y = int(w * CROP_PADDING), int(h * CROP_PADDING)
+    height, width = image.shape[:2]
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    crop = image[y0:y1, x0:x1]
+
+    ok, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not ok:
+        return None, {"localized": False, "reason": "encode_failed"}
+    return encoded.tobytes(), {"localized": True, "plate_box": [x0, y0, x1 - x0, y1 - y0]}
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Dict, Optional, Tuple
+
+# google-genai, PIL and OpenCV (via plate_localizer) are imported on first use;
+# together they are most of the app's import time, which a Lambda cold start pays.
+
+logger = logging.getLogger(__name__)
+
+PLATE_PROMPT = """
+Extract any vehicle registration number from this image.
+The number should be in the format of Indian vehicle registration (e.g., AB12CD3456).
+Only provide the vehicle registration number, nothing else with out space.
+"""
+
+# Standard series (TS09AB1234, DL3CAB1234, KA01A1234) and Bharat series (22BH1234AA)
+VALID_PLATE_PATTERN = re.compile(r"^(?:[A-Z]{2}\d{1,2}[A-Z]{0,3}\d{4}|\d{2}BH\d{4}[A-Z]{1,2})$")
+
+
+def is_valid_registration(text: str) -> bool:
+    return bool(VALID_PLATE_PATTERN.match(text or ""))
+
+
+# Formats the model accepts as-is; anything else is re-encoded to JPEG
+PASSTHROUGH_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+def prepare_image(image_bytes: bytes, max_dimension: int, jpeg_quality: int) -> Tuple[bytes, str, Dict]:
+    """Returns (payload, mime_type, info) for upload.
+
+    Images already within `max_dimension` in a supported format are sent untouched
+    with their real mime type. Larger photos are EXIF-rotated, downscaled and
+    re-encoded as JPEG.
+    """
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(image_bytes))
+    source_format = image.format or "UNKNOWN"
+    info = {"source_format": source_format, "source_size": list(image.size), "resized": False}
+
+    fits = max(image.size) <= max_dimension
+    if fits and source_format in PASSTHROUGH_MIME_TYPES:
+        return image_bytes, PASSTHROUGH_MIME_TYPES[source_format], info
+
+    image = ImageOps.exif_transpose(image)
+    if not fits:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        info["resized"] = True
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+    info["sent_size"] = list(image.size)
+    return buffer.getvalue(), "image/jpeg", info
+
+
+class PlateOcr:
+    """Reads registration numbers from photos with the async GenAI client.
+
+    When `localize` is on, only an OpenCV crop of the plate is sent and the full
+    photo is used only if no plate is found or the crop's reading isn't a valid
+    registration number. Full photos are downscaled to a bounded resolution, and
+    results are memoized by content hash so a re-uploaded photo costs nothing.
+
+    Pass either a ready `client` or a `client_factory`; the factory is called on
+    the first model request, so building the client stays off the import path.
+    """
+
+    def __init__(self, client=None, model: str = "gemini-1.5-flash", max_dimension: int = 1280,
+                 jpeg_quality: int = 85, cache_size: int = 256, localize: bool = True,
+                 client_factory: Optional[Callable] = None):
+        if client is None and client_factory is None:
+            raise ValueError("PlateOcr needs a client or a client_factory")
+        self._client = client
+        self._client_factory = client_factory
+        self.model = model
+        self.localize = localize
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "model_calls": 0,
+            "failures": 0,
+            "plate_crops_used": 0,
+            "full_image_fallbacks": 0,
+            "bytes_received": 0,
+            "bytes_sent": 0,
+            "model_seconds_total": 0.0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _cached(self, digest: str) -> Optional[str]:
+        with self._lock:
+            text = self._cache.get(digest)
+            if text is not None:
+                self._cache.move_to_end(digest)
+            return text
+
+    def peek(self, image_bytes: bytes) -> Optional[str]:
+        """The plate already read from this exact image, without counting a call; None if unknown."""
+        return self._cached(hashlib.sha256(image_bytes).hexdigest())
+
+    def _remember(self, digest: str, text: str):
+        with self._lock:
+            self._cache[digest] = text
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    async def extract(self, image_bytes: bytes) -> Dict:
+        """Returns {"text": ..., "metrics": {...}}; text is "" when no number could be read."""
+        started = time.perf_counter()
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        metrics = {"cache_hit": False, "bytes_received": len(image_bytes), "bytes_sent": 0}
+        self._count(calls=1, bytes_received=len(image_bytes))
+
+        cached = self._cached(digest)
+        if cached is not None:
+            self._count(cache_hits=1)
+            metrics.update({"cache_hit": True, "total_ms": round((time.perf_counter() - started) * 1000, 1)})
+            return {"text": cached, "metrics": metrics}
+
+        try:
+            text = ""
+            model_seconds = 0.0
+            if self.localize:
+                from plate_localizer import crop_plate
+                # OpenCV work is CPU-bound; keep it off the event loop
+                crop, info = await asyncio.to_thread(crop_plate, image_bytes, self.jpeg_quality)
+                if crop is not None:
+                    metrics.update(info)
+                    text, seconds = await self._read_plate(crop, "image/jpeg")
+                    model_seconds += seconds
+                    metrics["bytes_sent"] += len(crop)
+                    if is_valid_registration(text):
+                        metrics["source"] = "plate_crop"
+                        self._count(plate_crops_used=1)
+                    else:
+                        metrics["fallback"] = "invalid_crop_text"
+                        text = ""
+                else:
+                    metrics.update({"localized": False, "fallback": info["reason"]})
+
+            if not text:
+                prepare_started = time.perf_counter()
+                # PIL decoding and resizing is CPU work; keep it off the event loop
+                payload, mime_type, info = await asyncio.to_thread(
+                    prepare_image, image_bytes, self.max_dimension, self.jpeg_quality
+                )
+                metrics.update(info)
+                metrics.update({
+                    "mime_type": mime_type,
+                    "preprocess_ms": round((time.perf_counter() - prepare_started) * 1000, 1),
+                })
+                text, seconds = await self._read_plate(payload, mime_type)
+                model_seconds += seconds
+                metrics["bytes_sent"] += len(payload)
+                metrics["source"] = "full_image"
+                if self.localize:
+                    self._count(full_image_fallbacks=1)
+
+            metrics["valid_format"] = is_valid_registration(text)
+            metrics["model_ms"] = round(model_seconds * 1000, 1)
+        except Exception as e:
+            logger.error("Error during Google Generative AI processing: %s", e)
+            self._count(failures=1)
+            metrics.update({"error": str(e), "total_ms": round((time.perf_counter() - started) * 1000, 1)})
+            return {"text": "", "metrics": metrics}
+
+        if text:
+            self._remember(digest, text)
+        metrics["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {"text": text, "metrics": metrics}
+
+    async def _read_plate(self, payload: bytes, mime_type: str) -> Tuple[str, float]:
+        """Sends one image to the model. Returns (registration text, seconds spent)."""
+        from google.genai import types
+
+        client = self.client
+        started = time.perf_counter()
+        response = await client.aio.models.generate_content(
+            model=self.model,
+            contents=[PLATE_PROMPT, types.Part.from_bytes(data=payload, mime_type=mime_type)],
+        )
+        seconds = time.perf_counter() - started
+        self._count(model_calls=1, bytes_sent=len(payload), model_seconds_total=seconds)
+        return "".join((response.text or "").split()).upper(), seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_images"] = len(self._cache)
+        model_calls = stats["model_calls"]
+        stats["model_seconds_avg"] = stats["model_seconds_total"] / model_calls if model_calls else 0.0
+        stats["bytes_sent_avg"] = stats["bytes_sent"] / model_calls if model_calls else 0.0
+        return stats
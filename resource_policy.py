@@ -0,0 +1,116 @@
+import logging
+import re
+import threading
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Only the form, the captcha image and later the results table are needed; web
+# fonts, media and third-party trackers are dead weight. Images are left alone:
+# the captcha is one, and an extension pattern would catch it on every load.
+DEFAULT_BLOCKED_URLS = (
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*hotjar.com*", "*/analytics.js*",
+)
+
+PAGE_LOAD_STRATEGIES = ("normal", "eager", "none")
+
+
+def _pattern_matches(pattern: str, url: str) -> bool:
+    """Chrome's blocked-URL matching: `*` is the only wildcard."""
+    regex = ".*".join(re.escape(part) for part in pattern.split("*"))
+    return re.fullmatch(regex, url) is not None
+
+
+def parse_patterns(value: Optional[str]) -> Optional[List[str]]:
+    """Parses a comma-separated pattern list; None means "use the defaults"."""
+    if value is None:
+        return None
+    return [pattern.strip() for pattern in value.split(",") if pattern.strip()]
+
+
+class ResourcePolicy:
+    """Decides what a Chrome downloads for the challan page.
+
+    `configure(options)` sets the page-load strategy before launch, and
+    `apply(driver)` blocks URL patterns over CDP (`Network.setBlockedURLs`).
+    Blocking is per page target, so hosted tabs call `apply` once per tab.
+
+    The captcha is the one image that must load. Patterns are matched against
+    URLs, not element roles, so when the captcha still ends up blocked the
+    caller passes its URL to `allow(url)`: the patterns that caught it are
+    dropped for good, and later `apply` calls no longer block it. Only targets
+    blocked before that reload once more. `unblock(driver)` lifts blocking
+    entirely when the URL is unknown.
+    """
+
+    def __init__(self, page_load_strategy: str = "eager", blocked_urls: Optional[Iterable[str]] = None,
+                 enabled: bool = True):
+        if page_load_strategy not in PAGE_LOAD_STRATEGIES:
+            raise ValueError(f"page_load_strategy must be one of {PAGE_LOAD_STRATEGIES}")
+        self.page_load_strategy = page_load_strategy
+        self.blocked_urls = list(DEFAULT_BLOCKED_URLS if blocked_urls is None else blocked_urls)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.allowed_urls: List[str] = []
+        self._stats = {"applied": 0, "apply_failures": 0, "unblocked": 0, "allowed": 0}
+
+    def configure(self, chrome_options):
+        """Sets launch options; call before the driver is created."""
+        if self.enabled:
+            chrome_options.page_load_strategy = self.page_load_strategy
+
+    def apply(self, driver):
+        """Blocks the configured URL patterns for the driver's current page target."""
+        if not self.enabled:
+            return
+        with self._lock:
+            blocked_urls = list(self.blocked_urls)
+        if not blocked_urls:
+            return
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls})
+        except Exception as e:
+            # A browser without the CDP endpoint just loads everything
+            logger.warning("Could not apply resource blocking: %s", e)
+            self._count("apply_failures")
+            return
+        self._count("applied")
+
+    def allow(self, url: str) -> bool:
+        """Stops blocking a URL that must load; False if no pattern matched it."""
+        with self._lock:
+            matched = [pattern for pattern in self.blocked_urls if _pattern_matches(pattern, url)]
+            if not matched:
+                return False
+            self.blocked_urls = [pattern for pattern in self.blocked_urls if pattern not in matched]
+            self.allowed_urls.append(url)
+            self._stats["allowed"] += 1
+        logger.warning("No longer blocking %s for %s", ", ".join(matched), url)
+        return True
+
+    def unblock(self, driver):
+        """Lifts URL blocking for a driver, e.g. when it caught the captcha image."""
+        try:
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+        except Exception as e:
+            logger.warning("Could not lift resource blocking: %s", e)
+        self._count("unblocked")
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "enabled": self.enabled,
+            "page_load_strategy": self.page_load_strategy if self.enabled else "normal",
+            "blocked_urls": list(self.blocked_urls) if self.enabled else [],
+            "allowed_urls": list(self.allowed_urls),
+        })
+        return stats
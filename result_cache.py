@@ -0,0 +1,164 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+def normalize_vehicle_number(vehicle_number: str) -> str:
+    """Cache key for a registration number: upper case, letters and digits only."""
+    return re.sub(r"[^A-Z0-9]", "", (vehicle_number or "").upper())
+
+
+class MemoryBackend:
+    """LRU-ordered in-process store. Entries are (stored_at, results)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, stored_at: float, results: Dict) -> int:
+        self._entries[key] = (stored_at, results)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while self.max_entries and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """On-disk store that survives restarts and can be shared by workers on one host."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS challan_results ("
+            " key TEXT PRIMARY KEY,"
+            " results TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS challan_results_last_access ON challan_results (last_access)"
+        )
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        row = self._conn.execute(
+            "SELECT stored_at, results FROM challan_results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE challan_results SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, stored_at: float, results: Dict) -> int:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO challan_results (key, results, stored_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(results), stored_at, time.time()),
+        )
+        if not self.max_entries:
+            return 0
+        cursor = self._conn.execute(
+            "DELETE FROM challan_results WHERE key IN ("
+            " SELECT key FROM challan_results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        return max(cursor.rowcount, 0)
+
+    def delete(self, key: str):
+        self._conn.execute("DELETE FROM challan_results WHERE key = ?", (key,))
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM challan_results").fetchone()[0]
+
+
+class ResultCache:
+    """TTL + LRU cache of /submit-challan results keyed on the normalized vehicle number."""
+
+    def __init__(self, ttl: float = 1800.0, max_entries: int = 1000, backend: str = "memory",
+                 path: str = "challan_cache.sqlite3"):
+        self.ttl = ttl
+        self.backend_name = backend
+        if backend == "sqlite":
+            self._backend = SqliteBackend(path, max_entries)
+        elif backend == "memory":
+            self._backend = MemoryBackend(max_entries)
+        else:
+            raise ValueError(f"Unknown result cache backend '{backend}'")
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0, "bypassed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, vehicle_number: str) -> Optional[Tuple[Dict, float]]:
+        """Returns (results, age_in_seconds) for a fresh entry, or None."""
+        if not self.enabled:
+            return None
+        key = normalize_vehicle_number(vehicle_number)
+        with self._lock:
+            entry = self._backend.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            stored_at, results = entry
+            age = time.time() - stored_at
+            if age > self.ttl:
+                self._backend.delete(key)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return results, age
+
+    def peek(self, vehicle_number: str) -> bool:
+        """Whether a fresh entry exists, without counting a lookup."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            entry = self._backend.get(normalize_vehicle_number(vehicle_number))
+        return entry is not None and time.time() - entry[0] <= self.ttl
+
+    def set(self, vehicle_number: str, results: Dict):
+        if not self.enabled:
+            return
+        key = normalize_vehicle_number(vehicle_number)
+        with self._lock:
+            self._stats["evictions"] += self._backend.set(key, time.time(), results)
+            self._stats["stores"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._backend)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+            "backend": self.backend_name,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+        })
+        return stats
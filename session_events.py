@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, NamedTuple, Optional
+
+
+class SessionEvent(NamedTuple):
+    id: int
+    event: str
+    data: Dict
+
+
+class _Stream:
+    def __init__(self, history: int):
+        self.events: Deque[SessionEvent] = deque(maxlen=history)
+        self.next_id = 1
+        self.closed = False
+        self.waiters: List[asyncio.Future] = []
+        self.subscribers = 0
+
+
+class SessionEvents:
+    """Per-session event logs that clients follow as server-sent events.
+
+    Lookup steps `publish()` what happens to a session as it happens (page
+    loaded, captcha ready, OCR result, outcome, ...). Each session keeps its
+    last `history` events, so a client that connects late, or reconnects with
+    the SSE `Last-Event-ID`, gets what it missed. `publish()` may be called
+    from worker threads; everything else runs on the event loop.
+    """
+
+    def __init__(self, history: int = 50, keepalive: float = 15.0):
+        self.history = history
+        self.keepalive = keepalive
+        self._streams: Dict[str, _Stream] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "dropped": 0, "subscriptions": 0}
+
+    def open(self, session_id: str):
+        """Starts a session's stream; events for sessions without one are dropped."""
+        with self._lock:
+            if session_id not in self._streams:
+                self._streams[session_id] = _Stream(self.history)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._streams
+
+    def publish(self, session_id: str, event: str, data: Optional[Dict] = None):
+        """Appends an event to the session's stream and wakes its subscribers."""
+        data = data or {}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is None:
+            self._loop = running
+        if self._loop is None or running is self._loop:
+            self._append(session_id, event, data)
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._append, session_id, event, data)
+        except RuntimeError:
+            with self._lock:
+                self._stats["dropped"] += 1  # The loop has shut down
+
+    def close(self, session_id: str):
+        """Ends a session's stream with a `closed` event; subscribers finish once they've read it."""
+        self.publish(session_id, "closed", {})
+
+    async def subscribe(self, session_id: str, last_event_id: int = 0) -> AsyncIterator[Optional[SessionEvent]]:
+        """Yields the session's events after `last_event_id`, then new ones as they arrive.
+
+        Yields None every `keepalive` seconds without events, so the caller can
+        keep the connection open through proxies.
+        """
+        self._loop = asyncio.get_running_loop()
+        stream = self._streams.get(session_id)
+        if stream is None:
+            return
+        with self._lock:
+            self._stats["subscriptions"] += 1
+        stream.subscribers += 1
+        try:
+            while True:
+                for item in list(stream.events):
+                    if item.id > last_event_id:
+                        last_event_id = item.id
+                        yield item
+                if stream.closed:
+                    return
+                waiter = self._loop.create_future()
+                stream.waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                finally:
+                    if waiter in stream.waiters:
+                        stream.waiters.remove(waiter)
+        finally:
+            stream.subscribers -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            streams = list(self._streams.values())
+        stats.update({
+            "streams": len(streams),
+            "subscribers": sum(stream.subscribers for stream in streams),
+            "history": self.history,
+        })
+        return stats
+
+    def _append(self, session_id: str, event: str, data: Dict):
+        with self._lock:
+            stream = self._streams.get(session_id)
+            if stream is None or stream.closed:
+                self._stats["dropped"] += 1
+                return
+            stream.events.append(SessionEvent(stream.next_id, event, data))
+            stream.next_id += 1
+            self._stats["published"] += 1
+            if event == "closed":
+                stream.closed = True
+                # Subscribers hold on to the stream until they've read the last event
+                del self._streams[session_id]
+            waiters, stream.waiters = stream.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def format_sse(item: Optional[SessionEvent]) -> str:
+    """One server-sent event, or a comment line for a keepalive."""
+    if item is None:
+        return ": keepalive\n\n"
+    return f"id: {item.id}\nevent: {item.event}\ndata: {json.dumps(item.data)}\n\n"
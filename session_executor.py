@@ -0,0 +1,65 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Optional
+
+
+class SessionExecutor:
+    """Runs blocking WebDriver work off the event loop, one worker thread per session.
+
+    A WebDriver is not safe to drive from several threads at once, so every call
+    for a given session is queued on that session's own single-thread executor.
+    Different sessions run in parallel on their own threads.
+    """
+
+    def __init__(self):
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def _executor_for(self, session_id: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(session_id)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"session-{session_id[:8]}")
+                self._executors[session_id] = executor
+            return executor
+
+    async def run(self, session_id: str, fn: Callable, *args, **kwargs):
+        """Runs `fn(*args, **kwargs)` on the session's worker thread and awaits the result.
+
+        The call runs in a copy of the caller's context (like `asyncio.to_thread`),
+        so request-scoped context variables such as stage timings follow it.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._executor_for(session_id)
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(executor, partial(context.run, fn, *args, **kwargs))
+
+    def close(self, session_id: str, finalizer: Optional[Callable] = None):
+        """Stops the session's worker once queued calls finish, then runs `finalizer` on it.
+
+        Running the finalizer (e.g. returning the driver to the pool) on the same
+        worker guarantees it happens after any call still in flight.
+        """
+        with self._lock:
+            executor = self._executors.pop(session_id, None)
+        if executor is None:
+            if finalizer:
+                finalizer()
+            return
+        if finalizer:
+            executor.submit(finalizer)
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._executors)
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitExceeded(RuntimeError):
+    """Raised when a new session can't be admitted; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def process_tree_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Resident memory of a process and all its descendants (chromedriver, Chrome), in MB.
+
+    Reads /proc, so it returns None where that isn't available.
+    """
+    pid = pid or os.getpid()
+    try:
+        children: Dict[int, list] = {}
+        rss_pages: Dict[int, int] = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    stat = f.read()
+                with open(f"/proc/{entry}/statm") as f:
+                    rss_pages[int(entry)] = int(f.read().split()[1])
+            except (OSError, ValueError, IndexError):
+                continue  # Process exited while scanning
+            # Fields after the parenthesised command name: state, ppid, ...
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return None
+
+    total_pages = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total_pages += rss_pages.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class SessionManager:
+    """Tracks session activity, enforces admission limits and reaps idle sessions.
+
+    `sessions` is the session_id -> session data dict the endpoints work with;
+    lifecycle bookkeeping is kept beside it so session data stays plain.
+    Expired sessions are handed to `on_expire`, which is expected to quit or
+    release their drivers.
+
+    With a shared `store`, `sessions` only holds this worker's copies: the
+    session cap counts every worker's sessions in the store, and copies whose
+    session was ended or expired elsewhere are expired on the next sweep. The
+    cap is exact within a worker; across workers it is only as current as the
+    store.
+    """
+
+    def __init__(self, on_expire: Callable[[str], object], idle_ttl: float = 600.0,
+                 max_sessions: int = 20, max_rss_mb: float = 0.0, reap_interval: float = 30.0,
+                 store=None):
+        self.on_expire = on_expire
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_rss_mb = max_rss_mb
+        self.reap_interval = reap_interval
+        self.store = store if store is not None and store.shared else None
+
+        self.sessions: Dict[str, Dict] = {}
+        self._meta: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        # Sessions admitted but not added yet, so concurrent admissions can't all pass the cap
+        self._reserved = 0
+        self._reaper: Optional[asyncio.Task] = None
+        self._stats = {
+            "created": 0,
+            "adopted": 0,
+            "closed": 0,
+            "expired": 0,
+            "ended_elsewhere": 0,
+            "rejected_limit": 0,
+            "rejected_memory": 0,
+        }
+
+    # --- Admission ---
+
+    @asynccontextmanager
+    async def admission(self):
+        """Holds a slot under the session and memory caps while a session is being opened.
+
+        Raises SessionLimitExceeded when there's no room. The session should be
+        `add`ed inside the block; the slot is given back when the block exits,
+        whether or not it was.
+        """
+        # Store calls block, so they run off the event loop. Also reaps where no
+        # background reaper can (Lambda).
+        self.reap_expired(await asyncio.to_thread(self._ended_elsewhere))
+        stored = await asyncio.to_thread(self._count_stored)
+
+        with self._lock:
+            # Local sessions are counted even when the store lags behind them
+            active = max(stored, len(self.sessions)) + self._reserved
+            if self.max_sessions and active >= self.max_sessions:
+                self._stats["rejected_limit"] += 1
+                raise SessionLimitExceeded(
+                    f"Maximum of {self.max_sessions} concurrent sessions reached.",
+                    self._retry_after_locked(),
+                )
+            self._reserved += 1
+        try:
+            if self.max_rss_mb:
+                rss = await asyncio.to_thread(process_tree_rss_mb)
+                if rss is not None and rss >= self.max_rss_mb:
+                    with self._lock:
+                        self._stats["rejected_memory"] += 1
+                    raise SessionLimitExceeded(
+                        f"Server memory use ({rss:.0f} MB) is above the {self.max_rss_mb:.0f} MB admission limit.",
+                        self._retry_after(),
+                    )
+            yield
+        finally:
+            with self._lock:
+                self._reserved -= 1
+
+    def _count_stored(self) -> int:
+        if self.store is not None:
+            try:
+                return len(self.store)
+            except Exception as e:
+                logger.error("Could not count sessions in the session store: %s", e)
+        return 0
+
+    def _retry_after(self) -> int:
+        """Seconds until the longest-idle session would be reaped, bounded to [1, idle_ttl]."""
+        with self._lock:
+            return self._retry_after_locked()
+
+    def _retry_after_locked(self) -> int:
+        now = time.monotonic()
+        candidates = [
+            self.idle_ttl - (now - meta["last_activity"])
+            for meta in self._meta.values()
+            if meta["in_flight"] == 0 and not meta["pinned"]
+        ]
+        wait = min(candidates) if candidates else self.reap_interval
+        return int(max(1, min(math.ceil(wait), self.idle_ttl)))
+
+    # --- Registration and activity ---
+
+    def add(self, session_id: str, session_data: Dict, adopted: bool = False):
+        """Registers a session; `adopted` marks one started by another worker and loaded from the store."""
+        now = time.monotonic()
+        with self._lock:
+            self.sessions[session_id] = session_data
+            self._meta[session_id] = {"created": now, "last_activity": now, "in_flight": 0, "pinned": False}
+            self._stats["adopted" if adopted else "created"] += 1
+
+    def remove(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._meta.pop(session_id, None)
+            session_data = self.sessions.pop(session_id, None)
+            if session_data is not None:
+                self._stats["closed"] += 1
+        return session_data
+
+    def touch(self, session_id: str):
+        with self._lock:
+            meta = self._meta.get(session_id)
+            if meta:
+                meta["last_activity"] = time.monotonic()
+
+    def pin(self, session_id: str):
+        """Exempts a session from reaping until it is removed; for sessions whose owner closes them itself."""
+        with self._lock:
+            meta = self._meta.get(session_id)
+            if meta:
+                meta["pinned"] = True
+
+    @asynccontextmanager
+    async def activity(self, session_id: str):
+        """Marks a session busy for the duration of a request so it can't be reaped mid-call."""
+        with self._lock:
+            meta = self._meta.get(session_id)
+            if meta:
+                meta["in_flight"] += 1
+                meta["last_activity"] = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if meta:
+                    meta["in_flight"] -= 1
+                    meta["last_activity"] = time.monotonic()
+
+    # --- Reaping ---
+
+    def reap_expired(self, ended: Optional[List[str]] = None) -> int:
+        """Closes every session idle for longer than `idle_ttl`. Returns how many were reaped.
+
+        `ended` is a `_ended_elsewhere()` result the caller fetched off the event loop.
+        """
+        if ended is None:
+            ended = self._ended_elsewhere()
+        if ended:
+            for session_id in ended:
+                self._expire(session_id)
+            with self._lock:
+                self._stats["ended_elsewhere"] += len(ended)
+        if not self.idle_ttl:
+            return len(ended)
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                session_id for session_id, meta in self._meta.items()
+                if meta["in_flight"] == 0 and not meta["pinned"] and now - meta["last_activity"] > self.idle_ttl
+            ]
+        for session_id in expired:
+            logger.info("Session idle for more than %.0fs, closing it", self.idle_ttl, extra={"session_id": session_id})
+            self._expire(session_id)
+            with self._lock:
+                self._stats["expired"] += 1
+        return len(ended) + len(expired)
+
+    def _expire(self, session_id: str):
+        try:
+            self.on_expire(session_id)
+        except Exception as e:
+            logger.error("Error expiring session: %s", e, extra={"session_id": session_id})
+
+    def _ended_elsewhere(self) -> List[str]:
+        """Idle local copies of sessions that are no longer in the shared store."""
+        if self.store is None:
+            return []
+        with self._lock:
+            idle = [session_id for session_id, meta in self._meta.items()
+                    if meta["in_flight"] == 0 and not meta["pinned"]]
+        try:
+            return [session_id for session_id in idle if self.store.get(session_id) is None]
+        except Exception as e:
+            logger.error("Could not check sessions against the session store: %s", e)
+            return []
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                self.reap_expired(await asyncio.to_thread(self._ended_elsewhere))
+            except Exception as e:
+                logger.error("Session reaper error: %s", e)
+
+    def start_reaper(self):
+        """Starts the background reaper on the running loop. Safe to call repeatedly."""
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_forever())
+
+    async def stop_reaper(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+
+    def close_all(self):
+        for session_id in list(self.sessions):
+            self.on_expire(session_id)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            idle_times = [now - meta["last_activity"] for meta in self._meta.values()]
+            stats.update({
+                "active": len(self.sessions),
+                "opening": self._reserved,
+                "busy": sum(1 for meta in self._meta.values() if meta["in_flight"]),
+                "pinned": sum(1 for meta in self._meta.values() if meta["pinned"]),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "longest_idle": round(max(idle_times), 1) if idle_times else 0.0,
+            })
+        if self.max_rss_mb:
+            stats["max_rss_mb"] = self.max_rss_mb
+        rss = process_tree_rss_mb()
+        if rss is not None:
+            stats["rss_mb"] = round(rss, 1)
+        return stats
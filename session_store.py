@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class MemoryBackend:
+    """Per-process store; sessions are only visible to the worker that created them."""
+
+    shared = False
+
+    def __init__(self):
+        self._entries: Dict[str, Dict] = {}
+
+    def get(self, session_id: str, ttl: float) -> Optional[Dict]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        updated_at, state = entry
+        if ttl and time.time() - updated_at > ttl:
+            self._entries.pop(session_id, None)
+            return None
+        return state
+
+    def put(self, session_id: str, state: Dict, ttl: float):
+        self._entries[session_id] = (time.time(), state)
+
+    def delete(self, session_id: str):
+        self._entries.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """On-disk store shared by every API worker on one host."""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS challan_sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def get(self, session_id: str, ttl: float) -> Optional[Dict]:
+        row = self._conn.execute(
+            "SELECT state, updated_at FROM challan_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if ttl and time.time() - row[1] > ttl:
+            self.delete(session_id)
+            return None
+        return json.loads(row[0])
+
+    def put(self, session_id: str, state: Dict, ttl: float):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO challan_sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state), now),
+        )
+        if ttl:
+            # Sessions nobody touched for a TTL were abandoned on some worker
+            self._conn.execute("DELETE FROM challan_sessions WHERE updated_at < ?", (now - ttl,))
+
+    def delete(self, session_id: str):
+        self._conn.execute("DELETE FROM challan_sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM challan_sessions").fetchone()[0]
+
+
+class RedisBackend:
+    """Store on a Redis-compatible server, shared by API workers on any host.
+
+    Needs the `redis` package. Keys expire on their own after the TTL.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "challan:session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_STORE=redis needs the redis package (pip install redis)") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, session_id: str, ttl: float) -> Optional[Dict]:
+        raw = self._client.get(self.prefix + session_id)
+        return json.loads(raw) if raw is not None else None
+
+    def put(self, session_id: str, state: Dict, ttl: float):
+        self._client.set(self.prefix + session_id, json.dumps(state), ex=int(ttl) if ttl else None)
+
+    def delete(self, session_id: str):
+        self._client.delete(self.prefix + session_id)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(match=self.prefix + "*", count=500))
+
+
+class SessionStore:
+    """Serializable session state (engine, cookies, form fields, vehicle number, browser lease).
+
+    With a shared backend any API worker can pick up any step of a session: the
+    worker that serves a request rebuilds its local session objects from the
+    stored state and writes the state back when the step is done. Entries not
+    written for `ttl` seconds are treated as gone.
+    """
+
+    def __init__(self, backend: str = "memory", ttl: float = 600.0, path: str = "challan_sessions.sqlite3",
+                 url: str = "redis://localhost:6379/0", prefix: str = "challan:session:"):
+        self.ttl = ttl
+        self.backend_name = backend
+        if backend == "sqlite":
+            self._backend = SqliteBackend(path)
+        elif backend == "redis":
+            self._backend = RedisBackend(url, prefix)
+        elif backend == "memory":
+            self._backend = MemoryBackend()
+        else:
+            raise ValueError(f"Unknown session store backend '{backend}'")
+        self._lock = threading.Lock()
+        self._stats = {"reads": 0, "misses": 0, "writes": 0, "deletes": 0, "errors": 0}
+
+    @property
+    def shared(self) -> bool:
+        """Whether other processes see the same sessions."""
+        return self._backend.shared
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._stats["reads"] += 1
+            state = self._backend.get(session_id, self.ttl)
+            if state is None:
+                self._stats["misses"] += 1
+            return state
+
+    def put(self, session_id: str, state: Dict):
+        with self._lock:
+            self._backend.put(session_id, state, self.ttl)
+            self._stats["writes"] += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._backend.delete(session_id)
+            self._stats["deletes"] += 1
+
+    def __len__(self):
+        """Sessions in the store, from every worker sharing it."""
+        with self._lock:
+            return len(self._backend)
+
+    def record_error(self):
+        with self._lock:
+            self._stats["errors"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            try:
+                stats["entries"] = len(self._backend)
+            except Exception:
+                stats["entries"] = None
+        stats.update({"backend": self.backend_name, "shared": self.shared, "ttl": self.ttl})
+        return stats
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import app
+from http_lookup import HttpChallanSession
+from session_store import SessionStore
+
+
+@pytest.fixture
+def shared_store(tmp_path, monkeypatch):
+    store = SessionStore(backend="sqlite", path=str(tmp_path / "sessions.sqlite3"), ttl=600)
+    monkeypatch.setattr(app, "session_store", store)
+    yield store
+    for session_id in list(app.active_sessions):
+        app.close_session_sync(session_id, release=False)
+
+
+def open_http_session(session_id: str):
+    http_session = HttpChallanSession("https://example.test/publicview/")
+    http_session.base_url = "https://example.test/publicview/"
+    http_session.form_action = "https://example.test/publicview/search"
+    http_session.hidden_fields = {"token": "9d8c7b6a"}
+    app.session_manager.add(session_id, {"http": http_session, "engine": app.ENGINE_HTTP, "client_id": "client"})
+    app.active_sessions[session_id]["vehicle_number_input"] = "AP01X1"
+
+
+def test_session_saved_on_one_worker_is_loaded_on_another(shared_store):
+    async def run():
+        open_http_session("s1")
+        await app.save_session("s1")
+        assert shared_store.get("s1")["engine"] == app.ENGINE_HTTP
+        assert len(shared_store) == 1
+
+        # The next step lands on a worker that has never seen the session
+        app.close_session_sync("s1", release=False)
+        assert "s1" not in app.active_sessions
+        assert await app.load_session("s1")
+
+        session_data = app.active_sessions["s1"]
+        assert session_data["vehicle_number_input"] == "AP01X1"
+        assert session_data["client_id"] == "client"
+        assert session_data["http"].form_action == "https://example.test/publicview/search"
+        assert session_data["http"].hidden_fields == {"token": "9d8c7b6a"}
+
+    asyncio.run(run())
+
+
+def test_session_ended_elsewhere_is_dropped_on_load(shared_store):
+    async def run():
+        open_http_session("s1")
+        await app.save_session("s1")
+        # Another worker ended it
+        shared_store.delete("s1")
+
+        assert not await app.load_session("s1")
+        assert "s1" not in app.active_sessions
+
+    asyncio.run(run())
+
+
+def test_ended_session_is_gone_for_every_worker(shared_store):
+    async def run():
+        open_http_session("s1")
+        await app.save_session("s1")
+        assert await app.close_session("s1")
+        assert shared_store.get("s1") is None
+        assert not await app.load_session("s1")
+
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from browser_host import BrowserHost
+from driver_supervisor import DriverSupervisor
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.execute("switchToWindow", {"handle": handle})
+
+
+class FakeDriver:
+    """Answers WebDriver commands for one Chrome; records which window each one went to."""
+
+    def __init__(self):
+        self.window = "home"
+        self.targets = 0
+        self.commands = []
+        self.hung = False
+        self.released = threading.Event()
+        self.quit_called = False
+        self.switch_to = FakeSwitchTo(self)
+
+    def execute(self, command, params=None):
+        params = params or {}
+        if command == "switchToWindow":
+            self.window = params["handle"]
+        elif command == "executeCdpCommand" and params["cmd"] == "Target.createBrowserContext":
+            return {"value": {"browserContextId": f"context{self.targets}"}}
+        elif command == "executeCdpCommand" and params["cmd"] == "Target.createTarget":
+            self.targets += 1
+            return {"value": {"targetId": f"tab{self.targets}"}}
+        elif command == "executeScript" and self.hung:
+            self.released.wait(5)
+        self.commands.append((self.window, command, params))
+        return {"value": 1 if command == "executeScript" else "home"}
+
+    @property
+    def current_window_handle(self):
+        return self.execute("getCurrentWindowHandle")["value"]
+
+    def execute_cdp_cmd(self, cmd, params):
+        return self.execute("executeCdpCommand", {"cmd": cmd, "params": params})["value"]
+
+    def execute_script(self, script, *args):
+        return self.execute("executeScript", {"script": script, "args": list(args)})["value"]
+
+    def quit(self):
+        self.quit_called = True
+        self.released.set()
+
+
+def test_tabs_interleave_commands_in_their_own_window():
+    driver = FakeDriver()
+    host = BrowserHost(lambda: driver, max_browsers=1, tabs_per_browser=2)
+    tabs = [host.open_tab(), host.open_tab()]
+
+    def step(driver, name):
+        for _ in range(5):
+            driver.execute("poll", {"tab": name})
+            time.sleep(0.05)  # Stands in for a WebDriverWait poll interval
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=tab.run, args=(step, tab.handle)) for tab in tabs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    polls = [(window, params["tab"]) for window, command, params in driver.commands if command == "poll"]
+    assert len(polls) == 10
+    assert all(window == tab for window, tab in polls)
+    # One step at a time would take 0.5s
+    assert elapsed < 0.4
+    host.shutdown()
+
+
+def test_hung_tab_quits_the_browser_without_its_lock():
+    driver = FakeDriver()
+    host = BrowserHost(lambda: driver, max_browsers=1, tabs_per_browser=2)
+    tab = host.open_tab()
+    supervisor = DriverSupervisor(probe_timeout=0.05)
+    driver.hung = True
+
+    assert not host.check_tab(tab, supervisor.check_before_use, supervisor.probe_pending)
+    assert driver.quit_called
+    assert tab.closed
+    assert host.stats()["browsers"] == 0
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pytest
+
+from challan_parser import (
+    OUTCOME_CAPTCHA_ERROR,
+    OUTCOME_NO_CHALLANS,
+    OUTCOME_TABLE,
+    OUTCOME_UNKNOWN,
+    build_submission_result,
+    detect_outcome_html,
+    parse_challan_html,
+)
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def fixture(name: str) -> str:
+    return (FIXTURES / name).read_text()
+
+
+@pytest.mark.parametrize("name, outcome", [
+    ("results.html", OUTCOME_TABLE),
+    ("no_challans.html", OUTCOME_NO_CHALLANS),
+    ("captcha_error.html", OUTCOME_CAPTCHA_ERROR),
+])
+def test_detect_outcome(name, outcome):
+    assert detect_outcome_html(fixture(name)) == outcome
+
+
+def test_detect_outcome_of_empty_page():
+    assert detect_outcome_html("") == OUTCOME_UNKNOWN
+
+
+def test_parse_results_page():
+    data = parse_challan_html(fixture("results.html"), "TS09AB1234")
+
+    assert data["vehicle_info"] == {"vehicle_number": "TS09AB1234", "owner_name": "RAVI KUMAR"}
+    assert [challan["echallan_no"] for challan in data["challans"]] == ["CYB123456789", "CYB987654321"]
+    assert data["challans"][0] == {
+        "sno": "1",
+        "unit_name": "Cyberabad",
+        "echallan_no": "CYB123456789",
+        "date": "12-03-2024",
+        "time": "09:41",
+        "place": "Gachibowli",
+        "ps_limits": "Raidurgam",
+        "violation": "No Helmet",
+        "fine_amount": "100",
+        "user_charges": "35",
+        "total_fine": "135",
+        "has_image": True,
+    }
+    assert data["challans"][1]["has_image"] is False
+    assert data["grand_total"] == {"fine_amount": "1100", "user_charges": "70", "total_fine": "1170"}
+
+
+def test_parse_table_snapshot_alone():
+    page = fixture("results.html")
+    table = page[page.index('<table id="rtable">'):page.rindex("</table>") + len("</table>")]
+    assert parse_challan_html(table, "TS09AB1234") == parse_challan_html(page, "TS09AB1234")
+
+
+def test_parse_page_without_table():
+    assert parse_challan_html(fixture("no_challans.html"), "TS09AB1234") is None
+
+
+def test_vehicle_number_falls_back_to_the_one_submitted():
+    page = fixture("results.html").replace("<div>TS09AB1234</div>", "<div>-</div>")
+    data = parse_challan_html(page, "TS09AB1234")
+    assert data["vehicle_info"] == {"vehicle_number": "TS09AB1234"}
+
+
+@pytest.mark.parametrize("name, outcome, status, challans", [
+    ("results.html", OUTCOME_TABLE, "success", 2),
+    ("no_challans.html", OUTCOME_NO_CHALLANS, "success", 0),
+    ("captcha_error.html", OUTCOME_CAPTCHA_ERROR, "error", None),
+])
+def test_build_submission_result(name, outcome, status, challans):
+    result = build_submission_result(outcome, "TS09AB1234", fixture(name))
+    assert result["outcome"] == outcome
+    assert result["status"] == status
+    if challans is None:
+        assert result["data"] is None
+    else:
+        assert len(result["data"]["challans"]) == challans
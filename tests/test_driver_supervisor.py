@@ -0,0 +1,45 @@
+import threading
+
+from driver_supervisor import DriverSupervisor
+
+
+class FakeDriver:
+    def __init__(self, hang: bool = False):
+        self.released = threading.Event()
+        if not hang:
+            self.released.set()
+        self.scripts = 0
+
+    def execute_script(self, script):
+        self.scripts += 1
+        self.released.wait()
+        return 1
+
+
+def test_hung_browsers_do_not_fail_healthy_ones():
+    supervisor = DriverSupervisor(probe_timeout=0.05)
+    hung = [FakeDriver(hang=True) for _ in range(6)]
+    try:
+        assert not any(supervisor.is_alive(driver) for driver in hung)
+        assert supervisor.is_alive(FakeDriver())
+        assert supervisor.stats()["probe_timeouts"] == 6
+    finally:
+        for driver in hung:
+            driver.released.set()
+
+
+def test_hung_probe_is_not_repeated_until_it_returns():
+    supervisor = DriverSupervisor(probe_timeout=0.05)
+    driver = FakeDriver(hang=True)
+    assert not supervisor.is_alive(driver)
+    assert supervisor.probe_pending(driver)
+    assert not supervisor.is_alive(driver)
+    assert driver.scripts == 1
+
+    driver.released.set()
+    for _ in range(100):
+        if not supervisor.probe_pending(driver):
+            break
+        threading.Event().wait(0.01)
+    assert supervisor.is_alive(driver)
+    assert driver.scripts == 2
@@ -0,0 +1,81 @@
+import asyncio
+import types
+
+import pytest
+from fastapi import HTTPException
+
+from driver_worker import DriverWorkerClient, DriverWorkerError, DriverWorkerServer, RemoteBrowser
+from instrumentation import begin_request, end_request, record_stage
+from session_manager import SessionManager
+
+
+def _load_captcha_page(driver, session_data):
+    record_stage("navigation", 0.25)
+    session_data["cookies"] = {"JSESSIONID": "abc"}
+    return "captcha"
+
+
+def _submit_challan_form(driver, session_data, vehicle_number, captcha_solution):
+    raise HTTPException(status_code=429, detail="Upstream is busy", headers={"Retry-After": "7"})
+
+
+def _refresh_captcha_in_page(driver, session_data):
+    raise RuntimeError("Chrome went away")
+
+
+def stub_app():
+    """The parts of app.py a driver worker uses, with page steps that don't need Chrome."""
+    session_manager = SessionManager(on_expire=lambda session_id: None, idle_ttl=0)
+
+    async def run_in_browser(session_id, fn, *args):
+        return fn(None, session_manager.sessions[session_id], *args)
+
+    return types.SimpleNamespace(
+        active_sessions=session_manager.sessions,
+        session_manager=session_manager,
+        run_in_browser=run_in_browser,
+        close_session_sync=lambda session_id: session_manager.remove(session_id) is not None,
+        _load_captcha_page=_load_captcha_page,
+        _submit_challan_form=_submit_challan_form,
+        _refresh_captcha_in_page=_refresh_captcha_in_page,
+    )
+
+
+def test_page_step_results_and_errors_cross_the_socket(tmp_path):
+    app = stub_app()
+    app.session_manager.add("s1", {"engine": "selenium"})
+    server = DriverWorkerServer(app)
+    address = f"unix:{tmp_path / 'driver.sock'}"
+    browser = RemoteBrowser(DriverWorkerClient(address, timeout=5), "s1")
+    session_data = {"base_url": "https://example.test/publicview/", "client_id": "client"}
+
+    def use_browser():
+        token = begin_request()
+        assert browser.run("_load_captcha_page", session_data) == "captcha"
+        # Form state goes both ways; the stage timed in the worker is this request's too
+        assert app.active_sessions["s1"]["base_url"] == "https://example.test/publicview/"
+        assert session_data["cookies"] == {"JSESSIONID": "abc"}
+        assert session_data["client_id"] == "client"
+        assert end_request(token) == [("navigation", 0.25)]
+
+        with pytest.raises(HTTPException) as refused:
+            browser.run("_submit_challan_form", session_data, "AP01X1", "ABC12")
+        assert refused.value.status_code == 429
+        assert refused.value.detail == "Upstream is busy"
+        assert refused.value.headers == {"Retry-After": "7"}
+
+        with pytest.raises(DriverWorkerError) as crashed:
+            browser.run("_refresh_captcha_in_page", session_data)
+        assert crashed.value.kind == "step_failed"
+        assert "Chrome went away" in str(crashed.value)
+
+        browser.close()
+
+    async def run():
+        listener = await asyncio.start_unix_server(server.handle, path=address[len("unix:"):])
+        async with listener:
+            await asyncio.to_thread(use_browser)
+
+    asyncio.run(run())
+    assert app.active_sessions == {}
+    assert server.requests == 4
@@ -0,0 +1,245 @@
+import asyncio
+
+import pytest
+
+from fleet_batch import DONE, FAILED, LOADING, PENDING, READY, BatchHeldElsewhere, FleetBatches
+from session_store import SessionStore
+from upstream_scheduler import UpstreamBusy
+
+
+class FakeSite:
+    """Stands in for the lookup steps: "RIGHT" is the only correct captcha."""
+
+    def __init__(self, open_delay: float = 0.0, busy: int = 0):
+        self.open_delay = open_delay
+        # Submissions refused by the upstream queue before any goes through
+        self.busy = busy
+        self.opened = []
+        self.closed = []
+        self.submitted = []
+
+    async def open_session(self, client_id, vehicle_number):
+        await asyncio.sleep(self.open_delay)
+        session_id = f"s{len(self.opened)}"
+        self.opened.append(session_id)
+        return session_id
+
+    async def load_captcha(self, session_id):
+        return "captcha"
+
+    async def submit(self, session_id, vehicle_number, captcha):
+        if self.busy:
+            self.busy -= 1
+            raise UpstreamBusy("Upstream queue is full", 0, "upstream")
+        self.submitted.append((session_id, vehicle_number, captcha))
+        if captcha == "RIGHT":
+            return {"status": "success", "outcome": "no_challans", "message": "No Pending Challans"}
+        return {"status": "error", "message": "Please Enter Correct Captcha", "captcha_image": "captcha-again"}
+
+    def close_session(self, session_id):
+        self.closed.append(session_id)
+
+
+def make_batches(site: FakeSite, store: SessionStore, **kwargs) -> FleetBatches:
+    return FleetBatches(
+        store_factory=lambda: store,
+        open_session=site.open_session,
+        load_captcha=site.load_captcha,
+        submit=site.submit,
+        close_session=site.close_session,
+        cached=lambda vehicle_number: None,
+        **kwargs,
+    )
+
+
+async def settle(seconds: float = 0.02):
+    await asyncio.sleep(seconds)
+
+
+async def drain(lines):
+    return [line async for line in lines]
+
+
+def test_store_is_created_on_first_use():
+    created = []
+    batches = make_batches(FakeSite(), None)
+    batches.store_factory = lambda: created.append(1) or SessionStore()
+    assert not created
+
+    async def run():
+        batches.create(["AP01X1"], "client")
+        batches.shutdown()
+
+    asyncio.run(run())
+    assert created == [1]
+
+
+def test_running_batch_is_not_resumed_by_another_worker(tmp_path):
+    store = SessionStore(backend="sqlite", path=str(tmp_path / "batches.sqlite3"), ttl=3600)
+
+    async def run():
+        owner = make_batches(FakeSite(), store, lease=30)
+        other = make_batches(FakeSite(), store, lease=30)
+        batch = owner.create(["AP01X1", "AP01X2"], "client")
+        with pytest.raises(BatchHeldElsewhere) as held:
+            other.get(batch.batch_id)
+        assert 0 < held.value.retry_after <= 30
+
+        # Shutting down gives the lease up; the other worker resumes right away
+        owner.shutdown()
+        resumed = other.get(batch.batch_id)
+        assert resumed is not None and resumed.batch_id == batch.batch_id
+        assert {item["status"] for item in resumed.items} <= {PENDING, LOADING, READY}
+        with pytest.raises(BatchHeldElsewhere):
+            owner.get(batch.batch_id)
+        other.shutdown()
+
+    asyncio.run(run())
+
+
+def test_session_opened_after_cancel_is_closed():
+    site = FakeSite(open_delay=0.05)
+
+    async def run():
+        batches = make_batches(site, SessionStore(), lookahead=1)
+        batch = batches.create(["AP01X1"], "client")
+        await asyncio.sleep(0.01)  # Opening is under way
+        batches.cancel(batch)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert site.opened == ["s0"]
+    assert site.closed == ["s0"]
+
+
+def test_lookahead_keeps_that_many_captchas_loaded():
+    site = FakeSite()
+
+    async def run():
+        batches = make_batches(site, SessionStore(), lookahead=2)
+        batch = batches.create([f"AP01X{n}" for n in range(5)], "client")
+        await settle()
+        assert [item["status"] for item in batch.items] == [READY, READY, PENDING, PENDING, PENDING]
+        assert len(site.opened) == 2
+
+        served = await batch.next_captcha()
+        assert served["index"] == 0 and served["captcha_image"] == "captcha"
+        batch.solve(0, "RIGHT")
+        await settle()
+        # The solved vehicle's slot went to the next pending one
+        assert [item["status"] for item in batch.items] == [DONE, READY, READY, PENDING, PENDING]
+        assert site.submitted == [("s0", "AP01X0", "RIGHT")]
+        assert "s0" in site.closed
+        batches.shutdown()
+
+    asyncio.run(run())
+
+
+def test_wrong_captcha_puts_the_vehicle_back_until_attempts_run_out():
+    site = FakeSite()
+
+    async def run():
+        batches = make_batches(site, SessionStore(), lookahead=1, max_attempts=2)
+        batch = batches.create(["AP01X1"], "client")
+        await settle()
+        batch.solve(0, "WRONG")
+        await settle()
+        item = batch.items[0]
+        # Back in line with the captcha the error page showed, in the same session
+        assert item["status"] == READY and item["captcha_image"] == "captcha-again"
+        assert item["attempts"] == 1 and item["session_id"] == "s0"
+        served = await batch.next_captcha()
+        assert served["attempt"] == 2
+
+        batch.solve(0, "WRONG")
+        await settle()
+        assert item["status"] == FAILED
+        assert item["error"] == "Please Enter Correct Captcha"
+        assert site.closed == ["s0"] and batch.done
+        batches.shutdown()
+
+    asyncio.run(run())
+
+
+def test_refused_submissions_are_retried_but_not_counted():
+    site = FakeSite(busy=2)
+
+    async def run():
+        batches = make_batches(site, SessionStore(), lookahead=1)
+        batch = batches.create(["AP01X1"], "client")
+        await settle()
+        batch.solve(0, "RIGHT")
+        await settle(0.05)
+        assert batch.items[0]["status"] == DONE
+        assert batch.describe()["stats"]["submissions"] == 1
+        batches.shutdown()
+
+    asyncio.run(run())
+
+
+def test_results_stream_in_completion_order():
+    site = FakeSite()
+
+    async def run():
+        batches = make_batches(site, SessionStore(), lookahead=3)
+        batch = batches.create(["AP01X1", "AP01X2", "AP01X3"], "client")
+        await settle()
+
+        following = asyncio.create_task(drain(batch.results(follow=True)))
+        for index in (2, 0, 1):
+            batch.solve(index, "RIGHT")
+            await settle()
+        lines = await asyncio.wait_for(following, 1)
+        assert [line["index"] for line in lines] == [2, 0, 1]
+        assert [line["position"] for line in lines] == [0, 1, 2]
+        assert lines[0]["outcome"] == "no_challans" and lines[0]["attempts"] == 1
+
+        rest = await drain(batch.results(since=2))
+        assert [line["index"] for line in rest] == [1]
+        batches.shutdown()
+
+    asyncio.run(run())
+
+
+def test_following_a_stopped_batch_ends():
+    async def run():
+        batches = make_batches(FakeSite(), SessionStore(), lookahead=1)
+        batch = batches.create(["AP01X1", "AP01X2"], "client")
+        await settle()
+        following = asyncio.create_task(drain(batch.results(follow=True)))
+        await settle()
+        batch.stop()  # As when another worker has taken the lease over
+        assert await asyncio.wait_for(following, 1) == []
+
+    asyncio.run(run())
+
+
+def test_batch_resumes_from_the_store_after_a_restart(tmp_path):
+    store = SessionStore(backend="sqlite", path=str(tmp_path / "batches.sqlite3"), ttl=3600)
+
+    async def before_restart():
+        batches = make_batches(FakeSite(), store, lookahead=2)
+        batch = batches.create(["AP01X1", "AP01X2", "AP01X3"], "client")
+        await settle()
+        batch.solve(0, "RIGHT")
+        await settle()
+        batches.shutdown()
+        return batch.batch_id
+
+    batch_id = asyncio.run(before_restart())
+    site = FakeSite()
+
+    async def after_restart():
+        batches = make_batches(site, store, lookahead=2)
+        batch = batches.get(batch_id)
+        assert batch.finished == [0]
+        assert batch.items[0]["status"] == DONE
+        assert batch.items[0]["result"]["outcome"] == "no_challans"
+        await settle()
+        # Vehicles in flight at shutdown start over in new sessions
+        assert [item["status"] for item in batch.items] == [DONE, READY, READY]
+        assert len(site.opened) == 2
+        assert batches.stats()["resumed"] == 1
+        batches.shutdown()
+
+    asyncio.run(after_restart())
@@ -0,0 +1,96 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from aiohttp.test_utils import TestServer
+from lxml import html as lxml_html
+
+from benchmarks.challan_site import create_app as create_site
+from challan_parser import OUTCOME_CAPTCHA_ERROR, OUTCOME_NO_CHALLANS, OUTCOME_TABLE
+from http_lookup import HttpChallanSession, HttpLookupError, _parse_page
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def loaded_session() -> HttpChallanSession:
+    session = HttpChallanSession("https://example.test/publicview/")
+    session.base_url = "https://example.test/publicview/"
+    assert session._read_form(lxml_html.fromstring((FIXTURES / "captcha_error.html").read_text()))
+    return session
+
+
+def test_read_form_records_the_lookup_form():
+    session = loaded_session()
+    assert session.form_action == "https://example.test/publicview/search"
+    assert session.hidden_fields == {"token": "9d8c7b6a", "viewType": "tab1"}
+
+
+def test_other_forms_leave_the_form_state_alone():
+    session = loaded_session()
+    page = "<html><body><form action='/feedback'><input type='hidden' name='token' value='x'></form></body></html>"
+    assert not session._read_form(lxml_html.fromstring(page))
+    assert session.form_action == "https://example.test/publicview/search"
+    assert session.hidden_fields["token"] == "9d8c7b6a"
+
+
+def test_unparseable_page_is_a_lookup_error():
+    with pytest.raises(HttpLookupError):
+        _parse_page("<?xml version='1.0' encoding='utf-8'?>", "result page")
+
+
+async def lookup_site(rows: int = 3):
+    """The stand-in site on a local port, and a session pointed at it."""
+    server = TestServer(create_site(rows=rows))
+    await server.start_server()
+    return server, HttpChallanSession(str(server.make_url("/publicview/")))
+
+
+def captcha_text(server: TestServer) -> str:
+    (state,) = server.app["site"].sessions.values()
+    return state["captcha"]
+
+
+def test_lookup_against_the_site():
+    async def run():
+        server, session = await lookup_site(rows=3)
+        try:
+            image = await session.load_captcha()
+            assert image.startswith(b"\x89PNG")
+            assert session.hidden_fields["viewType"] == "tab1"
+            assert session.form_action == str(server.make_url("/publicview/search"))
+
+            wrong = await session.submit("TS09EA1234", "WRONG")
+            assert wrong["status"] == "error" and wrong["outcome"] == OUTCOME_CAPTCHA_ERROR
+
+            # The error page carries the form again, so a fresh captcha is enough to retry
+            assert (await session.refresh_captcha()).startswith(b"\x89PNG")
+            result = await session.submit("TS09EA1234", captcha_text(server))
+            assert result["status"] == "success" and result["outcome"] == OUTCOME_TABLE
+            assert result["data"]["vehicle_info"] == {"vehicle_number": "TS09EA1234", "owner_name": "TEST OWNER"}
+            assert len(result["data"]["challans"]) == 3
+            assert result["data"]["grand_total"]["user_charges"] == "105"
+        finally:
+            await session.close()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_refresh_keeps_the_site_session():
+    async def run():
+        server, session = await lookup_site(rows=0)
+        try:
+            await session.load_captcha()
+            cookies = session.cookies
+            await session.refresh_captcha()
+            # Same site session, and the refreshed captcha is the one it expects
+            assert session.cookies == cookies
+            assert len(server.app["site"].sessions) == 1
+            result = await session.submit("TS09EA1234", captcha_text(server))
+            assert result["outcome"] == OUTCOME_NO_CHALLANS
+            assert result["data"] == {"vehicle_info": {"vehicle_number": "TS09EA1234"}, "challans": []}
+        finally:
+            await session.close()
+            await server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,27 @@
+from resource_policy import DEFAULT_BLOCKED_URLS, ResourcePolicy
+
+
+class FakeDriver:
+    def __init__(self):
+        self.commands = []
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append((command, params))
+
+
+def test_defaults_leave_images_alone():
+    policy = ResourcePolicy()
+    assert not policy.allow("https://echallan.example/publicview/captcha.png?t=1")
+    assert policy.blocked_urls == list(DEFAULT_BLOCKED_URLS)
+
+
+def test_allowed_captcha_stays_unblocked_for_later_pages():
+    policy = ResourcePolicy(blocked_urls=["*.png*", "*.woff", "*/captcha/*"])
+    assert policy.allow("https://echallan.example/captcha/image.png?t=1")
+    assert policy.blocked_urls == ["*.woff"]
+    assert not policy.allow("https://echallan.example/captcha/image.png?t=2")
+
+    driver = FakeDriver()
+    policy.apply(driver)
+    assert driver.commands[-1] == ("Network.setBlockedURLs", {"urls": ["*.woff"]})
+    assert policy.stats()["allowed"] == 1
@@ -0,0 +1,58 @@
+import time
+
+from result_cache import ResultCache, normalize_vehicle_number
+
+RESULT = {"status": "success", "outcome": "no_challans", "data": {"challans": []}}
+
+
+def test_spacing_and_case_share_an_entry():
+    assert normalize_vehicle_number(" ts 09 ea-1234 ") == "TS09EA1234"
+    cache = ResultCache()
+    cache.set("ts09 ea 1234", RESULT)
+    cached = cache.get("TS09EA1234")
+    assert cached is not None and cached[0] == RESULT
+    assert cache.stats()["entries"] == 1
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ResultCache(ttl=0.05)
+    cache.set("TS09EA1234", RESULT)
+    assert cache.peek("TS09EA1234")
+    time.sleep(0.1)
+    assert not cache.peek("TS09EA1234")
+    assert cache.get("TS09EA1234") is None
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["misses"] == 1
+    assert stats["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.set("TS09EA0001", RESULT)
+    cache.set("TS09EA0002", RESULT)
+    cache.get("TS09EA0001")  # Now the most recently used
+    cache.set("TS09EA0003", RESULT)
+    assert cache.peek("TS09EA0001") and cache.peek("TS09EA0003")
+    assert not cache.peek("TS09EA0002")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_forced_refreshes_are_counted_apart_from_lookups():
+    cache = ResultCache()
+    cache.set("TS09EA1234", RESULT)
+    cache.record_bypass()
+    cache.get("TS09EA1234")
+    stats = cache.stats()
+    assert stats["bypassed"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 0
+    assert stats["hit_rate"] == 1.0
+
+
+def test_sqlite_cache_survives_a_reopen(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    ResultCache(backend="sqlite", path=path).set("TS09EA1234", RESULT)
+    reopened = ResultCache(backend="sqlite", path=path)
+    cached = reopened.get("ts09ea1234")
+    assert cached is not None
+    results, age = cached
+    assert results == RESULT and age >= 0
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import types
+
+from fastapi import HTTPException
+
+import app
+from session_events import SessionEvents, format_sse
+
+
+async def collect(events: SessionEvents, session_id: str, last_event_id: int = 0):
+    return [item async for item in events.subscribe(session_id, last_event_id) if item is not None]
+
+
+def test_reconnect_replays_what_came_after_last_event_id():
+    events = SessionEvents(history=3)
+
+    async def run():
+        events.open("s1")
+        for n in range(4):
+            events.publish("s1", "stage", {"n": n})
+        # The client had seen up to event 3 before its connection dropped
+        reconnected = asyncio.create_task(collect(events, "s1", last_event_id=3))
+        await asyncio.sleep(0)
+        events.close("s1")
+        return await asyncio.wait_for(reconnected, 1)
+
+    replayed = asyncio.run(run())
+    assert [(item.id, item.event) for item in replayed] == [(4, "stage"), (5, "closed")]
+    assert format_sse(replayed[0]) == 'id: 4\nevent: stage\ndata: {"n": 3}\n\n'
+    assert events.stats()["streams"] == 0
+
+
+def test_events_published_from_worker_threads_reach_subscribers():
+    events = SessionEvents()
+
+    async def run():
+        events.open("s1")
+        subscriber = asyncio.create_task(collect(events, "s1"))
+        await asyncio.sleep(0)
+
+        def step():
+            events.publish("s1", "page_loaded", {"stage": "navigation"})
+            events.close("s1")
+
+        thread = threading.Thread(target=step)
+        thread.start()
+        received = await asyncio.wait_for(subscriber, 1)
+        thread.join()
+        return received
+
+    received = asyncio.run(run())
+    assert [item.event for item in received] == ["page_loaded", "closed"]
+    assert received[0].data == {"stage": "navigation"}
+
+
+def test_close_ends_every_subscriber():
+    events = SessionEvents(keepalive=0.05)
+
+    async def run():
+        events.open("s1")
+        subscribers = [asyncio.create_task(collect(events, "s1")) for _ in range(2)]
+        await asyncio.sleep(0.1)  # Past a keepalive, still waiting
+        assert events.stats()["subscribers"] == 2
+        events.close("s1")
+        return await asyncio.wait_for(asyncio.gather(*subscribers), 1)
+
+    for received in asyncio.run(run()):
+        assert [item.event for item in received] == ["closed"]
+    # Nothing is kept for a closed session
+    events.publish("s1", "stage", {})
+    assert events.stats()["dropped"] == 1
+
+
+def test_respond_async_answers_202_then_publishes_the_outcome(monkeypatch):
+    monkeypatch.setattr(app, "SESSION_EVENTS", True)
+    monkeypatch.setattr(app, "session_events", SessionEvents())
+    request = types.SimpleNamespace(headers={"prefer": "respond-async"})
+
+    async def lookup():
+        return {"status": "success", "outcome": "no_challans"}
+
+    async def busy():
+        raise HTTPException(status_code=429, detail="Upstream is busy", headers={"Retry-After": "3"})
+
+    async def run():
+        app.session_events.open("s1")
+        subscriber = asyncio.create_task(collect(app.session_events, "s1"))
+        accepted = await app.respond(request, "s1", "submit-challan", lookup)
+        failed = await app.respond(request, "s1", "submit-challan", busy)
+        await asyncio.gather(*app._jobs)
+        app.session_events.close("s1")
+        return accepted, failed, await asyncio.wait_for(subscriber, 1)
+
+    accepted, failed, received = asyncio.run(run())
+    assert accepted.status_code == failed.status_code == 202
+    assert accepted.headers["Preference-Applied"] == "respond-async"
+    jobs = [json.loads(response.body)["job"] for response in (accepted, failed)]
+
+    by_job = {(item.data.get("job"), item.event): item.data for item in received}
+    assert by_job[jobs[0], "result"]["body"] == {"status": "success", "outcome": "no_challans"}
+    assert by_job[jobs[1], "failed"] == {
+        "job": jobs[1], "action": "submit-challan", "status_code": 429,
+        "detail": "Upstream is busy", "retry_after": "3",
+    }
+    assert (jobs[0], "accepted") in by_job and (jobs[1], "accepted") in by_job
+
+
+def test_respond_without_the_preference_answers_inline(monkeypatch):
+    monkeypatch.setattr(app, "session_events", SessionEvents())
+    request = types.SimpleNamespace(headers={})
+
+    async def lookup():
+        return {"status": "success"}
+
+    async def run():
+        app.session_events.open("s1")
+        return await app.respond(request, "s1", "submit-challan", lookup)
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert json.loads(response.body) == {"status": "success"}
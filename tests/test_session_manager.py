@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from session_manager import SessionLimitExceeded, SessionManager
+
+
+async def open_sessions(manager: SessionManager, count: int, fail: int = -1):
+    async def open_one(index: int) -> str:
+        try:
+            async with manager.admission():
+                await asyncio.sleep(0.01)  # Stands in for acquiring a browser
+                if index == fail:
+                    raise RuntimeError("browser failed to start")
+                manager.add(str(index), {})
+            return "ok"
+        except SessionLimitExceeded:
+            return "limit"
+        except RuntimeError:
+            return "failed"
+
+    return await asyncio.gather(*(open_one(index) for index in range(count)))
+
+
+def test_concurrent_admissions_respect_the_cap():
+    manager = SessionManager(on_expire=lambda session_id: None, max_sessions=3)
+    results = asyncio.run(open_sessions(manager, 10))
+    assert results.count("ok") == 3
+    assert len(manager.sessions) == 3
+    assert manager.stats()["opening"] == 0
+
+
+def test_failed_open_gives_its_slot_back():
+    manager = SessionManager(on_expire=lambda session_id: None, max_sessions=3)
+    results = asyncio.run(open_sessions(manager, 3, fail=0))
+    assert results == ["failed", "ok", "ok"]
+    assert asyncio.run(open_sessions(manager, 1)) == ["ok"]
+
+
+def test_pinned_sessions_are_not_reaped():
+    expired = []
+    manager = SessionManager(on_expire=expired.append, idle_ttl=0.01)
+    manager.add("batch", {})
+    manager.add("idle", {})
+    manager.pin("batch")
+    time.sleep(0.02)
+    assert manager.reap_expired() == 1
+    assert expired == ["idle"]
+    assert manager.stats()["pinned"] == 1
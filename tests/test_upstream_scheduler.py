@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from upstream_scheduler import UpstreamBusy, UpstreamScheduler
+
+
+async def hold(scheduler: UpstreamScheduler, client_id: str, order: list, release: asyncio.Event):
+    async with scheduler.slot(client_id):
+        order.append(client_id)
+        await release.wait()
+
+
+def test_freed_slots_go_to_clients_round_robin():
+    scheduler = UpstreamScheduler(max_concurrent=1)
+    order = []
+
+    async def run():
+        release = asyncio.Event()
+        release.set()
+        async with scheduler.slot("first"):
+            tasks = [asyncio.create_task(hold(scheduler, client, order, release))
+                     for client in ("burst", "burst", "burst", "single")]
+            await asyncio.sleep(0)
+            assert scheduler.queued == 4
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    # The single lookup goes second, not behind the whole burst
+    assert order == ["burst", "single", "burst", "burst"]
+    assert scheduler.in_flight == 0 and scheduler.queued == 0
+
+
+def test_full_queues_are_refused_with_retry_after():
+    scheduler = UpstreamScheduler(max_concurrent=1, max_queue=2, max_queue_per_client=1)
+
+    async def run():
+        release = asyncio.Event()
+        order = []
+        async with scheduler.slot("holder"):
+            tasks = [asyncio.create_task(hold(scheduler, "a", order, release))]
+            await asyncio.sleep(0)
+
+            with pytest.raises(UpstreamBusy) as client_full:
+                await scheduler._acquire("a")
+            assert client_full.value.reason == "client_queue_full"
+            # Default 2s hold, one waiting plus this one, one slot
+            assert client_full.value.retry_after == 4
+
+            tasks.append(asyncio.create_task(hold(scheduler, "b", order, release)))
+            await asyncio.sleep(0)
+            with pytest.raises(UpstreamBusy) as queue_full:
+                await scheduler._acquire("c")
+            assert queue_full.value.reason == "queue_full"
+            assert queue_full.value.retry_after == 6
+            release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert stats["rejected_client_queue_full"] == 1
+    assert stats["rejected_queue_full"] == 1
+    assert scheduler.in_flight == 0
+
+
+def test_waiting_past_the_queue_timeout_gives_up():
+    scheduler = UpstreamScheduler(max_concurrent=1, queue_timeout=0.05)
+
+    async def run():
+        async with scheduler.slot("holder"):
+            with pytest.raises(UpstreamBusy) as timed_out:
+                async with scheduler.slot("late"):
+                    pass
+            assert timed_out.value.reason == "timeout"
+            assert scheduler.queued == 0
+
+    asyncio.run(run())
+    assert scheduler.stats()["timed_out"] == 1
+    assert scheduler.in_flight == 0
+
+
+def test_slot_handed_over_as_the_waiter_times_out_is_not_leaked(monkeypatch):
+    scheduler = UpstreamScheduler(max_concurrent=1, queue_timeout=5)
+
+    async def handed_over_then_timed_out(future, timeout):
+        # The holder finishes and hands its slot to this waiter in the same step the wait expires
+        scheduler._release()
+        assert future.done()
+        raise asyncio.TimeoutError
+
+    async def run():
+        await scheduler._acquire("holder")
+        monkeypatch.setattr(asyncio, "wait_for", handed_over_then_timed_out)
+        with pytest.raises(UpstreamBusy):
+            await scheduler._acquire("waiter")
+
+    asyncio.run(run())
+    assert scheduler.in_flight == 0
+    assert scheduler.queued == 0
@@ -0,0 +1,161 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+
+class UpstreamBusy(RuntimeError):
+    """Raised when a request can't get an upstream slot; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class UpstreamScheduler:
+    """Limits concurrent requests to the challan site and queues the rest fairly.
+
+    At most `max_concurrent` page loads and submissions are in flight. Others
+    wait in one FIFO per client, and freed slots go to the clients round-robin,
+    so a client with a burst of sessions can't starve one with a single lookup.
+    The queue is bounded in total and per client, and a request that would
+    overflow it, or that waits longer than `queue_timeout`, raises UpstreamBusy
+    instead of piling up.
+
+    Runs on the event loop; it is not thread-safe.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 50, max_queue_per_client: int = 10,
+                 queue_timeout: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+
+        self._in_flight = 0
+        # client -> waiting futures; order is the round-robin order of clients
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = 2.0
+        self._stats = {
+            "requests": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_client_queue_full": 0,
+            "timed_out": 0,
+            "waits": 0,
+            "queue_time_total": 0.0,
+            "queue_time_max": 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    @asynccontextmanager
+    async def slot(self, client_id: str):
+        """Holds an upstream slot for the block; yields the seconds spent queueing."""
+        if not self.enabled:
+            yield 0.0
+            return
+        waited = await self._acquire(client_id)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._hold_seconds += 0.2 * (time.monotonic() - started - self._hold_seconds)
+            self._release()
+
+    async def _acquire(self, client_id: str) -> float:
+        self._stats["requests"] += 1
+        if self._in_flight < self.max_concurrent and not self._queued:
+            self._in_flight += 1
+            return 0.0
+
+        if self.max_queue and self._queued >= self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            raise UpstreamBusy(f"Upstream queue is full ({self._queued} waiting).",
+                               self.retry_after(), "queue_full")
+        waiting = self._waiting.get(client_id)
+        if self.max_queue_per_client and waiting and len(waiting) >= self.max_queue_per_client:
+            self._stats["rejected_client_queue_full"] += 1
+            raise UpstreamBusy(f"Too many queued requests for this client ({len(waiting)} waiting).",
+                               self.retry_after(), "client_queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(client_id, deque()).append(future)
+        self._queued += 1
+        self._stats["queued"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout or None)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                self._release()  # The slot was handed over just as the caller gave up
+            else:
+                self._forget(client_id, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats["timed_out"] += 1
+                raise UpstreamBusy(f"No upstream slot within {self.queue_timeout:.0f}s.",
+                                   self.retry_after(), "timeout") from None
+            raise
+        waited = time.monotonic() - started
+        self._stats["waits"] += 1
+        self._stats["queue_time_total"] += waited
+        self._stats["queue_time_max"] = max(self._stats["queue_time_max"], waited)
+        return waited
+
+    def _forget(self, client_id: str, future: asyncio.Future):
+        waiting = self._waiting.get(client_id)
+        if waiting is not None and future in waiting:
+            waiting.remove(future)
+            self._queued -= 1
+            if not waiting:
+                del self._waiting[client_id]
+
+    def _release(self):
+        """Frees a slot and hands it to the next client in round-robin order."""
+        self._in_flight -= 1
+        while self._waiting and self._in_flight < self.max_concurrent:
+            client_id, waiting = next(iter(self._waiting.items()))
+            future = waiting.popleft()
+            self._queued -= 1
+            if waiting:
+                self._waiting.move_to_end(client_id)
+            else:
+                del self._waiting[client_id]
+            if not future.done():
+                self._in_flight += 1
+                future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained, bounded to [1, 60]."""
+        slots = max(self.max_concurrent, 1)
+        return int(max(1, min(math.ceil(self._hold_seconds * (self._queued + 1) / slots), 60)))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        waits = stats["waits"]
+        stats.update({
+            "in_flight": self._in_flight,
+            "waiting": self._queued,
+            "waiting_clients": len(self._waiting),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_queue_per_client": self.max_queue_per_client,
+            "queue_time_avg": stats["queue_time_total"] / waits if waits else 0.0,
+            "slot_hold_avg": round(self._hold_seconds, 3),
+        })
+        return stats